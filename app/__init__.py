@@ -4,9 +4,10 @@ from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
 from config import config
+from app.routing import RoutingSession
 
 # Khởi tạo các extension
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 migrate = Migrate()
 csrf = CSRFProtect()
@@ -16,10 +17,12 @@ login_manager.login_message = 'Vui lòng đăng nhập để truy cập trang n
 login_manager.login_message_category = 'warning'
 
 
-def create_app(config_name='default'):
+def create_app(config_name='default', config_overrides=None):
     """App Factory Pattern - Tạo và cấu hình ứng dụng Flask"""
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    if config_overrides:
+        app.config.update(config_overrides)
     
     # Khởi tạo extensions với app
     db.init_app(app)
@@ -40,6 +43,66 @@ def create_app(config_name='default'):
     app.register_blueprint(lecturer_bp, url_prefix='/lecturer')
     app.register_blueprint(student_bp, url_prefix='/student')
     
+    # PRAGMA cho SQLite (WAL, busy_timeout, ...) và bảo trì định kỳ
+    from app.sqlite import register_sqlite
+    register_sqlite(app)
+    
+    # Định tuyến đọc sang bản sao chỉ đọc (chỉ khi có DATABASE_READ_URL)
+    from app.routing import register_routing
+    register_routing(app)
+    
+    # Cập nhật bảng tổng hợp học tập sau mỗi lần ghi điểm
+    from app.academic import register_summary_events
+    register_summary_events()
+    
+    # Đồng bộ chỉ mục tìm kiếm toàn văn
+    from app.search import register_search_events
+    register_search_events()
+    
+    # Nạp quan hệ theo hồ sơ khai báo ở từng route
+    from app.loading import register_loading_events
+    register_loading_events()
+    
+    # Phiên bản dữ liệu danh mục cho bộ đệm dropdown
+    from app.refdata import register_refdata_events
+    register_refdata_events()
+    
+    # Chỉ mục thời khóa biểu theo học kỳ để phát hiện trùng lịch
+    from app.timetable import register_timetable_events
+    register_timetable_events()
+    
+    # Danh tính người đăng nhập lưu đệm cho Flask-Login
+    from app.identity import register_identity_events
+    register_identity_events()
+    
+    # Kho file theo nội dung: đếm tham chiếu blob theo thay đổi Material
+    from app.storage import register_storage_events
+    register_storage_events()
+    
+    # Bản dẫn xuất tài liệu (số trang, văn bản, ảnh thu nhỏ) tạo nền sau khi upload
+    from app.derivatives import register_derivatives
+    register_derivatives()
+    
+    # Tác vụ nền: hàng đợi jobs và worker nhúng
+    from app.jobs import register_jobs
+    register_jobs(app)
+    
+    # Bộ đếm ghi trễ (lượt tải tài liệu)
+    from app.counters import register_counters
+    register_counters(app)
+    
+    # Đo đạc truy vấn SQL theo request (chỉ khi SQL_INSTRUMENTATION bật)
+    from app.instrumentation import register_instrumentation
+    register_instrumentation(app)
+    
+    # Profiler theo yêu cầu (/admin/_profile)
+    from app.profiler import register_profiler
+    register_profiler(app)
+    
+    # Lệnh CLI
+    from app.commands import register_commands
+    register_commands(app)
+    
     # Tạo thư mục upload nếu chưa tồn tại
     import os
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
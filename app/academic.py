@@ -0,0 +1,192 @@
+"""
+Bảng tổng hợp kết quả học tập (GPA, tín chỉ đã học, tín chỉ tích lũy)
+Được cập nhật tăng dần sau mỗi lần flush làm thay đổi điểm hoặc số tín chỉ môn học:
+chỉ những sinh viên bị ảnh hưởng mới được tính lại, bằng một truy vấn gộp.
+"""
+
+from datetime import datetime
+from sqlalchemy import event
+from app import db
+from app.models import Student, Subject, Grade, AcademicSummary, SemesterSummary
+
+# Giới hạn số tham số trong mệnh đề IN của SQLite
+CHUNK_SIZE = 500
+
+# Các cột của Grade làm thay đổi kết quả tổng hợp
+GRADE_TRACKED_ATTRS = ('student_id', 'subject_id', 'semester', 'score_total')
+
+
+# ==================== TÍNH TOÁN ====================
+def _chunks(ids):
+    ids = sorted(ids)
+    for i in range(0, len(ids), CHUNK_SIZE):
+        yield ids[i:i + CHUNK_SIZE]
+
+
+def _gpa(weighted_sum, attempted_credits):
+    """Cùng công thức với Student.calculate_gpa"""
+    return round(weighted_sum / attempted_credits, 2) if attempted_credits > 0 else 0
+
+
+def _aggregate(connection, student_ids=None, by_semester=False):
+    """Tổng hợp điểm theo sinh viên (và học kỳ) - trả về danh sách dict sẵn sàng để insert"""
+    semester = db.func.coalesce(Grade.semester, '').label('semester')
+    keys = [Grade.student_id] + ([semester] if by_semester else [])
+    stmt = (
+        db.select(
+            *keys,
+            db.func.sum(Grade.score_total * Subject.credits),
+            db.func.sum(Subject.credits),
+            db.func.sum(db.case((Grade.score_total >= Grade.PASS_SCORE, Subject.credits), else_=0))
+        )
+        .join(Subject, Subject.id == Grade.subject_id)
+        .where(Grade.score_total.isnot(None))
+        .group_by(*keys)
+    )
+    if student_ids is not None:
+        stmt = stmt.where(Grade.student_id.in_(student_ids))
+
+    now = datetime.utcnow()
+    rows = []
+    for row in connection.execute(stmt):
+        weighted_sum, attempted, passed = row[-3:]
+        record = {
+            'student_id': row[0],
+            'weighted_sum': weighted_sum or 0,
+            'attempted_credits': attempted or 0,
+            'passed_credits': passed or 0,
+            'gpa': _gpa(weighted_sum or 0, attempted or 0),
+            'updated_at': now
+        }
+        if by_semester:
+            record['semester'] = row[1]
+        rows.append(record)
+    return rows
+
+
+def refresh_summaries(student_ids, connection=None):
+    """Tính lại bảng tổng hợp cho các sinh viên chỉ định"""
+    connection = connection if connection is not None else db.session.connection()
+    for chunk in _chunks(set(student_ids)):
+        for model, by_semester in ((AcademicSummary, False), (SemesterSummary, True)):
+            connection.execute(db.delete(model.__table__).where(model.student_id.in_(chunk)))
+            rows = _aggregate(connection, chunk, by_semester)
+            if rows:
+                connection.execute(db.insert(model.__table__), rows)
+
+
+def delete_summaries(student_ids, connection=None):
+    """Xóa bảng tổng hợp của các sinh viên đã bị xóa"""
+    connection = connection if connection is not None else db.session.connection()
+    for chunk in _chunks(set(student_ids)):
+        for model in (AcademicSummary, SemesterSummary):
+            connection.execute(db.delete(model.__table__).where(model.student_id.in_(chunk)))
+
+
+def rebuild_summaries():
+    """Tính lại toàn bộ bảng tổng hợp từ đầu - trả về số sinh viên có dữ liệu"""
+    connection = db.session.connection()
+    count = 0
+    for model, by_semester in ((AcademicSummary, False), (SemesterSummary, True)):
+        connection.execute(db.delete(model.__table__))
+        rows = _aggregate(connection, by_semester=by_semester)
+        for i in range(0, len(rows), CHUNK_SIZE):
+            connection.execute(db.insert(model.__table__), rows[i:i + CHUNK_SIZE])
+        if not by_semester:
+            count = len(rows)
+    db.session.commit()
+    return count
+
+
+def verify_summaries():
+    """So sánh bảng tổng hợp với cách tính trực tiếp - trả về danh sách sai lệch"""
+    summaries = {s.student_id: s for s in AcademicSummary.query.all()}
+    mismatches = []
+    for student in Student.query.all():
+        live_gpa = student.calculate_gpa()
+        live_credits = sum(
+            g.subject.credits for g in student.grades
+            if g.subject and g.score_total is not None and g.score_total >= Grade.PASS_SCORE
+        )
+        summary = summaries.get(student.id)
+        stored_gpa = summary.gpa if summary else 0
+        stored_credits = summary.passed_credits if summary else 0
+        if abs(stored_gpa - live_gpa) > 0.01 or stored_credits != live_credits:
+            mismatches.append({
+                'student_code': student.student_code,
+                'stored': (stored_gpa, stored_credits),
+                'live': (live_gpa, live_credits)
+            })
+    return mismatches
+
+
+# ==================== ĐỌC ====================
+def get_summary(student):
+    """Lấy tổng hợp toàn khóa của sinh viên (tính trực tiếp nếu chưa có bản ghi)"""
+    summary = AcademicSummary.query.filter_by(student_id=student.id).first()
+    if summary is not None:
+        return summary
+    rows = _aggregate(db.session.connection(), [student.id])
+    return AcademicSummary(**rows[0]) if rows else AcademicSummary(
+        student_id=student.id, weighted_sum=0, attempted_credits=0, passed_credits=0, gpa=0
+    )
+
+
+def get_semester_summaries(student):
+    """Tổng hợp theo học kỳ dạng {semester: SemesterSummary}"""
+    summaries = SemesterSummary.query.filter_by(student_id=student.id).all()
+    if not summaries:
+        summaries = [SemesterSummary(**row) for row in
+                     _aggregate(db.session.connection(), [student.id], by_semester=True)]
+    return {s.semester: s for s in summaries}
+
+
+# ==================== SỰ KIỆN ORM ====================
+def _has_changes(obj, attrs):
+    state = db.inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+def _after_flush(session, flush_context):
+    """Thu thập sinh viên bị ảnh hưởng trong lần flush và tính lại tổng hợp của họ"""
+    student_ids = set()
+    subject_ids = set()
+    deleted_student_ids = set()
+
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Grade):
+            student_ids.add(obj.student_id)
+        elif isinstance(obj, Subject) and obj in session.deleted:
+            subject_ids.add(obj.id)
+        elif isinstance(obj, Student) and obj in session.deleted:
+            deleted_student_ids.add(obj.id)
+
+    for obj in session.dirty:
+        if isinstance(obj, Grade) and _has_changes(obj, GRADE_TRACKED_ATTRS):
+            history = db.inspect(obj).attrs.student_id.history
+            student_ids.update(history.added or [obj.student_id])
+            student_ids.update(history.deleted or [])
+        elif isinstance(obj, Subject) and _has_changes(obj, ('credits',)):
+            subject_ids.add(obj.id)
+
+    if not (student_ids or subject_ids or deleted_student_ids):
+        return
+
+    connection = session.connection()
+    for chunk in _chunks(subject_ids):
+        student_ids.update(connection.execute(
+            db.select(Grade.student_id).where(Grade.subject_id.in_(chunk)).distinct()
+        ).scalars())
+
+    student_ids.discard(None)
+    student_ids -= deleted_student_ids
+    if student_ids:
+        refresh_summaries(student_ids, connection)
+    if deleted_student_ids:
+        delete_summaries(deleted_student_ids, connection)
+
+
+def register_summary_events():
+    """Đăng ký cập nhật bảng tổng hợp sau mỗi lần flush"""
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
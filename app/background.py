@@ -0,0 +1,18 @@
+"""
+Luồng nền theo tiến trình (worker tác vụ nền, bảo trì SQLite, gom bộ đếm)
+Luồng không bật khi tạo app: lệnh CLI không cần, và luồng không sống sót qua fork của máy chủ
+dạng pre-fork. Mỗi tiến trình bật luồng của mình ở request đầu tiên nó nhận.
+"""
+
+
+def start_per_process(app, current, start):
+    """Gọi start() ở request đầu tiên của mỗi tiến trình nếu luồng current() chưa chạy
+
+    current: hàm trả về luồng đang giữ (hoặc None); start: hàm bật luồng (tự kiểm tra trùng dưới khóa)
+    """
+    @app.before_request
+    def _ensure_thread():
+        thread = current()
+        # Tiến trình con sau fork thừa hưởng đối tượng luồng nhưng luồng không chạy
+        if thread is None or not thread.is_alive():
+            start()
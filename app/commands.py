@@ -0,0 +1,345 @@
+"""
+Lệnh CLI của ứng dụng
+Chạy: flask --app run <nhóm lệnh> <lệnh>
+"""
+
+import click
+from flask.cli import AppGroup
+
+academic_cli = AppGroup('academic', help='Quản lý bảng tổng hợp kết quả học tập')
+search_cli = AppGroup('search', help='Quản lý chỉ mục tìm kiếm toàn văn')
+accounts_cli = AppGroup('accounts', help='Quản lý tài khoản')
+sqlite_cli = AppGroup('sqlite', help='Cấu hình và bảo trì database SQLite')
+replica_cli = AppGroup('replica', help='Bản sao chỉ đọc (DATABASE_READ_URL)')
+counters_cli = AppGroup('counters', help='Bộ đếm ghi trễ (lượt tải tài liệu)')
+storage_cli = AppGroup('storage', help='Kho file upload theo nội dung')
+derivatives_cli = AppGroup('derivatives', help='Bản dẫn xuất tài liệu (số trang, văn bản, ảnh thu nhỏ)')
+jobs_cli = AppGroup('jobs', help='Hàng đợi tác vụ nền')
+schedules_cli = AppGroup('schedules', help='Thời khóa biểu')
+
+
+@academic_cli.command('rebuild')
+@click.option('--check/--no-check', default=True, help='Đối chiếu với cách tính trực tiếp sau khi dựng lại')
+def rebuild_academic_summaries(check):
+    """Tính lại toàn bộ GPA và tín chỉ tích lũy từ bảng điểm"""
+    from app.academic import rebuild_summaries, verify_summaries
+    
+    count = rebuild_summaries()
+    click.echo(f'Đã tính lại tổng hợp cho {count} sinh viên.')
+    
+    if check:
+        mismatches = verify_summaries()
+        for m in mismatches:
+            click.echo(f"  Sai lệch {m['student_code']}: lưu {m['stored']} - thực tế {m['live']}")
+        if mismatches:
+            raise click.ClickException(f'{len(mismatches)} sinh viên có số liệu không khớp.')
+        click.echo('Đối chiếu khớp với cách tính trực tiếp.')
+
+
+@search_cli.command('rebuild')
+def rebuild_search_index():
+    """Dựng lại chỉ mục FTS5 cho sinh viên và giảng viên"""
+    from app.search import rebuild_search_index as rebuild
+    
+    for table, count in rebuild().items():
+        click.echo(f'{table}: {count} bản ghi')
+
+
+@accounts_cli.command('import')
+@click.argument('kind', type=click.Choice(['student', 'lecturer']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--skip-invalid', is_flag=True, help='Bỏ qua dòng lỗi, vẫn nhập các dòng hợp lệ')
+@click.option('--workers', type=int, default=None, help='Số tiến trình băm mật khẩu (mặc định: số lõi CPU)')
+def import_accounts(kind, path, skip_invalid, workers):
+    """Nhập hàng loạt sinh viên / giảng viên từ file CSV hoặc XLSX"""
+    from app.importer import read_rows, import_accounts as run_import
+    
+    with open(path, 'rb') as f:
+        try:
+            rows = read_rows(f, path)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    
+    labels = {'validate': 'Kiểm tra', 'hash': 'Băm mật khẩu', 'insert': 'Ghi database'}
+    bars = {}
+    
+    def progress(stage, done, total):
+        if stage not in bars:
+            for bar in bars.values():
+                bar.render_finish()
+            bars[stage] = click.progressbar(length=total, label=labels[stage])
+        bar = bars[stage]
+        bar.update(done - bar.pos)
+    
+    report = run_import(kind, rows, skip_invalid=skip_invalid, workers=workers, progress=progress)
+    for bar in bars.values():
+        bar.render_finish()
+    
+    for error in report.errors:
+        click.echo(f'  Dòng {error.row} [{error.field}]: {error.message}')
+    click.echo(f'Đã tạo {report.created}/{report.total} tài khoản, bỏ qua {report.skipped}.')
+    if report.errors and not skip_invalid:
+        raise click.ClickException(f'{len(report.errors)} lỗi - không ghi dòng nào (dùng --skip-invalid để bỏ qua).')
+
+
+@accounts_cli.command('hash-benchmark')
+@click.option('--algorithm', type=click.Choice(['scrypt', 'pbkdf2']), default=None,
+              help='Thuật toán (mặc định: theo cấu hình)')
+@click.option('--cost', 'costs', type=int, multiple=True,
+              help='Độ khó cần đo, lặp lại để so sánh nhiều mức (mặc định: theo cấu hình)')
+@click.option('--seconds', type=float, default=2.0, help='Thời gian đo mỗi mức')
+@click.option('--workers', type=int, default=None, help='Số tiến trình đo song song (mặc định: số lõi CPU)')
+def hash_benchmark(algorithm, costs, seconds, workers):
+    """Đo số hash mật khẩu mỗi giây trên một lõi và toàn máy theo từng độ khó"""
+    from app.passwords import hash_method, benchmark
+    
+    current = hash_method()
+    methods = [hash_method(algorithm or current.split(':')[0], cost) for cost in costs] or [
+        hash_method(algorithm) if algorithm else current
+    ]
+    click.echo(f'Chính sách hiện tại: {current}')
+    for method in methods:
+        result = benchmark(method, seconds, workers)
+        marker = ' (hiện tại)' if method == current else ''
+        click.echo(f"{method}{marker}: {result['ms_per_hash']:.1f} ms/hash, "
+                   f"{result['per_core']:.1f} hash/s mỗi lõi, "
+                   f"{result['total']:.1f} hash/s với {result['workers']} tiến trình "
+                   f"(~{result['total'] * 60:.0f} lượt đăng nhập/phút)")
+
+
+@sqlite_cli.command('pragmas')
+def show_pragmas():
+    """In giá trị PRAGMA thực tế của một kết nối trong pool"""
+    from app.sqlite import current_pragmas
+    
+    for name, value in current_pragmas().items():
+        click.echo(f'{name} = {value}')
+
+
+@sqlite_cli.command('maintenance')
+def sqlite_maintenance():
+    """Checkpoint WAL và PRAGMA optimize (dùng cho cron khi tắt luồng bảo trì)"""
+    from app import db
+    from app.sqlite import is_sqlite, run_maintenance
+    
+    if not is_sqlite(db.engine):
+        raise click.ClickException('Database hiện tại không phải SQLite.')
+    result = run_maintenance(db.engine)
+    click.echo(f"Checkpoint {result['checkpointed']}/{result['wal_frames']} frame"
+               f"{' (chưa xong: đang có giao dịch đọc)' if result['busy'] else ''}, đã chạy PRAGMA optimize.")
+
+
+@replica_cli.command('refresh')
+def refresh_replica():
+    """Chụp lại snapshot SQLite làm bản sao chỉ đọc"""
+    from datetime import datetime
+    from app import db
+    from app.routing import REPLICA_BIND, is_snapshot_replica, refresh_snapshot
+    
+    replica = db.engines.get(REPLICA_BIND)
+    if replica is None or not is_snapshot_replica(db.engine, replica):
+        raise click.ClickException('Không có bản sao snapshot SQLite (DATABASE_READ_URL).')
+    started = refresh_snapshot(db.engine, replica)
+    click.echo(f'Đã chụp snapshot {replica.url.database} lúc {datetime.fromtimestamp(started):%H:%M:%S}.')
+
+
+@counters_cli.command('pending')
+def show_pending_counters():
+    """In các lượt tăng chưa ghi vào database"""
+    from app.counters import get_buffer
+    
+    pending = get_buffer().pending()
+    for (name, key), amount in sorted(pending.items()):
+        click.echo(f'{name} #{key}: +{amount}')
+    click.echo(f'{sum(pending.values())} lượt đang chờ.')
+
+
+@counters_cli.command('flush')
+def flush_counters():
+    """Ghi ngay các lượt tăng đang chờ (kể cả lô bỏ dở của worker đã dừng)"""
+    from app.counters import flush_counters as flush
+    
+    applied = flush()
+    click.echo(f'Đã ghi {sum(applied.values())} lượt cho {len(applied)} bản ghi.')
+
+
+@storage_cli.command('migrate')
+def migrate_storage():
+    """Chuyển file tài liệu theo đường dẫn cũ (uploads/materials) vào kho theo nội dung"""
+    from app.storage import migrate_legacy_files
+    
+    result = migrate_legacy_files()
+    click.echo(f"Đã chuyển {result['moved']} tài liệu, xóa {result['removed']} file cũ.")
+    if result['missing']:
+        click.echo(f"{result['missing']} tài liệu không tìm thấy file - giữ nguyên đường dẫn.")
+
+
+@storage_cli.command('gc')
+@click.option('--grace', type=int, default=None, help='Chỉ xóa blob mồ côi / file tạm cũ hơn (giây)')
+def storage_gc(grace):
+    """Đếm lại tham chiếu và dọn blob không còn tài liệu nào dùng"""
+    from app.storage import GC_GRACE, collect_garbage
+    
+    result = collect_garbage(GC_GRACE if grace is None else grace)
+    click.echo(f"Đếm lại {result['recounted']} blob, xóa {result['released']} blob hết tham chiếu, "
+               f"{result['orphans']} blob / bản dẫn xuất mồ côi, {result['temp_files']} file tạm.")
+
+
+@storage_cli.command('expire-uploads')
+def expire_uploads():
+    """Xóa phiên upload theo phần đã hết hạn và file đang ghép của chúng"""
+    from app.uploads import expire_sessions
+    
+    click.echo(f'Đã xóa {expire_sessions()} phiên upload hết hạn.')
+
+
+@derivatives_cli.command('status')
+def derivatives_status():
+    """Số bản dẫn xuất theo trạng thái"""
+    from app.derivatives import queue_status
+    
+    for status, count in queue_status().items():
+        click.echo(f'{status}: {count}')
+
+
+@derivatives_cli.command('enqueue')
+def enqueue_derivatives():
+    """Tạo việc cho tài liệu chưa có bản dẫn xuất (tài liệu upload trước đây, việc bị hủy)"""
+    from app.derivatives import enqueue_missing
+    
+    click.echo(f'Đã tạo {enqueue_missing()} việc.')
+
+
+@derivatives_cli.command('retry')
+@click.option('--unsupported', is_flag=True, help='Chạy lại cả việc không hỗ trợ (VD sau khi cài pypdf)')
+def retry_derivatives(unsupported):
+    """Đưa việc lỗi về hàng đợi"""
+    from app.derivatives import retry
+    
+    count = retry(('failed', 'unsupported') if unsupported else ('failed',))
+    click.echo(f'Đã đưa {count} việc về hàng đợi.')
+
+
+@jobs_cli.command('worker')
+@click.option('--threads', type=int, default=None, help='Số việc chạy song song trong luồng (mặc định 1)')
+@click.option('--processes', type=int, default=None, help='Chạy việc trong N tiến trình con thay vì luồng')
+@click.option('--until-idle', is_flag=True, help='Thoát khi hết việc đến hạn (VD chạy từ cron)')
+def run_job_worker(threads, processes, until_idle):
+    """Worker riêng nhận và chạy tác vụ nền (dùng khi JOB_EMBEDDED_WORKERS = 0)"""
+    import signal
+    from flask import current_app
+    from app import db
+    from app.jobs import Worker
+    
+    if threads and processes:
+        raise click.UsageError('Chỉ chọn một trong --threads hoặc --processes.')
+    worker = Worker(current_app._get_current_object(), db.engine,
+                    concurrency=processes or threads or 1, processes=bool(processes))
+    # SIGTERM: dừng nhận việc, đợi việc đang chạy xong rồi thoát
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    click.echo(f'Worker {worker.id}: {worker.concurrency} {"tiến trình" if processes else "luồng"}')
+    try:
+        counts = worker.run(until_idle=until_idle)
+    except KeyboardInterrupt:
+        worker.stop()
+        counts = worker.run(until_idle=True)
+    click.echo(', '.join(f'{status}: {count}' for status, count in sorted(counts.items())) or 'Không có việc.')
+
+
+@jobs_cli.command('status')
+def jobs_status():
+    """Số tác vụ theo trạng thái"""
+    from app.jobs import queue_status
+    
+    for status, count in queue_status().items():
+        click.echo(f'{status}: {count}')
+
+
+@jobs_cli.command('enqueue')
+@click.argument('name')
+@click.option('--priority', type=int, default=0, help='Số lớn chạy trước')
+def enqueue_job(name, priority):
+    """Đưa tác vụ bảo trì không tham số vào hàng đợi (VD storage.gc)"""
+    from app import db
+    from app.jobs import TASKS, enqueue
+    
+    if name not in TASKS:
+        raise click.BadParameter(f"không có tác vụ '{name}' ({', '.join(sorted(TASKS))})", param_hint='NAME')
+    job = enqueue(name, priority=priority)
+    db.session.commit()
+    click.echo(f'Đã tạo tác vụ #{job.id}.')
+
+
+@jobs_cli.command('cancel')
+@click.argument('job_id', type=int)
+def cancel_job(job_id):
+    """Hủy tác vụ đang chờ / đang chạy"""
+    from app.jobs import cancel
+    
+    if not cancel(job_id):
+        raise click.ClickException(f'Tác vụ #{job_id} không tồn tại hoặc đã kết thúc.')
+    click.echo(f'Đã hủy tác vụ #{job_id}.')
+
+
+@jobs_cli.command('retry')
+@click.argument('job_id', type=int)
+def retry_job(job_id):
+    """Chạy lại tác vụ lỗi / đã hủy"""
+    from app.jobs import retry
+    
+    if not retry(job_id):
+        raise click.ClickException(f'Tác vụ #{job_id} không ở trạng thái lỗi / đã hủy.')
+    click.echo(f'Đã đưa tác vụ #{job_id} vào hàng đợi lại.')
+
+
+@jobs_cli.command('purge')
+@click.option('--days', type=int, default=None, help='Xóa tác vụ đã kết thúc cũ hơn (mặc định: JOB_RETENTION_DAYS)')
+def purge_jobs(days):
+    """Xóa tác vụ đã kết thúc cùng file kết quả"""
+    from flask import current_app
+    from app.jobs import purge
+    
+    days = current_app.config['JOB_RETENTION_DAYS'] if days is None else days
+    click.echo(f'Đã xóa {purge(days)} tác vụ.')
+
+
+@schedules_cli.command('check')
+@click.option('--semester', 'semesters', multiple=True, help='Học kỳ cần kiểm tra (mặc định: mọi học kỳ)')
+def check_schedules(semesters):
+    """Liệt kê mọi cặp buổi học trùng phòng / giảng viên / lớp"""
+    from app.models import Schedule
+    from app.timetable import RESOURCES, check_semester, schedule_details, semesters as all_semesters
+    
+    total = 0
+    for semester in semesters or all_semesters():
+        clashes = check_semester(semester)
+        click.echo(f'{semester}: {len(clashes)} cặp trùng')
+        if not clashes:
+            continue
+        total += len(clashes)
+        details = schedule_details(Schedule.semester == semester)
+        
+        def describe(slot):
+            subject, classroom, lecturer, room, _, start, end = details[slot.id]
+            return f"#{slot.id} {subject} ({classroom}, {lecturer}, {room}) {start:%H:%M}-{end:%H:%M}"
+        
+        for clash in clashes:
+            resources = ', '.join(RESOURCES[resource][0].lower() for resource in clash.resources)
+            click.echo(f'  {Schedule.DAY_NAMES[clash.day_of_week]} - trùng {resources}: '
+                       f'{describe(clash.first)} <> {describe(clash.second)}')
+    if total:
+        raise click.ClickException(f'{total} cặp buổi học bị trùng lịch.')
+
+
+def register_commands(app):
+    """Đăng ký các nhóm lệnh CLI vào app"""
+    app.cli.add_command(academic_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(accounts_cli)
+    app.cli.add_command(sqlite_cli)
+    app.cli.add_command(replica_cli)
+    app.cli.add_command(counters_cli)
+    app.cli.add_command(storage_cli)
+    app.cli.add_command(derivatives_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(schedules_cli)
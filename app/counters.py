@@ -0,0 +1,305 @@
+"""
+Bộ đếm ghi trễ (write-behind) cho các cột đếm như materials.download_count
+Request chỉ ghi nhận lượt tăng, không mở giao dịch ghi: mỗi lượt được nối (O_APPEND) vào file
+nhật ký dùng chung giữa các tiến trình trong COUNTER_JOURNAL_DIR. Luồng nền của mỗi tiến trình
+gom nhật ký sau mỗi COUNTER_FLUSH_INTERVAL giây (hoặc sớm hơn khi đủ COUNTER_FLUSH_THRESHOLD
+lượt) và ghi bằng một giao dịch `UPDATE ... SET cột = cột + ?`.
+
+Nhật ký được đổi tên thành file lô trước khi gom; tên lô được ghi vào bảng counter_batches
+trong cùng giao dịch nên một lô chỉ được cộng đúng một lần, kể cả khi tiến trình chết giữa
+chừng hoặc nhiều tiến trình cùng gom. Lượt tăng chưa gom nằm trên đĩa nên không mất khi
+worker khởi động lại. Không cấu hình COUNTER_JOURNAL_DIR: lượt tăng giữ trong bộ nhớ tiến
+trình và được ghi khi gom hoặc khi tiến trình thoát.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from weakref import WeakKeyDictionary
+from sqlalchemy import bindparam, delete, event, insert, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.background import start_per_process
+from app.models import Material, CounterBatch
+
+logger = logging.getLogger('app.counters')
+
+# Tên bộ đếm -> (bảng, cột)
+COUNTERS = {
+    'material_downloads': (Material.__table__, 'download_count'),
+}
+
+JOURNAL_SUFFIX = '.log'
+BATCH_SUFFIX = '.batch'
+# Chờ sau khi đổi tên nhật ký để lượt ghi đang dở (đã mở file cũ) kịp hoàn tất
+ROTATE_GRACE = 0.2
+# Thời gian giữ tên lô đã ghi trong counter_batches
+BATCH_RETENTION = timedelta(days=7)
+
+# engine -> CounterBuffer
+_buffers = WeakKeyDictionary()
+_buffers_lock = threading.Lock()
+
+
+def _append(path, line):
+    """Nối một dòng vào file bằng một lần write O_APPEND (nguyên tử giữa các tiến trình)"""
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode())
+    finally:
+        os.close(fd)
+
+
+def _read_batch(path):
+    """Cộng dồn file lô - {khóa: số lượt}; bỏ qua dòng hỏng (ghi dở khi tiến trình chết)"""
+    counts = Counter()
+    with open(path, encoding='ascii', errors='replace') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 2 and line.endswith('\n'):
+                try:
+                    counts[int(parts[0])] += int(parts[1])
+                except ValueError:
+                    pass
+    return counts
+
+
+def _apply(connection, name, counts):
+    """UPDATE cột = cột + n cho từng khóa (executemany, theo thứ tự khóa)"""
+    if not counts:
+        return
+    table, column = COUNTERS[name]
+    statement = (update(table)
+                 .where(table.c.id == bindparam('counter_key'))
+                 .values({column: table.c[column] + bindparam('counter_amount')}))
+    connection.execute(statement, [{'counter_key': key, 'counter_amount': amount}
+                                   for key, amount in sorted(counts.items()) if amount])
+
+
+# ==================== BỘ ĐỆM ====================
+class CounterBuffer:
+    """Lượt tăng chờ ghi của một engine"""
+
+    def __init__(self, engine, journal_dir=None, threshold=0):
+        self.engine = engine
+        self.journal_dir = journal_dir
+        self.threshold = threshold
+        self._pending = Counter()  # (tên, khóa) -> số lượt, khi không dùng nhật ký
+        self._since_flush = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.due = threading.Event()
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+
+    def _journal_path(self, name):
+        return os.path.join(self.journal_dir, name + JOURNAL_SUFFIX)
+
+    def add(self, name, key, amount=1):
+        """Ghi nhận lượt tăng - không chạm database"""
+        if name not in COUNTERS:
+            raise KeyError(f'Bộ đếm không tồn tại: {name}')
+        if self.journal_dir:
+            _append(self._journal_path(name), f'{int(key)} {int(amount)}\n')
+        with self._lock:
+            if not self.journal_dir:
+                self._pending[(name, int(key))] += int(amount)
+            self._since_flush += 1
+            due = self.threshold and self._since_flush >= self.threshold
+        if due:
+            self.due.set()
+
+    def pending(self):
+        """Số lượt chưa ghi vào database - {(tên, khóa): số lượt}"""
+        with self._lock:
+            pending = Counter(self._pending)
+        if self.journal_dir:
+            for name in COUNTERS:
+                for path in self._batches(name) + [self._journal_path(name)]:
+                    try:
+                        counts = _read_batch(path)
+                    except FileNotFoundError:
+                        continue
+                    for key, amount in counts.items():
+                        pending[(name, key)] += amount
+        return pending
+
+    def flush(self):
+        """Ghi mọi lượt tăng đang chờ - trả về {(tên, khóa): số lượt đã ghi}"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                self._since_flush = 0
+            applied = Counter()
+            if pending:
+                try:
+                    with self.engine.begin() as connection:
+                        for name in COUNTERS:
+                            _apply(connection, name, Counter({key: amount for (counter, key), amount
+                                                              in pending.items() if counter == name}))
+                except Exception:
+                    with self._lock:
+                        self._pending.update(pending)
+                    raise
+                applied.update(pending)
+            if self.journal_dir:
+                if any([self._rotate(name) for name in COUNTERS]):
+                    time.sleep(ROTATE_GRACE)
+                for name in COUNTERS:
+                    for path in self._batches(name):
+                        applied.update({(name, key): amount
+                                        for key, amount in self._apply_batch(name, path).items()})
+            return applied
+
+    def _rotate(self, name):
+        """Đổi tên nhật ký thành file lô - các lượt tăng sau đó ghi vào nhật ký mới"""
+        batch = f'{name}.{time.time_ns()}.{os.getpid()}{BATCH_SUFFIX}'
+        try:
+            if not os.path.getsize(self._journal_path(name)):
+                return False
+            os.replace(self._journal_path(name), os.path.join(self.journal_dir, batch))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _batches(self, name):
+        """Các file lô chưa ghi (kể cả lô bỏ dở của tiến trình đã chết), cũ nhất trước
+
+        Bỏ qua lô mới đổi tên chưa quá ROTATE_GRACE: tiến trình khác có thể vẫn đang ghi
+        vào file đó qua nhật ký đã mở trước khi đổi tên.
+        """
+        try:
+            entries = os.listdir(self.journal_dir)
+        except FileNotFoundError:
+            return []
+        cutoff = time.time_ns() - int(ROTATE_GRACE * 1e9)
+        batches = []
+        for entry in entries:
+            if not (entry.startswith(name + '.') and entry.endswith(BATCH_SUFFIX)):
+                continue
+            rotated_at = entry[len(name) + 1:].split('.', 1)[0]
+            if rotated_at.isdigit() and int(rotated_at) > cutoff:
+                continue
+            batches.append(os.path.join(self.journal_dir, entry))
+        return sorted(batches)
+
+    def _apply_batch(self, name, path):
+        """Ghi một file lô trong một giao dịch cùng tên lô, rồi xóa file"""
+        batch = os.path.basename(path)
+        try:
+            counts = _read_batch(path)
+        except FileNotFoundError:
+            # Tiến trình khác vừa ghi xong lô này
+            return Counter()
+        now = datetime.utcnow()
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(insert(CounterBatch.__table__).values(name=batch, applied_at=now))
+                _apply(connection, name, counts)
+                connection.execute(delete(CounterBatch.__table__)
+                                   .where(CounterBatch.applied_at < now - BATCH_RETENTION))
+        except IntegrityError:
+            # Lô đã được ghi (tiến trình khác, hoặc lần trước chết trước khi kịp xóa file)
+            counts = Counter()
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return counts
+
+
+# ==================== LUỒNG GHI ====================
+class _FlushThread(threading.Thread):
+    """Gom bộ đếm sau mỗi interval giây hoặc khi bộ đệm báo đủ ngưỡng"""
+
+    def __init__(self, buffer, interval):
+        super().__init__(name='counter-flush', daemon=True)
+        self.buffer = buffer
+        self.interval = interval
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            self.buffer.due.wait(self.interval)
+            self.buffer.due.clear()
+            try:
+                self.buffer.flush()
+            except Exception:
+                logger.exception('Ghi bộ đếm thất bại')
+
+    def stop(self):
+        self._done.set()
+        self.buffer.due.set()
+
+
+_threads = WeakKeyDictionary()
+
+
+def start_flusher(buffer, interval):
+    """Bật luồng gom cho bộ đệm (một luồng mỗi tiến trình)"""
+    with _buffers_lock:
+        thread = _threads.get(buffer)
+        if thread is None or not thread.is_alive():
+            thread = _threads[buffer] = _FlushThread(buffer, interval)
+            thread.start()
+    return thread
+
+
+def stop_flusher(buffer):
+    with _buffers_lock:
+        thread = _threads.pop(buffer, None)
+    if thread is not None:
+        thread.stop()
+
+
+# ==================== API ====================
+def get_buffer(engine=None):
+    """Bộ đệm bộ đếm của engine (mặc định: engine của app hiện tại)"""
+    return _buffers[engine if engine is not None else db.engine]
+
+
+def increment(name, key, amount=1):
+    """Tăng bộ đếm name của bản ghi key - ghi vào database sau"""
+    get_buffer().add(name, key, amount)
+
+
+def flush_counters(engine=None):
+    """Ghi ngay mọi lượt tăng đang chờ của engine"""
+    return get_buffer(engine).flush()
+
+
+def _flush_at_exit(buffer):
+    try:
+        buffer.flush()
+    except Exception:
+        logger.exception('Ghi bộ đếm khi thoát thất bại')
+
+
+def _before_drop(target, connection, **kw):
+    # Database bị dựng lại: lượt tăng đang giữ trong bộ nhớ trỏ tới bản ghi không còn
+    buffer = _buffers.get(connection.engine)
+    if buffer is not None:
+        with buffer._lock:
+            buffer._pending.clear()
+
+
+def register_counters(app):
+    """Tạo bộ đệm cho engine của app; luồng gom bật ở request đầu tiên của mỗi tiến trình"""
+    with app.app_context():
+        engine = db.engine
+    with _buffers_lock:
+        buffer = _buffers.get(engine)
+        if buffer is None:
+            buffer = _buffers[engine] = CounterBuffer(engine, app.config.get('COUNTER_JOURNAL_DIR'),
+                                                      app.config.get('COUNTER_FLUSH_THRESHOLD') or 0)
+            atexit.register(_flush_at_exit, buffer)
+    if not event.contains(db.metadata, 'before_drop', _before_drop):
+        event.listen(db.metadata, 'before_drop', _before_drop)
+
+    interval = app.config.get('COUNTER_FLUSH_INTERVAL')
+    if interval:
+        start_per_process(app, lambda: _threads.get(buffer), lambda: start_flusher(buffer, interval))
@@ -0,0 +1,113 @@
+"""
+Trả file tài liệu cho người tải
+MATERIAL_DELIVERY chọn cách gửi nội dung:
+  - 'python': worker tự đọc file và gửi (Range, If-None-Match, If-Modified-Since do Werkzeug xử lý)
+  - 'x-sendfile': trả header X-Sendfile để Apache (mod_xsendfile) / lighttpd gửi file
+  - 'x-accel': trả header X-Accel-Redirect (MATERIAL_ACCEL_PREFIX + đường dẫn) cho nginx
+Ở hai chế độ giao cho proxy, worker chỉ kiểm tra quyền và yêu cầu có điều kiện (304) rồi trả
+về ngay; proxy xử lý Range. ETag là SHA-256 nội dung file (ETag mạnh): với file trong kho
+(app/storage.py) lấy từ đường dẫn blob, với file theo đường dẫn cũ lưu trong bảng file_digests
+và chỉ tính lại khi kích thước hoặc mtime của file thay đổi.
+"""
+
+import os
+from urllib.parse import quote
+from flask import current_app, request, send_file
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file as werkzeug_send_file
+from app import db
+from app.models import FileDigest
+from app.storage import resolve, file_digest
+
+DELIVERY_MODES = ('python', 'x-sendfile', 'x-accel')
+
+
+# ==================== ĐƯỜNG DẪN & HASH ====================
+def upload_path(relative_path):
+    """Đường dẫn tuyệt đối của file trong UPLOAD_FOLDER - 404 nếu ra ngoài thư mục hoặc không tồn tại"""
+    path = safe_join(current_app.config['UPLOAD_FOLDER'], relative_path)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+    return path
+
+
+def record_digest(relative_path, sha256=None):
+    """Tính (nếu chưa có) và lưu SHA-256 của file upload - trả về hash. Người gọi tự commit."""
+    path = upload_path(relative_path)
+    stat = os.stat(path)
+    sha256 = sha256 or file_digest(path)
+    row = db.session.get(FileDigest, relative_path)
+    if row is None:
+        row = FileDigest(path=relative_path)
+        db.session.add(row)
+    row.sha256 = sha256
+    row.size = stat.st_size
+    row.mtime_ns = stat.st_mtime_ns
+    return sha256
+
+
+def get_digest(relative_path):
+    """SHA-256 của file upload - từ file_digests nếu file chưa đổi, ngược lại tính lại và lưu"""
+    stat = os.stat(upload_path(relative_path))
+    row = db.session.get(FileDigest, relative_path)
+    if row is not None and row.size == stat.st_size and row.mtime_ns == stat.st_mtime_ns:
+        return row.sha256
+    sha256 = record_digest(relative_path)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Request khác vừa lưu cùng file
+        db.session.rollback()
+    return sha256
+
+
+# ==================== GỬI FILE ====================
+def send_upload(file_path):
+    """Response tải file (Material.file_path) theo MATERIAL_DELIVERY, với ETag mạnh và yêu cầu có điều kiện"""
+    mode = current_app.config.get('MATERIAL_DELIVERY') or 'python'
+    if mode not in DELIVERY_MODES:
+        raise ValueError(f'MATERIAL_DELIVERY không hợp lệ: {mode}')
+    stored = resolve(file_path)
+    relative_path = stored.path
+    path = upload_path(relative_path)
+    # Blob trong kho: tên file chính là SHA-256 nội dung
+    etag = stored.sha256 or get_digest(relative_path)
+    download_name = stored.name
+
+    if mode == 'python':
+        response = send_file(path, as_attachment=True, download_name=download_name, etag=etag,
+                             conditional=True, max_age=0)
+        # Werkzeug chỉ đặt Accept-Ranges khi request có Range: báo trước để trình duyệt tải tiếp được
+        response.headers.setdefault('Accept-Ranges', 'bytes')
+        return response
+
+    # Giao cho proxy: chỉ xử lý 304/412 ở đây, Range để proxy xử lý trên file thật
+    response = werkzeug_send_file(path, request.environ, as_attachment=True, download_name=download_name,
+                                  etag=etag, conditional=False, max_age=0, use_x_sendfile=True,
+                                  response_class=current_app.response_class)
+    # Proxy tự đặt Content-Length theo phần nội dung nó gửi
+    response.headers.pop('Content-Length', None)
+    if mode == 'x-accel':
+        del response.headers['X-Sendfile']
+        prefix = current_app.config.get('MATERIAL_ACCEL_PREFIX') or '/protected-uploads/'
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(relative_path.replace(os.sep, '/'))
+    response = response.make_conditional(request.environ)
+    if response.status_code == 304:
+        response.headers.pop('X-Sendfile', None)
+        response.headers.pop('X-Accel-Redirect', None)
+    return response
+
+
+def is_full_download(response):
+    """Response có phải lượt tải mới (không phải 304, HEAD hay phần tiếp theo của lượt tải dở)"""
+    if request.method != 'GET' or response.status_code not in (200, 206):
+        return False
+    if response.status_code == 206:
+        return response.content_range is not None and response.content_range.start == 0
+    if 'X-Sendfile' in response.headers or 'X-Accel-Redirect' in response.headers:
+        # Proxy trả phần được yêu cầu: chỉ tính khi bắt đầu từ byte 0
+        ranges = request.range.ranges if request.range else None
+        return not ranges or ranges[0][0] == 0
+    return True
@@ -0,0 +1,477 @@
+"""
+Bản dẫn xuất của tài liệu: số trang, văn bản trích (xem nhanh, tìm kiếm) và ảnh thu nhỏ
+Tạo nền sau khi upload nên không làm chậm request upload. Sự kiện ORM thêm dòng 'pending' vào
+bảng derivatives trong cùng transaction với Material, khóa theo SHA-256 của blob trong kho
+(app/storage.py), và chỉ transaction thêm được dòng mới tạo việc derivatives.generate trong hàng
+đợi tác vụ nền (app/jobs.py): nội dung trùng nhau chỉ xử lý một lần. Hàng đợi lo phần nhận việc,
+thử lại (tới DERIVATIVE_MAX_ATTEMPTS lần) và việc của worker đã chết; phần trích xuất chạy trong
+DERIVATIVE_WORKERS tiến trình con để việc phân tích file nặng không chiếm CPU/GIL của tiến trình web.
+
+Định dạng: docx, pptx đọc thẳng XML trong file zip, xlsx qua openpyxl; ảnh thu nhỏ là
+docProps/thumbnail nếu file Office có lưu. pdf dùng pypdf nếu đã cài, ngược lại poppler-utils
+(pdfinfo, pdftotext) nếu có; ảnh trang đầu bằng pdftoppm. Định dạng khác: 'unsupported'.
+Kết quả nằm trong UPLOAD_FOLDER/derivatives/<ab>/<cd>/<sha256>/ (text.txt, thumbnail.png|jpg).
+"""
+
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from xml.etree import ElementTree
+from flask import current_app, request, send_file
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import object_session
+from werkzeug.exceptions import NotFound
+from app import db
+from app.dialects import dialect_insert
+from app.importer import pool_context
+from app.jobs import enqueue, load_params
+from app.models import Material, Derivative, Job
+from app.storage import PREFIX, blob_path, derivative_path, parse_reference
+
+TEXT_FILE = 'text.txt'
+THUMBNAIL_FILES = {'image/png': 'thumbnail.png', 'image/jpeg': 'thumbnail.jpg'}
+EXCERPT_LENGTH = 300
+# Ảnh thu nhỏ lưu sẵn trong file Office lớn hơn mức này thì bỏ qua
+THUMBNAIL_MAX_SIZE = 512 * 1024
+THUMBNAIL_WIDTH = 320
+PDF_TEXT_PAGES = 200
+TOOL_TIMEOUT = 120
+CACHE_MAX_AGE = 365 * 24 * 3600
+# Tác vụ nền (app/tasks.py) tạo bản dẫn xuất của một blob
+TASK = 'derivatives.generate'
+
+_PENDING_KEY = 'derivatives_pending'
+_ENQUEUE_KEY = 'derivatives_enqueue'
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+_EP = '{http://schemas.openxmlformats.org/officeDocument/2006/extended-properties}'
+
+
+class UnsupportedFormat(Exception):
+    """File không trích xuất được với định dạng / công cụ hiện có - không thử lại"""
+
+
+# ==================== TRÍCH XUẤT (tiến trình con) ====================
+class _TextCollector:
+    """Gom văn bản theo đoạn, dừng khi đủ limit ký tự"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.parts = []
+        self.size = 0
+
+    @property
+    def full(self):
+        return self.size >= self.limit
+
+    def add(self, text):
+        text = (text or '').strip()
+        if text and not self.full:
+            text = text[:self.limit - self.size]
+            self.parts.append(text)
+            self.size += len(text) + 1
+
+    def text(self):
+        return '\n'.join(self.parts)
+
+
+def _paragraphs(stream, paragraph_tag, text_tag):
+    """Văn bản từng đoạn của một phần XML - đọc dần (iterparse), không nạp cả cây"""
+    parts = []
+    for _, element in ElementTree.iterparse(stream):
+        if element.tag == text_tag:
+            parts.append(element.text or '')
+        elif element.tag == paragraph_tag:
+            yield ''.join(parts)
+            parts = []
+            element.clear()
+
+
+def _office_thumbnail(archive):
+    """Ảnh thu nhỏ Office lưu khi "Save thumbnail" - (content type, nội dung) hoặc None"""
+    for info in archive.infolist():
+        name = info.filename.lower()
+        if not name.startswith('docprops/thumbnail.'):
+            continue
+        content_type = {'png': 'image/png', 'jpeg': 'image/jpeg', 'jpg': 'image/jpeg'}.get(name.rsplit('.', 1)[1])
+        if content_type and info.file_size <= THUMBNAIL_MAX_SIZE:
+            return content_type, archive.read(info)
+    return None
+
+
+def _docx(path, collector):
+    with zipfile.ZipFile(path) as archive:
+        with archive.open('word/document.xml') as stream:
+            for paragraph in _paragraphs(stream, _W + 'p', _W + 't'):
+                collector.add(paragraph)
+                if collector.full:
+                    break
+        page_count = None
+        # Word ghi số trang vào docProps/app.xml khi lưu (file do công cụ khác tạo có thể không có)
+        if 'docProps/app.xml' in archive.namelist():
+            pages = ElementTree.fromstring(archive.read('docProps/app.xml')).findtext(_EP + 'Pages')
+            page_count = int(pages) if pages and pages.isdigit() else None
+        return page_count, _office_thumbnail(archive)
+
+
+def _pptx(path, collector):
+    with zipfile.ZipFile(path) as archive:
+        slides = sorted((int(match.group(1)), name) for name in archive.namelist()
+                        for match in [re.fullmatch(r'ppt/slides/slide(\d+)\.xml', name)] if match)
+        for _, name in slides:
+            if collector.full:
+                break
+            with archive.open(name) as stream:
+                collector.add(' '.join(paragraph for paragraph in _paragraphs(stream, _A + 'p', _A + 't')
+                                       if paragraph))
+        return len(slides), _office_thumbnail(archive)
+
+
+def _xlsx(path, collector):
+    from openpyxl import load_workbook
+    # Blob không có phần mở rộng: truyền file đã mở để openpyxl không kiểm tra tên file
+    stream = open(path, 'rb')
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            if collector.full:
+                break
+            collector.add(f'# {sheet.title}')
+            for row in sheet.iter_rows(values_only=True):
+                collector.add('\t'.join(str(value) for value in row if value is not None))
+                if collector.full:
+                    break
+        page_count = len(workbook.sheetnames)
+    finally:
+        workbook.close()
+        stream.close()
+    with zipfile.ZipFile(path) as archive:
+        return page_count, _office_thumbnail(archive)
+
+
+def _run_tool(*args):
+    return subprocess.run(args, capture_output=True, check=True, timeout=TOOL_TIMEOUT).stdout
+
+
+def _pdf(path, collector):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        PdfReader = None
+    if PdfReader is not None:
+        reader = PdfReader(path)
+        page_count = len(reader.pages)
+        for page in reader.pages[:PDF_TEXT_PAGES]:
+            if collector.full:
+                break
+            collector.add(page.extract_text())
+    elif shutil.which('pdfinfo') and shutil.which('pdftotext'):
+        info = _run_tool('pdfinfo', path).decode('utf-8', 'replace')
+        match = re.search(r'^Pages:\s*(\d+)', info, re.MULTILINE)
+        page_count = int(match.group(1)) if match else None
+        text = _run_tool('pdftotext', '-enc', 'UTF-8', '-l', str(PDF_TEXT_PAGES), path, '-')
+        for page in text.decode('utf-8', 'replace').split('\f'):
+            collector.add(page)
+    else:
+        raise UnsupportedFormat('Cần cài pypdf hoặc poppler-utils để đọc file PDF')
+    return page_count, _pdf_thumbnail(path)
+
+
+def _pdf_thumbnail(path):
+    """Ảnh trang đầu bằng pdftoppm (nếu có) - (content type, nội dung) hoặc None"""
+    if not shutil.which('pdftoppm'):
+        return None
+    return 'image/png', _run_tool('pdftoppm', '-png', '-f', '1', '-l', '1', '-singlefile',
+                                  '-scale-to', str(THUMBNAIL_WIDTH), path)
+
+
+EXTRACTORS = {'docx': _docx, 'pptx': _pptx, 'xlsx': _xlsx, 'pdf': _pdf}
+
+
+def _write(path, content):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+
+def extract(path, file_type, out_dir, text_limit):
+    """Trích xuất bản dẫn xuất của file path vào thư mục out_dir - chạy được trong tiến trình con
+
+    Trả về dict page_count, excerpt, text_size, thumbnail_type. Ghi đè kết quả cũ.
+    """
+    extractor = EXTRACTORS.get(file_type)
+    if extractor is None:
+        raise UnsupportedFormat(f'Không hỗ trợ định dạng {file_type or "không rõ"}')
+    collector = _TextCollector(text_limit)
+    try:
+        page_count, thumbnail = extractor(path, collector)
+    except (zipfile.BadZipFile, KeyError) as e:
+        # Không phải file Office Open XML (VD .doc đổi đuôi thành .docx)
+        raise UnsupportedFormat(f'File {file_type} không hợp lệ: {e}')
+    text = collector.text()
+    content = text.encode('utf-8')
+    os.makedirs(out_dir, exist_ok=True)
+    _write(os.path.join(out_dir, TEXT_FILE), content)
+    thumbnail_type = None
+    if thumbnail and thumbnail[1]:
+        thumbnail_type = thumbnail[0]
+        _write(os.path.join(out_dir, THUMBNAIL_FILES[thumbnail_type]), thumbnail[1])
+    return {
+        'page_count': page_count,
+        'excerpt': ' '.join(text[:EXCERPT_LENGTH * 2].split())[:EXCERPT_LENGTH] or None,
+        'text_size': len(content),
+        'thumbnail_type': thumbnail_type
+    }
+
+
+# ==================== CHẠY TRÍCH XUẤT ====================
+# pid -> ProcessPoolExecutor trích xuất của tiến trình
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(workers):
+    with _pools_lock:
+        # Tiến trình con sau fork thừa hưởng pool nhưng không dùng được: mỗi pid một pool
+        pool = _pools.get(os.getpid())
+        if pool is None:
+            pool = _pools[os.getpid()] = ProcessPoolExecutor(max_workers=workers, mp_context=pool_context())
+    return pool
+
+
+def _discard_pool(pool):
+    with _pools_lock:
+        if _pools.get(os.getpid()) is pool:
+            del _pools[os.getpid()]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_extract(sha256, file_type):
+    """extract cho một blob - trong tiến trình con để việc phân tích file không chiếm CPU/GIL của tiến trình web"""
+    config = current_app.config
+    root = config['UPLOAD_FOLDER']
+    args = (os.path.join(root, *blob_path(sha256).split('/')), file_type,
+            os.path.join(root, *derivative_path(sha256).split('/')),
+            config.get('DERIVATIVE_TEXT_LIMIT') or 1024 * 1024)
+    workers = config.get('DERIVATIVE_WORKERS')
+    # Đã ở trong tiến trình con (flask jobs worker --processes): chạy thẳng
+    if not workers or multiprocessing.parent_process() is not None:
+        return extract(*args)
+    pool = _pool(workers)
+    try:
+        return pool.submit(extract, *args).result()
+    except BrokenProcessPool:
+        # Tiến trình con chết (VD hết bộ nhớ): tạo lại pool ở việc sau, việc được thử lại
+        _discard_pool(pool)
+        raise
+
+
+def _finish(sha256, **values):
+    table = Derivative.__table__
+    db.session.execute(update(table).where(table.c.sha256 == sha256, table.c.status == 'processing')
+                       .values(updated_at=datetime.utcnow(), **values))
+    db.session.commit()
+    return values['status']
+
+
+def generate(job, sha256, file_type):
+    """Tạo bản dẫn xuất của một blob (tác vụ derivatives.generate) - trả về trạng thái mới
+
+    Lỗi được phát sinh lại để hàng đợi thử lại; lần cuối vẫn lỗi thì bản dẫn xuất là 'failed'.
+    """
+    table = Derivative.__table__
+    # 'processing': lần chạy trước của chính việc này dừng giữa chừng (worker chết)
+    started = db.session.execute(
+        update(table).where(table.c.sha256 == sha256, table.c.status.in_(('pending', 'processing')))
+        .values(status='processing', error=None, updated_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    if not started:
+        # Blob đã bị xóa khỏi kho hoặc đã xử lý xong
+        return None
+    try:
+        result = _run_extract(sha256, file_type)
+    except UnsupportedFormat as e:
+        return _finish(sha256, status='unsupported', error=str(e))
+    except Exception as e:
+        db.session.rollback()
+        _finish(sha256, status='failed' if job.last_attempt else 'pending', error=f'{type(e).__name__}: {e}')
+        raise
+    return _finish(sha256, status='ready', error=None, **result)
+
+
+# ==================== HÀNG ĐỢI ====================
+def _add(connection, blobs):
+    """Thêm dòng 'pending' cho các blob chưa có - blobs: {sha256: file_type}
+
+    Trả về các blob vừa thêm: chỉ transaction thêm được dòng mới tạo việc, nên mỗi blob một việc.
+    """
+    now = datetime.utcnow()
+    added = {}
+    for sha256, file_type in sorted(blobs.items()):
+        if connection.execute(dialect_insert(connection, Derivative.__table__).values(
+            sha256=sha256, file_type=file_type, status='pending', updated_at=now
+        ).on_conflict_do_nothing(index_elements=['sha256'])).rowcount:
+            added[sha256] = file_type
+    return added
+
+
+def _enqueue(blobs):
+    """Một việc derivatives.generate cho mỗi blob - người gọi tự commit"""
+    max_attempts = current_app.config.get('DERIVATIVE_MAX_ATTEMPTS')
+    for sha256, file_type in sorted(blobs.items()):
+        enqueue(TASK, max_attempts=max_attempts, sha256=sha256, file_type=file_type)
+
+
+def _track(target):
+    reference = parse_reference(target.file_path)
+    session = object_session(target)
+    if reference is not None and session is not None:
+        session.info.setdefault(_PENDING_KEY, {})[reference[0]] = (target.file_type or '').lower()
+
+
+def _after_insert(mapper, connection, target):
+    _track(target)
+
+
+def _after_update(mapper, connection, target):
+    if db.inspect(target).attrs.file_path.history.added:
+        _track(target)
+
+
+def _after_flush(session, flush_context):
+    blobs = session.info.pop(_PENDING_KEY, None)
+    if blobs:
+        session.info.setdefault(_ENQUEUE_KEY, {}).update(_add(session.connection(), blobs))
+
+
+def _before_commit(session):
+    # Material chưa flush: flush trước để có dòng derivatives rồi tạo việc trong cùng transaction
+    session.flush()
+    blobs = session.info.pop(_ENQUEUE_KEY, None)
+    if blobs:
+        _enqueue(blobs)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_ENQUEUE_KEY, None)
+
+
+def register_derivatives():
+    """Đăng ký tạo việc theo thay đổi Material"""
+    if not event.contains(Material, 'after_insert', _after_insert):
+        event.listen(Material, 'after_insert', _after_insert)
+        event.listen(Material, 'after_update', _after_update)
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'before_commit', _before_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
+
+
+# ==================== QUẢN TRỊ ====================
+def _queued():
+    """Các blob đang có việc derivatives.generate chờ hoặc đang chạy"""
+    jobs = Job.query.filter(Job.name == TASK, Job.status.in_(('queued', 'running', 'cancelling')))
+    return {load_params(job).get('sha256') for job in jobs}
+
+
+def enqueue_missing():
+    """Tạo việc cho tài liệu trong kho chưa có bản dẫn xuất (VD tài liệu upload trước đây) và cho bản
+    dẫn xuất chưa xong nhưng không còn việc (việc bị hủy / đã xóa) - trả về số việc"""
+    rows = db.session.execute(
+        select(Material.file_path, Material.file_type).where(Material.file_path.startswith(PREFIX))
+    ).all()
+    known = set(db.session.execute(select(Derivative.sha256)).scalars())
+    blobs = {}
+    for file_path, file_type in rows:
+        sha256 = parse_reference(file_path)[0]
+        if sha256 not in known:
+            blobs[sha256] = (file_type or '').lower()
+    blobs = _add(db.session.connection(), blobs)
+    queued = _queued()
+    for sha256, file_type in db.session.execute(
+        select(Derivative.sha256, Derivative.file_type).where(Derivative.status.in_(('pending', 'processing')))
+    ):
+        if sha256 not in queued:
+            blobs.setdefault(sha256, file_type)
+    _enqueue(blobs)
+    db.session.commit()
+    return len(blobs)
+
+
+def retry(statuses=('failed',)):
+    """Chạy lại bản dẫn xuất ở các trạng thái statuses - trả về số việc"""
+    blobs = dict(db.session.execute(
+        select(Derivative.sha256, Derivative.file_type).where(Derivative.status.in_(statuses))
+    ).all())
+    if blobs:
+        db.session.execute(
+            update(Derivative).where(Derivative.sha256.in_(blobs), Derivative.status.in_(statuses))
+            .values(status='pending', error=None, updated_at=datetime.utcnow())
+        )
+        _enqueue(blobs)
+    db.session.commit()
+    return len(blobs)
+
+
+def queue_status():
+    """Số bản dẫn xuất theo trạng thái"""
+    return dict(db.session.execute(
+        select(Derivative.status, func.count()).group_by(Derivative.status).order_by(Derivative.status)
+    ).all())
+
+
+# ==================== HIỂN THỊ ====================
+def derivatives_for(materials):
+    """{material.id: Derivative đã tạo xong} cho danh sách tài liệu - một truy vấn"""
+    shas = {}
+    for material in materials:
+        reference = parse_reference(material.file_path)
+        if reference is not None:
+            shas[material.id] = reference[0]
+    if not shas:
+        return {}
+    ready = {row.sha256: row for row in Derivative.query.filter(
+        Derivative.sha256.in_(set(shas.values())), Derivative.status == 'ready'
+    )}
+    return {material_id: ready[sha256] for material_id, sha256 in shas.items() if sha256 in ready}
+
+
+def send_derivative(material, kind):
+    """Response ảnh thu nhỏ (kind='thumbnail') hoặc văn bản (kind='text') của tài liệu
+
+    Nội dung chỉ phụ thuộc SHA-256 của file (URL có ?v=<sha256>) nên được lưu đệm lâu dài ở trình duyệt.
+    """
+    reference = parse_reference(material.file_path)
+    derivative = db.session.get(Derivative, reference[0]) if reference else None
+    if derivative is None or not derivative.is_ready:
+        raise NotFound()
+    if kind == 'thumbnail':
+        if derivative.thumbnail_type not in THUMBNAIL_FILES:
+            raise NotFound()
+        name, mimetype = THUMBNAIL_FILES[derivative.thumbnail_type], derivative.thumbnail_type
+    elif kind == 'text':
+        name, mimetype = TEXT_FILE, 'text/plain; charset=utf-8'
+    else:
+        raise NotFound()
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], *derivative_path(derivative.sha256, name).split('/'))
+    if not os.path.isfile(path):
+        raise NotFound()
+    versioned = request.args.get('v') == derivative.sha256
+    response = send_file(path, mimetype=mimetype, etag=f'{derivative.sha256}-{kind}', conditional=True,
+                         max_age=CACHE_MAX_AGE if versioned else 0)
+    # Chỉ người đăng nhập được xem: không để proxy dùng chung lưu đệm
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = versioned or None
+    return response
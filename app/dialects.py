@@ -0,0 +1,16 @@
+"""
+Câu lệnh phụ thuộc dialect dùng chung
+INSERT ... ON CONFLICT (upsert) chỉ có trong insert() riêng của SQLite và PostgreSQL.
+"""
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def dialect_insert(connection, table):
+    """insert(table) có on_conflict_do_nothing/update theo dialect của connection (hoặc engine)"""
+    insert = INSERTS.get(connection.dialect.name)
+    if insert is None:
+        raise RuntimeError(f'Không hỗ trợ upsert cho database {connection.dialect.name}')
+    return insert(table)
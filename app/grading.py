@@ -0,0 +1,103 @@
+"""
+Ghi điểm theo lớp
+Toàn bộ điểm của một lớp/môn/học kỳ được đọc bằng 1 truy vấn và ghi bằng
+1 câu INSERT ... ON CONFLICT DO UPDATE nhiều dòng, chỉ gồm các dòng thực sự thay đổi.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+from app import db
+from app.dialects import dialect_insert
+from app.models import Student, Grade
+from app.academic import refresh_summaries
+
+# Số dòng tối đa trong một câu INSERT nhiều dòng (giới hạn tham số của SQLite)
+ROWS_PER_STATEMENT = 500
+
+SCORE_FIELDS = ('score_attendance', 'score_midterm', 'score_final')
+
+
+GradeSheetRow = namedtuple('GradeSheetRow', [
+    'student_id', 'student_code', 'full_name', 'grade_id',
+    'score_attendance', 'score_midterm', 'score_final', 'score_total', 'letter'
+])
+
+
+def load_grade_sheet(class_id, subject_id, semester):
+    """Bảng điểm của lớp cho một môn/học kỳ - 1 truy vấn LEFT OUTER JOIN
+
+    Mỗi sinh viên của lớp là một GradeSheetRow; các cột điểm là None nếu chưa có điểm.
+    """
+    rows = db.session.execute(
+        db.select(Student.id, Student.student_code, Student.full_name, Grade.id,
+                  *[getattr(Grade, f) for f in SCORE_FIELDS], Grade.score_total)
+        .outerjoin(Grade, (Grade.student_id == Student.id) &
+                          (Grade.subject_id == subject_id) &
+                          (Grade.semester == semester))
+        .where(Student.class_id == class_id)
+        .order_by(Student.id)
+    ).all()
+    return [
+        GradeSheetRow(*row, Grade.score_to_letter(row[-1]) if row[-1] is not None else '-')
+        for row in rows
+    ]
+
+
+def load_existing_grades(class_id, subject_id, semester):
+    """Điểm hiện có của cả lớp
+
+    Trả về {student_id: (score_attendance, score_midterm, score_final, score_total)},
+    giá trị là None nếu sinh viên chưa có điểm.
+    """
+    return {
+        row.student_id: (row.score_attendance, row.score_midterm, row.score_final, row.score_total)
+        if row.grade_id is not None else None
+        for row in load_grade_sheet(class_id, subject_id, semester)
+    }
+
+
+def save_class_grades(class_id, subject_id, semester, scores):
+    """Lưu điểm cho cả lớp
+
+    scores: {student_id: (attendance, midterm, final)}. Sinh viên của lớp không có
+    trong scores được ghi điểm 0 như khi bỏ trống ô nhập.
+    Trả về {'inserted': n, 'updated': n, 'unchanged': n}. Người gọi tự commit.
+    """
+    existing = load_existing_grades(class_id, subject_id, semester)
+    now = datetime.utcnow()
+    result = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    rows = []
+
+    for student_id, current in existing.items():
+        attendance, midterm, final = scores.get(student_id, (0, 0, 0))
+        total = Grade.compute_total(attendance, midterm, final)
+        new_values = (attendance, midterm, final, total)
+
+        if current == new_values:
+            result['unchanged'] += 1
+            continue
+        result['inserted' if current is None else 'updated'] += 1
+        rows.append({
+            'student_id': student_id,
+            'subject_id': subject_id,
+            'semester': semester,
+            'score_attendance': attendance,
+            'score_midterm': midterm,
+            'score_final': final,
+            'score_total': total,
+            'created_at': now,
+            'updated_at': now
+        })
+
+    for i in range(0, len(rows), ROWS_PER_STATEMENT):
+        stmt = dialect_insert(db.session.get_bind(), Grade.__table__).values(rows[i:i + ROWS_PER_STATEMENT])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['student_id', 'subject_id', 'semester'],
+            set_={field: stmt.excluded[field] for field in SCORE_FIELDS + ('score_total', 'updated_at')}
+        )
+        db.session.execute(stmt)
+
+    # Câu lệnh Core không đi qua sự kiện flush của ORM nên cập nhật tổng hợp trực tiếp
+    if rows:
+        refresh_summaries([row['student_id'] for row in rows])
+    return result
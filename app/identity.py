@@ -0,0 +1,242 @@
+"""
+Bộ đệm danh tính người dùng cho Flask-Login
+Mỗi request cần biết vai trò, tên hiển thị, id sinh viên/giảng viên (và lớp của sinh viên)
+của người đăng nhập. Thay vì nạp User rồi lazy load Student/Lecturer mỗi request, bản ghi gọn
+Identity được đọc bằng một truy vấn JOIN và lưu đệm trong tiến trình theo TTL
+(IDENTITY_CACHE_TTL giây).
+Khi các cột tạo nên danh tính (vai trò, trạng thái khóa, tên...) thay đổi qua ORM, phiên bản
+'identity' trong bảng reference_versions (app/refdata.py) tăng trong cùng transaction. Mỗi
+request so phiên bản này (đọc từ database chính, một lần mỗi request) với phiên bản lúc lưu đệm,
+nên mọi tiến trình bỏ bản cũ ngay ở request kế tiếp: tài khoản bị khóa / đổi vai trò không
+còn giữ quyền cũ tới hết TTL. Thay đổi bằng câu lệnh Core/bulk phải tự gọi
+bump_versions(connection, VERSION_KEY).
+"""
+
+import threading
+import time
+from weakref import WeakKeyDictionary
+from flask import current_app, g, has_request_context
+from flask_login import UserMixin
+from sqlalchemy import event
+from app import db, login_manager
+from app.models import User, Student, Lecturer, ReferenceVersion
+from app.refdata import bump_versions
+
+_PENDING_KEY = 'identity_changed'
+
+VERSION_KEY = 'identity'
+
+# Cột tạo nên Identity - đổi cột khác (VD băm lại mật khẩu khi đăng nhập) không làm mất bộ đệm
+IDENTITY_COLUMNS = {
+    User: ('username', 'email', 'role', 'avatar', 'is_active'),
+    Student: ('full_name', 'class_id', 'user_id'),
+    Lecturer: ('full_name', 'user_id')
+}
+
+# {engine: {user_id: (hết hạn lúc, phiên bản 'identity', Identity)}}
+_cache = WeakKeyDictionary()
+# {engine: {user_id: phiên bản}} - tăng mỗi lần thay đổi, chặn ghi đè bản đọc cũ vào bộ đệm
+_versions = WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+class Identity(UserMixin):
+    """Danh tính gọn của người đăng nhập - dùng cho decorator phân quyền và template"""
+
+    def __init__(self, id, username, email, role, avatar, active, display_name, student_id, lecturer_id,
+                 class_id):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.role = role
+        self.avatar = avatar
+        self.active = active
+        self.display_name = display_name
+        self.student_id = student_id
+        self.lecturer_id = lecturer_id
+        self.class_id = class_id
+
+    @property
+    def is_active(self):
+        return self.active
+
+    def is_admin(self):
+        return self.role == 'admin'
+
+    def is_lecturer(self):
+        return self.role == 'lecturer'
+
+    def is_student(self):
+        return self.role == 'student'
+
+    def get_display_name(self):
+        return self.display_name
+
+    # Nạp bản ghi ORM khi route thật sự cần (một truy vấn theo khóa chính)
+    @property
+    def user(self):
+        return db.session.get(User, self.id)
+
+    @property
+    def student(self):
+        return db.session.get(Student, self.student_id) if self.student_id else None
+
+    @property
+    def lecturer(self):
+        return db.session.get(Lecturer, self.lecturer_id) if self.lecturer_id else None
+
+    def __repr__(self):
+        return f'<Identity {self.username}>'
+
+
+# ==================== NẠP ====================
+def _query_identity(user_id):
+    row = db.session.execute(
+        db.select(User.id, User.username, User.email, User.role, User.avatar, User.is_active,
+                  Student.id, Student.full_name, Student.class_id, Lecturer.id, Lecturer.full_name)
+        .outerjoin(Student, Student.user_id == User.id)
+        .outerjoin(Lecturer, Lecturer.user_id == User.id)
+        .where(User.id == user_id)
+        .limit(1),
+        # Luôn đọc database chính: bản sao trễ có thể đưa bản cũ vào bộ đệm thêm một TTL
+        bind_arguments={'bind': db.engine}
+    ).first()
+    if row is None:
+        return None
+    (id, username, email, role, avatar, active,
+     student_id, student_name, class_id, lecturer_id, lecturer_name) = row
+    # Cùng quy tắc với User.get_display_name
+    if role == 'student' and student_id:
+        display_name = student_name
+    elif role == 'lecturer' and lecturer_id:
+        display_name = lecturer_name
+    else:
+        display_name = username
+    if role != 'student':
+        student_id = class_id = None
+    if role != 'lecturer':
+        lecturer_id = None
+    return Identity(id, username, email, role, avatar, active is not False, display_name,
+                    student_id, lecturer_id, class_id)
+
+
+def _shared_version():
+    """Phiên bản 'identity' chung mọi tiến trình - đọc database chính một lần mỗi request"""
+    if has_request_context() and 'identity_version' in g:
+        return g.identity_version
+    table = ReferenceVersion.__table__
+    version = db.session.execute(
+        db.select(table.c.version).where(table.c.table_name == VERSION_KEY),
+        # Bản sao (snapshot) có thể trễ nhiều giây: tài khoản vừa bị khóa vẫn còn quyền
+        bind_arguments={'bind': db.engine}
+    ).scalar() or 0
+    if has_request_context():
+        g.identity_version = version
+    return version
+
+
+def get_identity(user_id):
+    """Identity của user_id - từ bộ đệm nếu còn hạn, ngược lại đọc database"""
+    engine = db.engine
+    ttl = current_app.config.get('IDENTITY_CACHE_TTL', 0)
+    now = time.monotonic()
+    shared_version = _shared_version()
+    with _lock:
+        cached = _cache.get(engine, {}).get(user_id)
+        version = _versions.get(engine, {}).get(user_id, 0)
+    if cached is not None and cached[0] > now and cached[1] == shared_version:
+        return cached[2]
+
+    identity = _query_identity(user_id)
+    if identity is not None and ttl > 0:
+        with _lock:
+            # Có thay đổi trong lúc đang đọc thì không lưu bản có thể đã cũ
+            if _versions.get(engine, {}).get(user_id, 0) == version:
+                _cache.setdefault(engine, {})[user_id] = (now + ttl, shared_version, identity)
+    return identity
+
+
+def invalidate(engine, user_ids):
+    """Xóa danh tính của các user khỏi bộ đệm của engine"""
+    with _lock:
+        store = _cache.get(engine, {})
+        versions = _versions.setdefault(engine, {})
+        for user_id in user_ids:
+            store.pop(user_id, None)
+            versions[user_id] = versions.get(user_id, 0) + 1
+
+
+def clear_cache():
+    """Xóa toàn bộ bộ đệm trong tiến trình"""
+    with _lock:
+        _cache.clear()
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    """Load user cho Flask-Login"""
+    return get_identity(int(user_id))
+
+
+# ==================== SỰ KIỆN ORM ====================
+def _identity_changed(obj, session):
+    """Thay đổi của obj có làm Identity đã lưu đệm sai không (user mới thì chưa có trong bộ đệm)"""
+    if obj in session.deleted:
+        return True
+    if obj in session.new:
+        return not isinstance(obj, User)
+    attrs = db.inspect(obj).attrs
+    return any(attrs[name].history.has_changes() for name in IDENTITY_COLUMNS[type(obj)])
+
+
+def _after_flush(session, flush_context):
+    """Ghi nhận user có User/Student/Lecturer thay đổi - xóa khỏi bộ đệm sau commit"""
+    changed = set()
+    shared = False
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, User):
+            changed.add(obj.id)
+        elif isinstance(obj, (Student, Lecturer)):
+            changed.add(obj.user_id)
+            # Đổi chủ tài khoản: cả user cũ cũng phải nạp lại
+            changed.update(db.inspect(obj).attrs.user_id.history.deleted or ())
+        else:
+            continue
+        shared = shared or _identity_changed(obj, session)
+    changed.discard(None)
+    if changed:
+        session.info.setdefault(_PENDING_KEY, set()).update(changed)
+        # Tăng phiên bản ngay để request khác không lưu bản đọc trước commit
+        invalidate(session.get_bind().engine, changed)
+    if shared:
+        # Các tiến trình khác bỏ danh tính đã lưu đệm ở request kế tiếp
+        bump_versions(session.connection(), VERSION_KEY)
+        if has_request_context():
+            g.pop('identity_version', None)
+
+
+def _after_commit(session):
+    changed = session.info.pop(_PENDING_KEY, None)
+    if changed:
+        invalidate(session.get_bind().engine, changed)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _before_drop(target, connection, **kw):
+    # Database bị dựng lại thì id người dùng không còn ý nghĩa
+    with _lock:
+        _cache.pop(connection.engine, None)
+        _versions.pop(connection.engine, None)
+
+
+def register_identity_events():
+    """Đăng ký xóa bộ đệm danh tính khi tài khoản hoặc hồ sơ thay đổi"""
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
+    if not event.contains(db.metadata, 'before_drop', _before_drop):
+        event.listen(db.metadata, 'before_drop', _before_drop)
@@ -0,0 +1,316 @@
+"""
+Nhập hàng loạt tài khoản sinh viên / giảng viên từ file CSV hoặc XLSX
+Các bước: đọc file -> kiểm tra toàn bộ dòng (trùng lặp trong file và trong database bằng
+truy vấn theo tập) -> băm mật khẩu song song trên nhiều tiến trình -> ghi User + Student/
+Lecturer theo lô, mỗi lô một transaction. Lỗi được báo theo từng dòng.
+"""
+
+import csv
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from functools import partial
+from email_validator import validate_email, EmailNotValidError
+from app import db
+from app.models import User, Student, Lecturer, Major, Classroom
+from app.search import reindex, search_index_ready
+from app.refdata import bump_versions
+from app.passwords import hash_method, hash_password
+
+DEFAULT_PASSWORD = '123456'
+BATCH_SIZE = 500
+CHUNK_SIZE = 500  # Giới hạn tham số mệnh đề IN của SQLite
+
+# Cột của từng loại tài khoản: (cột, bắt buộc)
+COLUMNS = {
+    'student': [('student_code', True), ('full_name', True), ('email', True), ('username', False),
+                ('password', False), ('dob', False), ('gender', False), ('phone', False), ('address', False),
+                ('major_code', False), ('class_name', False), ('enrollment_year', False)],
+    'lecturer': [('lecturer_code', True), ('full_name', True), ('email', True), ('username', False),
+                 ('password', False), ('department', False), ('expertise', False), ('degree', False),
+                 ('phone', False)]
+}
+CODE_COLUMNS = {'student': (Student, 'student_code'), 'lecturer': (Lecturer, 'lecturer_code')}
+
+
+class RowError:
+    """Lỗi của một dòng trong file (số dòng tính cả dòng tiêu đề)"""
+
+    def __init__(self, row, field, message):
+        self.row = row
+        self.field = field
+        self.message = message
+
+    def __repr__(self):
+        return f'<RowError dòng {self.row} {self.field}: {self.message}>'
+
+
+class ImportReport:
+    """Kết quả nhập: số dòng đã tạo và danh sách lỗi"""
+
+    def __init__(self, kind, total):
+        self.kind = kind
+        self.total = total
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+# ==================== ĐỌC FILE ====================
+def read_rows(stream, filename):
+    """File CSV/XLSX -> danh sách dict theo tên cột (tên cột viết thường)"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'csv':
+        text = stream.read()
+        if isinstance(text, bytes):
+            text = text.decode('utf-8-sig')
+        reader = csv.reader(io.StringIO(text))
+        table = list(reader)
+    elif extension == 'xlsx':
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError('Cần cài openpyxl để đọc file XLSX')
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        # Ô ngày của Excel đọc ra datetime: chỉ giữ phần ngày (dòng được lưu dạng JSON khi nhập nền)
+        table = [[value.date() if isinstance(value, datetime) else value for value in row]
+                 for row in workbook.active.iter_rows(values_only=True)]
+        workbook.close()
+    else:
+        raise ValueError('Chỉ hỗ trợ file .csv hoặc .xlsx')
+
+    if not table:
+        return []
+    header = [str(h or '').strip().lower() for h in table[0]]
+    rows = []
+    for values in table[1:]:
+        if all(v is None or str(v).strip() == '' for v in values):
+            continue
+        rows.append({key: values[i] if i < len(values) else None for i, key in enumerate(header) if key})
+    return rows
+
+
+# ==================== KIỂM TRA ====================
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError('Ngày không hợp lệ (YYYY-MM-DD hoặc DD/MM/YYYY)')
+
+
+def _existing(column, values):
+    """Các giá trị đã có trong database - truy vấn theo lô"""
+    values = sorted(set(values))
+    found = set()
+    for i in range(0, len(values), CHUNK_SIZE):
+        found.update(db.session.execute(
+            db.select(column).where(column.in_(values[i:i + CHUNK_SIZE]))
+        ).scalars())
+    return found
+
+
+def validate_rows(kind, rows):
+    """Chuẩn hóa và kiểm tra mọi dòng - trả về (dòng hợp lệ, danh sách RowError)
+
+    Mỗi dòng hợp lệ là dict đã chuẩn hóa kèm khóa 'row' (số dòng trong file).
+    """
+    if kind not in COLUMNS:
+        raise ValueError(f'Loại tài khoản không hợp lệ: {kind}')
+    code_field = CODE_COLUMNS[kind][1]
+    errors = []
+    cleaned = []
+
+    majors = classrooms = {}
+    if kind == 'student':
+        majors = dict(db.session.execute(db.select(Major.code, Major.id)).all())
+        classrooms = dict(db.session.execute(db.select(Classroom.name, Classroom.id)).all())
+
+    for index, raw in enumerate(rows, start=2):
+        row = {'row': index}
+        row_errors = []
+        for field, required in COLUMNS[kind]:
+            value = _text(raw.get(field))
+            if required and not value:
+                row_errors.append(RowError(index, field, 'Bắt buộc'))
+            row[field] = value
+        row['email'] = row['email'].lower()
+        row['username'] = row['username'] or row[code_field].lower()
+        row['password'] = row['password'] or DEFAULT_PASSWORD
+
+        if row['email']:
+            try:
+                validate_email(row['email'], check_deliverability=False)
+            except EmailNotValidError:
+                row_errors.append(RowError(index, 'email', 'Email không hợp lệ'))
+        if not 3 <= len(row['username']) <= 64:
+            row_errors.append(RowError(index, 'username', 'Tên đăng nhập phải dài 3-64 ký tự'))
+        if len(row['password']) < 6:
+            row_errors.append(RowError(index, 'password', 'Mật khẩu phải có ít nhất 6 ký tự'))
+
+        if kind == 'student':
+            dob = raw.get('dob')
+            row['dob'] = None
+            if _text(dob):
+                try:
+                    row['dob'] = _parse_date(dob if isinstance(dob, date) else _text(dob))
+                except ValueError as e:
+                    row_errors.append(RowError(index, 'dob', str(e)))
+            if row['enrollment_year']:
+                if row['enrollment_year'].isdigit():
+                    row['enrollment_year'] = int(row['enrollment_year'])
+                else:
+                    row_errors.append(RowError(index, 'enrollment_year', 'Năm nhập học phải là số'))
+            row['enrollment_year'] = row['enrollment_year'] or None
+            row['major_id'] = majors.get(row['major_code']) if row['major_code'] else None
+            if row['major_code'] and row['major_id'] is None:
+                row_errors.append(RowError(index, 'major_code', f'Không có ngành {row["major_code"]}'))
+            row['class_id'] = classrooms.get(row['class_name']) if row['class_name'] else None
+            if row['class_name'] and row['class_id'] is None:
+                row_errors.append(RowError(index, 'class_name', f'Không có lớp {row["class_name"]}'))
+
+        errors.extend(row_errors)
+        if not row_errors:
+            cleaned.append(row)
+
+    # Trùng lặp trong file và với database
+    checks = [('username', User.username), ('email', User.email), (code_field, getattr(*CODE_COLUMNS[kind]))]
+    duplicated_rows = set()
+    for field, column in checks:
+        seen = {}
+        for row in cleaned:
+            value = row[field]
+            if value in seen:
+                errors.append(RowError(row['row'], field, f'Trùng với dòng {seen[value]}: {value}'))
+                duplicated_rows.add(row['row'])
+            else:
+                seen[value] = row['row']
+        taken = _existing(column, seen)
+        for row in cleaned:
+            if row[field] in taken:
+                errors.append(RowError(row['row'], field, f'Đã tồn tại: {row[field]}'))
+                duplicated_rows.add(row['row'])
+
+    errors.sort(key=lambda e: e.row)
+    return [row for row in cleaned if row['row'] not in duplicated_rows], errors
+
+
+# ==================== BĂM MẬT KHẨU ====================
+def pool_context():
+    methods = multiprocessing.get_all_start_methods()
+    # Không fork tiến trình đang chạy nhiều luồng (máy chủ web): dùng forkserver/spawn
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def hash_passwords(passwords, workers=None, progress=None):
+    """Băm danh sách mật khẩu song song trên mọi lõi CPU - giữ nguyên thứ tự"""
+    # Tiến trình con không có app context: chốt method theo chính sách trước khi chia việc
+    hash_one = partial(hash_password, method=hash_method())
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < 2 * workers:
+        hashes = []
+        for password in passwords:
+            hashes.append(hash_one(password))
+            if progress:
+                progress(len(hashes))
+        return hashes
+
+    hashes = []
+    chunksize = max(1, min(50, len(passwords) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as pool:
+        for hashed in pool.map(hash_one, passwords, chunksize=chunksize):
+            hashes.append(hashed)
+            if progress and len(hashes) % chunksize == 0:
+                progress(len(hashes))
+    if progress:
+        progress(len(hashes))
+    return hashes
+
+
+# ==================== GHI ====================
+def _insert_batch(kind, batch, hashes):
+    """Ghi một lô User + Student/Lecturer trong transaction hiện tại"""
+    users = [{'username': row['username'], 'email': row['email'], 'role': kind, 'password_hash': password_hash}
+             for row, password_hash in zip(batch, hashes)]
+    user_ids = db.session.execute(
+        db.insert(User).returning(User.id, sort_by_parameter_order=True), users
+    ).scalars().all()
+
+    if kind == 'student':
+        model = Student
+        records = [{'user_id': user_id, 'student_code': row['student_code'], 'full_name': row['full_name'],
+                    'dob': row['dob'], 'gender': row['gender'] or None, 'phone': row['phone'] or None,
+                    'address': row['address'] or None, 'major_id': row['major_id'], 'class_id': row['class_id'],
+                    'enrollment_year': row['enrollment_year']}
+                   for row, user_id in zip(batch, user_ids)]
+    else:
+        model = Lecturer
+        records = [{'user_id': user_id, 'lecturer_code': row['lecturer_code'], 'full_name': row['full_name'],
+                    'department': row['department'] or None, 'expertise': row['expertise'] or None,
+                    'degree': row['degree'] or None, 'phone': row['phone'] or None}
+                   for row, user_id in zip(batch, user_ids)]
+    ids = db.session.execute(
+        db.insert(model).returning(model.id, sort_by_parameter_order=True), records
+    ).scalars().all()
+
+    # INSERT hàng loạt không đi qua sự kiện ORM: tự cập nhật chỉ mục tìm kiếm và danh mục
+    connection = db.session.connection()
+    if search_index_ready(connection):
+        reindex(f'{kind}_search', ids, connection)
+    if kind == 'lecturer':
+        bump_versions(connection, 'lecturers')
+
+
+def import_accounts(kind, rows, skip_invalid=False, workers=None, progress=None):
+    """Nhập tài khoản từ các dòng đã đọc - trả về ImportReport
+
+    skip_invalid=False: có lỗi ở bất kỳ dòng nào thì không ghi gì.
+    progress(stage, done, total): stage là 'validate', 'hash' hoặc 'insert'.
+    """
+    report = ImportReport(kind, len(rows))
+    notify = progress or (lambda stage, done, total: None)
+
+    notify('validate', 0, len(rows))
+    valid, report.errors = validate_rows(kind, rows)
+    notify('validate', len(rows), len(rows))
+    report.skipped = len(rows) - len(valid)
+    if (report.errors and not skip_invalid) or not valid:
+        report.skipped = len(rows)
+        return report
+
+    hashes = hash_passwords([row['password'] for row in valid], workers,
+                            progress=lambda done: notify('hash', done, len(valid)))
+
+    for i in range(0, len(valid), BATCH_SIZE):
+        batch = valid[i:i + BATCH_SIZE]
+        try:
+            _insert_batch(kind, batch, hashes[i:i + BATCH_SIZE])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            report.errors.append(RowError(batch[0]['row'], '-', f'Lỗi ghi lô dòng {batch[0]["row"]}-'
+                                                               f'{batch[-1]["row"]}: {e}'))
+            report.skipped += len(valid) - i
+            break
+        report.created += len(batch)
+        notify('insert', report.created, len(valid))
+    return report
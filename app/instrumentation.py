@@ -0,0 +1,173 @@
+"""
+Đo đạc truy vấn SQL theo từng request
+Khi bật SQL_INSTRUMENTATION, mỗi câu lệnh gửi tới database được đếm và đo thời gian
+(sự kiện before/after_cursor_execute của engine). Kết quả của request được gửi về trong
+header Server-Timing, cộng dồn theo endpoint; câu lệnh chậm hơn SLOW_QUERY_MS được ghi
+log kèm tham số và kế hoạch thực thi (EXPLAIN QUERY PLAN).
+Khi tắt, không có listener nào được đăng ký nên không tốn chi phí.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from weakref import WeakKeyDictionary
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from app import db
+
+logger = logging.getLogger('app.sql')
+
+# engine -> ngưỡng truy vấn chậm (ms)
+_slow_query_ms = WeakKeyDictionary()
+
+_endpoint_stats = {}
+_stats_lock = threading.Lock()
+
+
+class RequestStats:
+    """Số liệu SQL của một request"""
+
+    def __init__(self, keep_slowest=3):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.total_ms = 0.0
+        self.keep_slowest = keep_slowest
+        self.slowest = []  # heap (ms, thứ tự, câu lệnh)
+
+    def record(self, statement, elapsed_ms):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        item = (elapsed_ms, self.count, statement)
+        if len(self.slowest) < self.keep_slowest:
+            heapq.heappush(self.slowest, item)
+        elif elapsed_ms > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def slowest_statements(self):
+        """[(ms, câu lệnh)] từ chậm nhất"""
+        return [(ms, statement) for ms, _, statement in sorted(self.slowest, reverse=True)]
+
+
+# ==================== SỰ KIỆN ENGINE ====================
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info['query_start'].pop()) * 1000
+    stats = g.get('sql_stats') if has_request_context() else None
+    if stats is not None:
+        stats.record(statement, elapsed_ms)
+    threshold = _slow_query_ms.get(conn.engine)
+    if threshold is not None and elapsed_ms >= threshold:
+        _log_slow_query(conn, statement, parameters, executemany, elapsed_ms)
+
+
+def _handle_error(context):
+    # Câu lệnh lỗi không có after_cursor_execute: bỏ mốc thời gian của nó
+    starts = context.connection.info.get('query_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def explain(conn, statement, parameters):
+    """Kế hoạch thực thi của câu lệnh - danh sách dòng, rỗng nếu không lấy được"""
+    prefix = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN '}.get(conn.dialect.name)
+    if prefix is None:
+        return []
+    # Dùng cursor DBAPI riêng để không kích hoạt lại sự kiện và không làm hỏng kết quả đang đọc
+    cursor = conn.connection.dbapi_connection.cursor()
+    # PostgreSQL: EXPLAIN lỗi làm hỏng cả transaction của request - chạy trong SAVEPOINT
+    savepoint = conn.dialect.name == 'postgresql'
+    try:
+        if savepoint:
+            cursor.execute('SAVEPOINT explain_plan')
+        try:
+            cursor.execute(prefix + statement, parameters)
+            plan = [' '.join(str(col) for col in row) for row in cursor.fetchall()]
+        except Exception:
+            if savepoint:
+                cursor.execute('ROLLBACK TO SAVEPOINT explain_plan')
+            plan = []
+        if savepoint:
+            cursor.execute('RELEASE SAVEPOINT explain_plan')
+        return plan
+    except Exception:
+        return []
+    finally:
+        cursor.close()
+
+
+def _log_slow_query(conn, statement, parameters, executemany, elapsed_ms):
+    endpoint = request.endpoint if has_request_context() else None
+    plan = [] if executemany else explain(conn, statement, parameters)
+    logger.warning(
+        'Truy vấn chậm %.1f ms [%s]\n%s\nTham số: %r%s',
+        elapsed_ms, endpoint or '-', statement, parameters,
+        ''.join(f'\n  {line}' for line in plan)
+    )
+
+
+# ==================== REQUEST ====================
+def _start_request():
+    g.sql_stats = RequestStats(keep_slowest=current_app.config['SQL_TRACE_SLOWEST'])
+
+
+def _finish_request(response):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return response
+    total_ms = (time.perf_counter() - stats.started) * 1000
+    response.headers.add(
+        'Server-Timing', f'db;dur={stats.total_ms:.2f};desc="{stats.count} queries"'
+    )
+    response.headers.add('Server-Timing', f'app;dur={total_ms:.2f}')
+
+    endpoint = request.endpoint or '-'
+    _accumulate(endpoint, stats)
+    logger.debug('%s %s: %d truy vấn, %.1f ms SQL / %.1f ms', request.method, endpoint,
+                 stats.count, stats.total_ms, total_ms)
+    return response
+
+
+def _accumulate(endpoint, stats):
+    with _stats_lock:
+        entry = _endpoint_stats.setdefault(endpoint, {
+            'requests': 0, 'queries': 0, 'db_ms': 0.0, 'max_queries': 0, 'slowest': []
+        })
+        entry['requests'] += 1
+        entry['queries'] += stats.count
+        entry['db_ms'] += stats.total_ms
+        entry['max_queries'] = max(entry['max_queries'], stats.count)
+        entry['slowest'] = sorted(entry['slowest'] + stats.slowest_statements(),
+                                  reverse=True)[:stats.keep_slowest]
+
+
+def endpoint_stats():
+    """Số liệu SQL cộng dồn theo endpoint từ khi tiến trình khởi động"""
+    with _stats_lock:
+        return {endpoint: dict(entry, slowest=list(entry['slowest']))
+                for endpoint, entry in _endpoint_stats.items()}
+
+
+def reset_endpoint_stats():
+    """Xóa số liệu cộng dồn"""
+    with _stats_lock:
+        _endpoint_stats.clear()
+
+
+def register_instrumentation(app):
+    """Gắn đo đạc SQL vào engine của app nếu SQL_INSTRUMENTATION được bật"""
+    if not app.config.get('SQL_INSTRUMENTATION'):
+        return
+    with app.app_context():
+        engines = list(db.engines.values())  # gồm cả bản sao chỉ đọc nếu có
+    for engine in engines:
+        _slow_query_ms[engine] = app.config.get('SLOW_QUERY_MS')
+        if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _handle_error)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
@@ -0,0 +1,511 @@
+"""
+Tác vụ nền bền vững: hàng đợi là bảng jobs trong database hiện có (không cần broker)
+Route gọi enqueue('tên', **tham số), commit rồi trả về ngay; tác vụ chạy trong worker:
+  - flask jobs worker [--threads N | --processes N]: tiến trình worker riêng
+  - JOB_EMBEDDED_WORKERS luồng trong mỗi tiến trình web (bật ở request đầu tiên)
+Worker nhận việc theo độ ưu tiên (số lớn trước) rồi thời điểm hẹn, bằng UPDATE có điều kiện nên
+nhiều worker (nhiều tiến trình, nhiều máy) chạy cùng lúc không nhận trùng. Việc lỗi được thử lại
+sau retry_delay * 2^(n-1) giây tới max_attempts lần. Worker báo nhịp cho việc đang chạy; việc
+không có nhịp quá JOB_LEASE giây (worker chết) được đưa lại hàng đợi. Hủy: việc đang chờ bị hủy
+ngay, việc đang chạy được đánh dấu 'cancelling' và dừng ở lần báo tiến độ kế tiếp.
+
+Tác vụ là hàm đăng ký bằng @task (app/tasks.py), nhận JobContext và tham số (JSON), chạy trong
+app context và tự commit phần việc của mình; giá trị trả về (JSON) là kết quả của việc:
+    @task('academic.rebuild', title='Tính lại GPA')
+    def rebuild(job):
+        job.progress(0, 1, 'Đang tính')
+        return {'students': rebuild_summaries()}
+"""
+
+import json
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta
+from weakref import WeakKeyDictionary
+from flask import current_app, send_file
+from sqlalchemy import and_, event, func, select, update
+from sqlalchemy.exc import OperationalError
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+from app import db
+from app.background import start_per_process
+from app.importer import pool_context
+from app.models import Job
+
+logger = logging.getLogger('app.jobs')
+
+# Báo tiến độ dày hơn mức này (giây) thì chỉ lần cuối được ghi
+PROGRESS_INTERVAL = 1.0
+
+_WAKE_KEY = 'jobs_wake'
+
+Task = namedtuple('Task', 'name func title max_attempts retry_delay')
+
+# Tên tác vụ -> Task
+TASKS = {}
+
+
+class JobCancelled(Exception):
+    """Việc bị hủy trong lúc chạy (JobContext.progress phát hiện)"""
+
+
+def task(name, title=None, max_attempts=3, retry_delay=30):
+    """Đăng ký hàm func(job, **params) làm tác vụ nền"""
+    def decorator(func):
+        TASKS[name] = Task(name, func, title or name, max_attempts, retry_delay)
+        return func
+    return decorator
+
+
+def task_title(name):
+    registered = TASKS.get(name)
+    return registered.title if registered else name
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    raise TypeError(f'Không chuyển được {type(value).__name__} sang JSON')
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, default=_json_default)
+
+
+def load_params(job):
+    return json.loads(job.params) if job.params else {}
+
+
+def load_result(job):
+    return json.loads(job.result) if job.result else None
+
+
+# ==================== HÀNG ĐỢI ====================
+def enqueue(name, priority=0, delay=0, created_by=None, max_attempts=None, **params):
+    """Thêm việc vào hàng đợi - trả về Job. Người gọi tự commit (việc chỉ chạy sau commit)."""
+    registered = TASKS.get(name)
+    if registered is None:
+        raise KeyError(f'Tác vụ không tồn tại: {name}')
+    job = Job(name=name, params=_dumps(params), priority=priority, created_by=created_by,
+              max_attempts=max_attempts or registered.max_attempts,
+              run_after=datetime.utcnow() + timedelta(seconds=delay))
+    db.session.add(job)
+    db.session.flush()
+    db.session.info[_WAKE_KEY] = True
+    return job
+
+
+def cancel(job_id):
+    """Hủy việc: đang chờ -> 'cancelled', đang chạy -> 'cancelling' - trả về True nếu đã hủy / đánh dấu"""
+    now = datetime.utcnow()
+    cancelled = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == 'queued')
+        .values(status='cancelled', finished_at=now)
+    ).rowcount or db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == 'running').values(status='cancelling')
+    ).rowcount
+    db.session.commit()
+    return bool(cancelled)
+
+
+def retry(job_id):
+    """Chạy lại việc đã lỗi hoặc bị hủy - trả về True nếu đã đưa lại hàng đợi"""
+    retried = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status.in_(('failed', 'cancelled')))
+        .values(status='queued', attempts=0, run_after=datetime.utcnow(), error=None, finished_at=None,
+                progress_current=None, progress_total=None, progress_message=None)
+    ).rowcount
+    db.session.info[_WAKE_KEY] = True
+    db.session.commit()
+    return bool(retried)
+
+
+def queue_status():
+    """Số việc theo trạng thái"""
+    return dict(db.session.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+
+
+def job_to_dict(job):
+    """Trạng thái việc cho client (thăm dò tiến độ)"""
+    return {
+        'id': job.id, 'name': job.name, 'title': task_title(job.name), 'status': job.status,
+        'finished': job.finished, 'attempts': job.attempts, 'percent': job.percent,
+        'progress': {'current': job.progress_current, 'total': job.progress_total,
+                     'message': job.progress_message},
+        'result': load_result(job), 'error': job.error,
+        'created_at': job.created_at.isoformat() + 'Z' if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() + 'Z' if job.finished_at else None
+    }
+
+
+def output_path(job_id, filename):
+    """Đường dẫn file kết quả của việc trong JOB_OUTPUT_FOLDER (tạo thư mục nếu chưa có)"""
+    folder = current_app.config['JOB_OUTPUT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f'{job_id}-{filename}')
+
+
+def send_output(job):
+    """Response tải file kết quả (result['file']) của việc đã thành công - 404 nếu không có"""
+    result = load_result(job) or {}
+    if job.status != 'succeeded' or not result.get('file'):
+        raise NotFound()
+    path = safe_join(current_app.config['JOB_OUTPUT_FOLDER'], result['file'])
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+    return send_file(path, as_attachment=True, download_name=result.get('download_name') or result['file'])
+
+
+def purge(days):
+    """Xóa việc đã kết thúc cũ hơn days ngày cùng file kết quả - trả về số việc"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    ids = db.session.execute(
+        select(Job.id).where(Job.status.in_(Job.FINISHED), Job.finished_at < cutoff)
+    ).scalars().all()
+    folder = current_app.config['JOB_OUTPUT_FOLDER']
+    if ids:
+        db.session.execute(Job.__table__.delete().where(Job.id.in_(ids)))
+        db.session.commit()
+        prefixes = tuple(f'{job_id}-' for job_id in ids)
+        for name in os.listdir(folder) if os.path.isdir(folder) else ():
+            if name.startswith(prefixes):
+                os.remove(os.path.join(folder, name))
+    return len(ids)
+
+
+# ==================== CHẠY MỘT VIỆC ====================
+class JobContext:
+    """Tham số thứ nhất của tác vụ: id việc, lần chạy, báo tiến độ, kiểm tra hủy"""
+
+    def __init__(self, job_id, worker_id, engine, attempts=1, max_attempts=1):
+        self.id = job_id
+        self.worker_id = worker_id
+        self.engine = engine
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self._last_report = 0
+
+    @property
+    def last_attempt(self):
+        """Lỗi ở lần chạy này thì việc không được thử lại"""
+        return self.attempts >= self.max_attempts
+
+    def progress(self, current, total=None, message=None):
+        """Ghi tiến độ (đồng thời là nhịp của việc); việc đã bị hủy thì phát sinh JobCancelled
+
+        Ghi trên kết nối riêng, không đụng transaction của tác vụ. Gọi dày thì chỉ ghi mỗi
+        PROGRESS_INTERVAL giây và lần cuối (current == total).
+        """
+        now = time.monotonic()
+        if now - self._last_report < PROGRESS_INTERVAL and (total is None or current < total):
+            return
+        self._last_report = now
+        values = {'progress_current': current, 'heartbeat_at': datetime.utcnow()}
+        if total is not None:
+            values['progress_total'] = total
+        if message is not None:
+            values['progress_message'] = message[:255]
+        try:
+            with self.engine.begin() as connection:
+                running = connection.execute(
+                    update(Job.__table__).where(Job.id == self.id, Job.claimed_by == self.worker_id,
+                                                Job.status == 'running').values(values)
+                ).rowcount
+        except OperationalError as e:
+            # SQLite: tác vụ đang giữ khóa ghi - bỏ qua lần báo này
+            logger.debug('Không ghi được tiến độ việc %s: %s', self.id, e)
+            return
+        if not running:
+            raise JobCancelled()
+
+    def check_cancelled(self):
+        """Phát sinh JobCancelled nếu việc đã bị hủy (không ghi tiến độ)"""
+        with self.engine.connect() as connection:
+            status = connection.execute(select(Job.status).where(Job.id == self.id)).scalar()
+        if status != 'running':
+            raise JobCancelled()
+
+
+def _finish(engine, job_id, worker_id, **values):
+    """Ghi trạng thái cuối nếu việc vẫn thuộc worker này"""
+    table = Job.__table__
+    with engine.begin() as connection:
+        return connection.execute(
+            update(table).where(table.c.id == job_id, table.c.claimed_by == worker_id,
+                                table.c.status.in_(('running', 'cancelling')))
+            .values(claimed_by=None, **values)
+        ).rowcount
+
+
+def record_failure(engine, job_id, worker_id, error):
+    """Việc lỗi: thử lại sau thời gian chờ tăng dần, hoặc 'failed' khi hết lượt / đã bị hủy"""
+    table = Job.__table__
+    with engine.connect() as connection:
+        row = connection.execute(
+            select(table.c.name, table.c.status, table.c.attempts, table.c.max_attempts).where(table.c.id == job_id)
+        ).first()
+    if row is None:
+        return None
+    now = datetime.utcnow()
+    message = f'{type(error).__name__}: {error}'
+    if row.status == 'cancelling':
+        status, values = 'cancelled', {'finished_at': now}
+    elif row.attempts >= row.max_attempts or row.name not in TASKS:
+        status, values = 'failed', {'finished_at': now}
+    else:
+        delay = TASKS[row.name].retry_delay * 2 ** (row.attempts - 1)
+        status, values = 'queued', {'run_after': now + timedelta(seconds=delay)}
+    _finish(engine, job_id, worker_id, status=status, error=message, **values)
+    return status
+
+
+def run_job(job_id, worker_id):
+    """Chạy một việc đã nhận trong app context hiện tại và ghi kết quả - trả về trạng thái mới"""
+    engine = db.engine
+    job = db.session.get(Job, job_id)
+    registered = TASKS.get(job.name) if job is not None else None
+    params = load_params(job) if job is not None else {}
+    attempts = (job.attempts, job.max_attempts) if job is not None else ()
+    db.session.rollback()
+    try:
+        if registered is None:
+            raise KeyError(f'Tác vụ không tồn tại: {job.name if job else job_id}')
+        result = registered.func(JobContext(job_id, worker_id, engine, *attempts), **params)
+        db.session.commit()
+    except JobCancelled:
+        db.session.rollback()
+        _finish(engine, job_id, worker_id, status='cancelled', finished_at=datetime.utcnow())
+        return 'cancelled'
+    except Exception as e:
+        db.session.rollback()
+        logger.warning('Việc %s (%s) lỗi: %s', job_id, registered.name if registered else '?', e, exc_info=True)
+        return record_failure(engine, job_id, worker_id, e)
+    finally:
+        db.session.remove()
+    # Việc bị đánh dấu hủy nhưng đã chạy xong: vẫn ghi là thành công
+    _finish(engine, job_id, worker_id, status='succeeded', result=_dumps(result) if result is not None else None,
+            error=None, finished_at=datetime.utcnow())
+    return 'succeeded'
+
+
+_process_app = None
+
+
+def _init_process(config_overrides):
+    """Tiến trình con của worker (--processes): dựng app với cấu hình của tiến trình cha"""
+    global _process_app
+    from app import create_app
+    _process_app = create_app('default', config_overrides=config_overrides)
+
+
+def execute(job_id, worker_id, app=None):
+    """Điểm vào của luồng / tiến trình con"""
+    app = app or _process_app
+    with app.app_context():
+        return run_job(job_id, worker_id)
+
+
+def _config_snapshot(app):
+    """Cấu hình của app truyền được sang tiến trình con (bỏ giá trị không pickle được)"""
+    snapshot = {}
+    for key, value in app.config.items():
+        if key.isupper():
+            try:
+                pickle.dumps(value)
+            except Exception:
+                continue
+            snapshot[key] = value
+    return snapshot
+
+
+# ==================== WORKER ====================
+def _claimable(now):
+    return and_(Job.status == 'queued', Job.run_after <= now)
+
+
+class Worker:
+    """Nhận việc đến hạn và chạy trong pool luồng hoặc tiến trình"""
+
+    def __init__(self, app, engine, concurrency=1, processes=False, name=None):
+        self.app = app
+        self.engine = engine
+        self.concurrency = max(1, concurrency)
+        self.processes = processes
+        self.id = name or f'{socket.gethostname()}:{os.getpid()}:{id(self):x}'
+        self.poll = app.config.get('JOB_POLL_INTERVAL') or 2
+        self.lease = timedelta(seconds=app.config.get('JOB_LEASE') or 300)
+        self.wake = threading.Event()
+        self._done = threading.Event()
+        self._last_heartbeat = 0
+
+    def claim(self, limit):
+        """Nhận tối đa limit việc - [job id]"""
+        if limit <= 0:
+            return []
+        table = Job.__table__
+        now = datetime.utcnow()
+        claimed = []
+        with self.engine.begin() as connection:
+            self._reap(connection, now)
+            candidates = connection.execute(
+                select(table.c.id).where(_claimable(now))
+                .order_by(table.c.priority.desc(), table.c.run_after, table.c.id).limit(limit)
+            ).scalars().all()
+            for job_id in candidates:
+                taken = connection.execute(
+                    update(table).where(table.c.id == job_id, _claimable(now))
+                    .values(status='running', claimed_by=self.id, attempts=table.c.attempts + 1,
+                            started_at=now, heartbeat_at=now, finished_at=None,
+                            progress_current=None, progress_total=None, progress_message=None)
+                ).rowcount
+                if taken:
+                    claimed.append(job_id)
+        return claimed
+
+    def _reap(self, connection, now):
+        """Việc của worker đã chết (mất nhịp quá JOB_LEASE): hủy / thất bại / đưa lại hàng đợi"""
+        table = Job.__table__
+        stale = and_(table.c.heartbeat_at < now - self.lease,
+                     table.c.status.in_(('running', 'cancelling')))
+        lost = 'Worker dừng khi đang chạy việc'
+        connection.execute(update(table).where(stale, table.c.status == 'cancelling')
+                           .values(status='cancelled', claimed_by=None, finished_at=now))
+        connection.execute(update(table).where(stale, table.c.attempts >= table.c.max_attempts)
+                           .values(status='failed', claimed_by=None, finished_at=now, error=lost))
+        connection.execute(update(table).where(stale)
+                           .values(status='queued', claimed_by=None, run_after=now, error=lost))
+
+    def _heartbeat(self, job_ids):
+        """Báo nhịp cho mọi việc đang chạy (kể cả tác vụ không gọi progress)"""
+        now = time.monotonic()
+        if not job_ids or now - self._last_heartbeat < self.lease.total_seconds() / 4:
+            return
+        self._last_heartbeat = now
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(update(Job.__table__)
+                                   .where(Job.id.in_(job_ids), Job.claimed_by == self.id)
+                                   .values(heartbeat_at=datetime.utcnow()))
+        except OperationalError as e:
+            logger.debug('Báo nhịp thất bại: %s', e)
+
+    def _executor(self):
+        if self.processes:
+            return ProcessPoolExecutor(max_workers=self.concurrency, mp_context=pool_context(),
+                                       initializer=_init_process, initargs=(_config_snapshot(self.app),))
+        return ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='job')
+
+    def _submit(self, executor, job_id):
+        if self.processes:
+            return executor.submit(execute, job_id, self.id)
+        return executor.submit(execute, job_id, self.id, self.app)
+
+    def run(self, until_idle=False):
+        """Vòng nhận và chạy việc đến khi stop() (until_idle: dừng khi hết việc) - trả về {trạng thái: số việc}"""
+        counts = {}
+        running = {}  # future -> (job id, pool chạy việc)
+        executor = None
+        try:
+            while True:
+                if not self._done.is_set():
+                    try:
+                        job_ids = self.claim(self.concurrency - len(running))
+                    except OperationalError:
+                        logger.exception('Nhận việc thất bại')
+                        job_ids = []
+                    try:
+                        for job_id in job_ids:
+                            if executor is None:
+                                executor = self._executor()
+                            running[self._submit(executor, job_id)] = (job_id, executor)
+                    except RuntimeError:
+                        # Trình thông dịch đang thoát: việc đã nhận được chạy lại sau JOB_LEASE giây
+                        break
+                if not running:
+                    if until_idle or self._done.is_set():
+                        break
+                    self.wake.wait(self.poll)
+                    self.wake.clear()
+                    continue
+                finished, _ = wait(running, timeout=self.poll, return_when=FIRST_COMPLETED)
+                broken = None
+                for future in finished:
+                    job_id, pool = running.pop(future)
+                    if future.cancelled():
+                        continue
+                    error = future.exception()
+                    if error is None:
+                        status = future.result()
+                    else:
+                        logger.error('Worker mất việc %s: %s', job_id, error)
+                        status = record_failure(self.engine, job_id, self.id, error)
+                        broken = pool
+                    counts[status] = counts.get(status, 0) + 1
+                # Tiến trình con chết (VD hết bộ nhớ): pool hỏng và mọi việc đang chạy trong nó cùng lỗi -
+                # bỏ pool một lần (việc lỗi muộn của pool cũ không đụng pool mới), tạo lại ở việc sau
+                if broken is not None and broken is executor:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = None
+                self._heartbeat([job_id for job_id, _ in running.values()])
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+        return counts
+
+    def stop(self):
+        """Không nhận việc mới; run() trả về khi các việc đang chạy xong"""
+        self._done.set()
+        self.wake.set()
+
+
+# ==================== WORKER TRONG TIẾN TRÌNH WEB ====================
+# engine -> (Worker, luồng)
+_embedded = WeakKeyDictionary()
+_embedded_lock = threading.Lock()
+
+
+def start_embedded_worker(app, engine, concurrency):
+    """Bật worker chạy trong luồng nền của tiến trình (một worker mỗi tiến trình)"""
+    with _embedded_lock:
+        worker, thread = _embedded.get(engine, (None, None))
+        if thread is None or not thread.is_alive():
+            worker = Worker(app, engine, concurrency)
+            thread = threading.Thread(target=worker.run, name='job-worker', daemon=True)
+            _embedded[engine] = (worker, thread)
+            thread.start()
+    return worker
+
+
+def _after_commit(session):
+    if session.info.pop(_WAKE_KEY, False):
+        worker, _ = _embedded.get(session.get_bind(), (None, None))
+        if worker is not None:
+            worker.wake.set()
+
+
+def _after_rollback(session):
+    session.info.pop(_WAKE_KEY, None)
+
+
+def register_jobs(app):
+    """Nạp các tác vụ; worker nhúng bật ở request đầu tiên của mỗi tiến trình (nếu JOB_EMBEDDED_WORKERS)"""
+    from app import tasks  # noqa: F401 - đăng ký @task
+
+    if not event.contains(db.session, 'after_commit', _after_commit):
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
+
+    concurrency = app.config.get('JOB_EMBEDDED_WORKERS')
+    if concurrency:
+        with app.app_context():
+            engine = db.engine
+        start_per_process(app, lambda: _embedded.get(engine, (None, None))[1],
+                          lambda: start_embedded_worker(app, engine, concurrency))
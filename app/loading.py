@@ -0,0 +1,131 @@
+"""
+Hồ sơ nạp quan hệ (loading profile) theo từng màn hình
+Mỗi route khai báo các hồ sơ nó cần bằng decorator @loading_profile(...);
+các tùy chọn joinedload/selectinload tương ứng được tự động gắn vào mọi truy vấn
+ORM của request đó. Khi bật STRICT_LOADING, mọi lazy load chưa khai báo sẽ báo lỗi.
+"""
+
+from functools import lru_cache, wraps
+from flask import g, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload, selectinload
+from app import db
+from app.models import (User, Student, Lecturer, Classroom, Major, Subject,
+                        Schedule, Grade, Material, Evaluation)
+
+
+class UndeclaredLazyLoad(RuntimeError):
+    """Lazy load không nằm trong hồ sơ nạp của route (chỉ phát sinh khi STRICT_LOADING)"""
+
+
+# Hồ sơ nạp: tên -> danh sách đường dẫn quan hệ 'Model.quan_he[.quan_he_con]'
+# Quan hệ một-một/nhiều-một dùng joinedload, quan hệ tập hợp dùng selectinload.
+PROFILES = {
+    # Luôn áp dụng: User nạp kèm hồ sơ sinh viên/giảng viên (đăng nhập, đổi mật khẩu)
+    'identity': ['User.student', 'User.lecturer'],
+    'profile': ['User.student.classroom', 'User.student.major'],
+    'schedule_list': ['Schedule.subject', 'Schedule.lecturer', 'Schedule.classroom'],
+    'grade_sheet': ['Grade.subject'],
+    'student_card': ['Student.user', 'Student.classroom', 'Student.major'],
+    'lecturer_card': ['Lecturer.user'],
+    'material_list': ['Material.subject', 'Material.uploader'],
+    'evaluation_list': ['Evaluation.lecturer', 'Evaluation.subject']
+}
+
+DEFAULT_PROFILES = ('identity',)
+
+MODELS = {model.__name__: model for model in
+          (User, Student, Lecturer, Classroom, Major, Subject, Schedule, Grade, Material, Evaluation)}
+
+
+def loading_profile(*names):
+    """Decorator khai báo các hồ sơ nạp mà route cần"""
+    unknown = [name for name in names if name not in PROFILES]
+    if unknown:
+        raise KeyError(f'Hồ sơ nạp không tồn tại: {", ".join(unknown)}')
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            g.loading_profiles = DEFAULT_PROFILES + names
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def _build_option(path):
+    """'User.student.classroom' -> (User, joinedload(User.student).joinedload(Student.classroom))"""
+    model_name, *attrs = path.split('.')
+    root = model = MODELS[model_name]
+    option = None
+    for attr in attrs:
+        relationship = getattr(model, attr)
+        loader = selectinload if relationship.property.uselist else joinedload
+        option = loader(relationship) if option is None else getattr(option, loader.__name__)(relationship)
+        model = relationship.property.mapper.class_
+    return root, option
+
+
+@lru_cache(maxsize=None)
+def profile_options(names):
+    """Gộp tùy chọn nạp của các hồ sơ - {model: [options]}"""
+    options = {}
+    for name in names:
+        for path in PROFILES[name]:
+            model, option = _build_option(path)
+            options.setdefault(model, []).append(option)
+    return options
+
+
+@lru_cache(maxsize=None)
+def declared_paths(names):
+    """Các quan hệ 'Model.attr' được nạp sẵn bởi các hồ sơ"""
+    paths = set()
+    for name in names:
+        for path in PROFILES[name]:
+            model_name, *attrs = path.split('.')
+            model = MODELS[model_name]
+            for attr in attrs:
+                paths.add(f'{model.__name__}.{attr}')
+                model = getattr(model, attr).property.mapper.class_
+    return frozenset(paths)
+
+
+def _active_profiles():
+    if has_request_context():
+        return g.get('loading_profiles', DEFAULT_PROFILES)
+    return DEFAULT_PROFILES
+
+
+def _apply_profiles(state):
+    """Gắn tùy chọn nạp vào truy vấn gốc / kiểm tra lazy load"""
+    if not state.is_select or state.is_column_load:
+        return
+
+    names = _active_profiles()
+    if state.is_relationship_load:
+        # Unit of work nạp quan hệ khi flush (VD xóa bản ghi: gỡ khóa ngoại của bản ghi con) - route không tự nạp
+        if state.session._flushing:
+            return
+        if state.lazy_loaded_from is not None and has_request_context() \
+                and current_app.config.get('STRICT_LOADING'):
+            mapper, prop = state.loader_strategy_path.path[-2:]
+            key = f'{mapper.class_.__name__}.{prop.key}'
+            if key not in declared_paths(names):
+                raise UndeclaredLazyLoad(
+                    f'Lazy load {key} chưa được khai báo trong hồ sơ nạp {list(names)}'
+                )
+        return
+
+    descriptions = state.statement.column_descriptions
+    if not descriptions or descriptions[0]['expr'] is not descriptions[0].get('entity'):
+        return
+    options = profile_options(names).get(descriptions[0]['entity'])
+    if options:
+        state.statement = state.statement.options(*options)
+
+
+def register_loading_events():
+    """Đăng ký áp dụng hồ sơ nạp cho mọi truy vấn ORM"""
+    if not event.contains(db.session, 'do_orm_execute', _apply_profiles):
+        event.listen(db.session, 'do_orm_execute', _apply_profiles)
@@ -1,7 +1,8 @@
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 from flask_login import UserMixin
-from app import db, login_manager
+from app import db
+from app.passwords import hash_password, needs_rehash
 
 
 # ==================== USER MODEL ====================
@@ -25,12 +26,19 @@ class User(UserMixin, db.Model):
     
     def set_password(self, password):
         """Mã hóa và lưu mật khẩu"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
         """Kiểm tra mật khẩu"""
         return check_password_hash(self.password_hash, password)
     
+    def rehash_password(self, password):
+        """Băm lại mật khẩu (đã kiểm tra đúng) nếu hash không theo chính sách hiện tại"""
+        if needs_rehash(self.password_hash):
+            self.set_password(password)
+            return True
+        return False
+    
     def is_admin(self):
         return self.role == 'admin'
     
@@ -52,12 +60,6 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
 
-@login_manager.user_loader
-def load_user(user_id):
-    """Load user cho Flask-Login"""
-    return User.query.get(int(user_id))
-
-
 # ==================== MAJOR MODEL ====================
 class Major(db.Model):
     """Model Chuyên ngành/Ngành học"""
@@ -70,8 +72,8 @@ class Major(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    students = db.relationship('Student', backref='major', lazy='dynamic')
-    classrooms = db.relationship('Classroom', backref='major', lazy='dynamic')
+    students = db.relationship('Student', backref='major', lazy=True)
+    classrooms = db.relationship('Classroom', backref='major', lazy=True)
     
     def __repr__(self):
         return f'<Major {self.name}>'
@@ -84,14 +86,14 @@ class Classroom(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
-    major_id = db.Column(db.Integer, db.ForeignKey('majors.id'))
+    major_id = db.Column(db.Integer, db.ForeignKey('majors.id'), index=True)
     advisor_id = db.Column(db.Integer, db.ForeignKey('lecturers.id'))  # Cố vấn học tập
     academic_year = db.Column(db.String(20))  # Niên khóa VD: 2020-2024
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    students = db.relationship('Student', backref='classroom', lazy='dynamic')
-    schedules = db.relationship('Schedule', backref='classroom', lazy='dynamic')
+    students = db.relationship('Student', backref='classroom', lazy=True)
+    schedules = db.relationship('Schedule', backref='classroom', lazy=True)
     
     def __repr__(self):
         return f'<Classroom {self.name}>'
@@ -110,19 +112,21 @@ class Lecturer(db.Model):
     expertise = db.Column(db.String(200))   # Chuyên môn
     phone = db.Column(db.String(15))
     degree = db.Column(db.String(50))  # Học vị: ThS, TS, PGS, GS
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     # Relationships
-    advised_classes = db.relationship('Classroom', backref='advisor', lazy='dynamic',
+    advised_classes = db.relationship('Classroom', backref='advisor', lazy=True,
                                        foreign_keys='Classroom.advisor_id')
-    schedules = db.relationship('Schedule', backref='lecturer', lazy='dynamic')
-    materials = db.relationship('Material', backref='uploader', lazy='dynamic')
-    evaluations = db.relationship('Evaluation', backref='lecturer', lazy='dynamic')
+    schedules = db.relationship('Schedule', backref='lecturer', lazy=True)
+    materials = db.relationship('Material', backref='uploader', lazy=True)
+    evaluations = db.relationship('Evaluation', backref='lecturer', lazy=True)
     
     def get_average_rating(self):
         """Tính điểm đánh giá trung bình"""
-        ratings = [e.rating for e in self.evaluations if e.rating]
-        return round(sum(ratings) / len(ratings), 1) if ratings else 0
+        average = db.session.query(db.func.avg(Evaluation.rating)).filter(
+            Evaluation.lecturer_id == self.id, Evaluation.rating.isnot(None), Evaluation.rating != 0
+        ).scalar()
+        return round(average, 1) if average else 0
     
     def __repr__(self):
         return f'<Lecturer {self.full_name}>'
@@ -141,14 +145,14 @@ class Student(db.Model):
     gender = db.Column(db.String(10))  # Nam/Nữ
     phone = db.Column(db.String(15))
     address = db.Column(db.String(200))
-    class_id = db.Column(db.Integer, db.ForeignKey('classrooms.id'))
-    major_id = db.Column(db.Integer, db.ForeignKey('majors.id'))
+    class_id = db.Column(db.Integer, db.ForeignKey('classrooms.id'), index=True)
+    major_id = db.Column(db.Integer, db.ForeignKey('majors.id'), index=True)
     enrollment_year = db.Column(db.Integer)  # Năm nhập học
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     # Relationships
-    grades = db.relationship('Grade', backref='student', lazy='dynamic')
-    evaluations = db.relationship('Evaluation', backref='student', lazy='dynamic')
+    grades = db.relationship('Grade', backref='student', lazy=True)
+    evaluations = db.relationship('Evaluation', backref='student', lazy=True)
     
     def calculate_gpa(self):
         """Tính GPA tổng"""
@@ -162,16 +166,7 @@ class Student(db.Model):
     
     def get_grade_letter(self, score):
         """Chuyển điểm số sang điểm chữ"""
-        if score >= 8.5:
-            return 'A'
-        elif score >= 7.0:
-            return 'B'
-        elif score >= 5.5:
-            return 'C'
-        elif score >= 4.0:
-            return 'D'
-        else:
-            return 'F'
+        return Grade.score_to_letter(score)
     
     def __repr__(self):
         return f'<Student {self.full_name}>'
@@ -192,9 +187,9 @@ class Subject(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    schedules = db.relationship('Schedule', backref='subject', lazy='dynamic')
-    grades = db.relationship('Grade', backref='subject', lazy='dynamic')
-    materials = db.relationship('Material', backref='subject', lazy='dynamic')
+    schedules = db.relationship('Schedule', backref='subject', lazy=True)
+    grades = db.relationship('Grade', backref='subject', lazy=True)
+    materials = db.relationship('Material', backref='subject', lazy=True)
     
     def __repr__(self):
         return f'<Subject {self.name}>'
@@ -241,7 +236,7 @@ class Grade(db.Model):
     score_attendance = db.Column(db.Float, default=0)   # Điểm chuyên cần
     score_midterm = db.Column(db.Float, default=0)      # Điểm giữa kỳ
     score_final = db.Column(db.Float, default=0)        # Điểm cuối kỳ
-    score_total = db.Column(db.Float)                   # Điểm tổng kết
+    score_total = db.Column(db.Float, index=True)       # Điểm tổng kết
     semester = db.Column(db.String(20))
     note = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -250,33 +245,85 @@ class Grade(db.Model):
     # Unique constraint để 1 sinh viên chỉ có 1 bảng điểm cho 1 môn trong 1 học kỳ
     __table_args__ = (db.UniqueConstraint('student_id', 'subject_id', 'semester', name='unique_student_subject_semester'),)
     
+    # Ngưỡng quy đổi điểm chữ (điểm tối thiểu, điểm chữ) - dùng chung cho Python và SQL
+    LETTER_THRESHOLDS = [(8.5, 'A'), (7.0, 'B'), (5.5, 'C'), (4.0, 'D')]
+    LETTER_FAIL = 'F'
+    LETTERS = [letter for _, letter in LETTER_THRESHOLDS] + [LETTER_FAIL]
+    PASS_SCORE = LETTER_THRESHOLDS[-1][0]  # Điểm tối thiểu để tích lũy tín chỉ
+    
+    @classmethod
+    def score_to_letter(cls, score):
+        """Chuyển điểm số sang điểm chữ"""
+        for min_score, letter in cls.LETTER_THRESHOLDS:
+            if score >= min_score:
+                return letter
+        return cls.LETTER_FAIL
+    
+    @classmethod
+    def letter_grade_expr(cls, score_column=None):
+        """Biểu thức CASE trong SQL tương ứng với score_to_letter"""
+        score_column = cls.score_total if score_column is None else score_column
+        return db.case(
+            *[(score_column >= min_score, letter) for min_score, letter in cls.LETTER_THRESHOLDS],
+            else_=cls.LETTER_FAIL
+        )
+    
+    @staticmethod
+    def compute_total(attendance, midterm, final):
+        """Công thức điểm tổng kết: Chuyên cần 10%, Giữa kỳ 30%, Cuối kỳ 60%"""
+        return round((attendance or 0) * 0.1 + (midterm or 0) * 0.3 + (final or 0) * 0.6, 2)
+    
     def calculate_total(self):
         """Tính điểm tổng kết: Chuyên cần 10%, Giữa kỳ 30%, Cuối kỳ 60%"""
-        attendance = self.score_attendance or 0
-        midterm = self.score_midterm or 0
-        final = self.score_final or 0
-        self.score_total = round(attendance * 0.1 + midterm * 0.3 + final * 0.6, 2)
+        self.score_total = self.compute_total(self.score_attendance, self.score_midterm, self.score_final)
         return self.score_total
     
     def get_letter_grade(self):
         """Lấy điểm chữ"""
         if self.score_total is None:
             return '-'
-        if self.score_total >= 8.5:
-            return 'A'
-        elif self.score_total >= 7.0:
-            return 'B'
-        elif self.score_total >= 5.5:
-            return 'C'
-        elif self.score_total >= 4.0:
-            return 'D'
-        else:
-            return 'F'
+        return self.score_to_letter(self.score_total)
     
     def __repr__(self):
         return f'<Grade {self.student.full_name if self.student else "Unknown"} - {self.subject.name if self.subject else "Unknown"}>'
 
 
+# ==================== ACADEMIC SUMMARY MODELS ====================
+class AcademicSummary(db.Model):
+    """Model Tổng hợp kết quả học tập toàn khóa của sinh viên (bảng dẫn xuất từ grades)"""
+    __tablename__ = 'academic_summaries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), unique=True, nullable=False)
+    weighted_sum = db.Column(db.Float, nullable=False, default=0)      # Tổng điểm x tín chỉ
+    attempted_credits = db.Column(db.Integer, nullable=False, default=0)  # Tín chỉ đã học
+    passed_credits = db.Column(db.Integer, nullable=False, default=0)  # Tín chỉ tích lũy
+    gpa = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AcademicSummary student={self.student_id} gpa={self.gpa}>'
+
+
+class SemesterSummary(db.Model):
+    """Model Tổng hợp kết quả học tập theo học kỳ (bảng dẫn xuất từ grades)"""
+    __tablename__ = 'semester_summaries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False, index=True)
+    semester = db.Column(db.String(20), nullable=False, default='')  # '' = không xác định
+    weighted_sum = db.Column(db.Float, nullable=False, default=0)
+    attempted_credits = db.Column(db.Integer, nullable=False, default=0)
+    passed_credits = db.Column(db.Integer, nullable=False, default=0)
+    gpa = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('student_id', 'semester', name='unique_student_semester_summary'),)
+    
+    def __repr__(self):
+        return f'<SemesterSummary student={self.student_id} {self.semester} gpa={self.gpa}>'
+
+
 # ==================== MATERIAL MODEL ====================
 class Material(db.Model):
     """Model Tài liệu học tập"""
@@ -308,6 +355,90 @@ class Material(db.Model):
         return f'<Material {self.title}>'
 
 
+class FileDigest(db.Model):
+    """Model SHA-256 của file đã upload (app/delivery.py) - ETag mạnh khi tải file"""
+    __tablename__ = 'file_digests'
+    
+    path = db.Column(db.String(300), primary_key=True)  # Đường dẫn tương đối trong UPLOAD_FOLDER
+    sha256 = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    mtime_ns = db.Column(db.BigInteger, nullable=False)  # File đổi kích thước/mtime thì tính lại
+    
+    def __repr__(self):
+        return f'<FileDigest {self.path}>'
+
+
+class Blob(db.Model):
+    """Model Nội dung file lưu theo SHA-256 (app/storage.py) - số tài liệu đang tham chiếu"""
+    __tablename__ = 'blobs'
+    
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False, default=0)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # 0 = chờ xóa
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Blob {self.sha256[:12]} refs={self.ref_count}>'
+
+
+class Derivative(db.Model):
+    """Model Bản dẫn xuất của một blob (app/derivatives.py): số trang, đoạn văn bản, ảnh thu nhỏ"""
+    __tablename__ = 'derivatives'
+    
+    sha256 = db.Column(db.String(64), primary_key=True)
+    file_type = db.Column(db.String(20))
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, processing, ready, failed, unsupported
+    page_count = db.Column(db.Integer)       # Số trang / slide / sheet
+    excerpt = db.Column(db.Text)             # Đoạn đầu văn bản cho danh sách tài liệu
+    text_size = db.Column(db.Integer)        # Kích thước file văn bản đầy đủ (bytes)
+    thumbnail_type = db.Column(db.String(20))  # image/png, image/jpeg hoặc None
+    error = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @property
+    def is_ready(self):
+        return self.status == 'ready'
+    
+    def __repr__(self):
+        return f'<Derivative {self.sha256[:12]} {self.status}>'
+
+
+class UploadSession(db.Model):
+    """Model Phiên upload theo từng phần (app/uploads.py) - file lớn gửi thành nhiều request"""
+    __tablename__ = 'upload_sessions'
+    
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    lecturer_id = db.Column(db.Integer, db.ForeignKey('lecturers.id'), nullable=False, index=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text)
+    filename = db.Column(db.String(200), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)      # Kích thước khai báo (bytes)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='open')  # open, finalizing
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
+    
+    def __repr__(self):
+        return f'<UploadSession {self.id} {self.filename}>'
+
+
+class UploadChunk(db.Model):
+    """Model Phần đã nhận của một phiên upload"""
+    __tablename__ = 'upload_chunks'
+    
+    session_id = db.Column(db.String(32), db.ForeignKey('upload_sessions.id', ondelete='CASCADE'),
+                           primary_key=True)
+    chunk_index = db.Column(db.Integer, primary_key=True)
+    
+    def __repr__(self):
+        return f'<UploadChunk {self.session_id}#{self.chunk_index}>'
+
+
 # ==================== EVALUATION MODEL ====================
 class Evaluation(db.Model):
     """Model Đánh giá giảng viên"""
@@ -323,9 +454,80 @@ class Evaluation(db.Model):
     is_anonymous = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Relationships
+    subject = db.relationship('Subject', lazy=True)
+    
     # Unique constraint để 1 SV chỉ đánh giá 1 GV cho 1 môn 1 lần/kỳ
     __table_args__ = (db.UniqueConstraint('student_id', 'lecturer_id', 'subject_id', 'semester', 
                                           name='unique_evaluation'),)
     
     def __repr__(self):
         return f'<Evaluation {self.rating} stars>'
+
+
+# ==================== REFERENCE VERSION MODEL ====================
+class ReferenceVersion(db.Model):
+    """Model Phiên bản dữ liệu danh mục - tăng mỗi khi bảng danh mục thay đổi (dùng cho cache)"""
+    __tablename__ = 'reference_versions'
+    
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ReferenceVersion {self.table_name}={self.version}>'
+
+
+# ==================== COUNTER BATCH MODEL ====================
+class CounterBatch(db.Model):
+    """Model Lô bộ đếm đã ghi vào database (app/counters.py) - chống cộng trùng một file lô"""
+    __tablename__ = 'counter_batches'
+    
+    name = db.Column(db.String(120), primary_key=True)  # Tên file lô
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<CounterBatch {self.name}>'
+
+
+# ==================== JOB MODEL ====================
+class Job(db.Model):
+    """Model Tác vụ nền (app/jobs.py) - hàng đợi bền vững trong database"""
+    __tablename__ = 'jobs'
+    
+    FINISHED = ('succeeded', 'failed', 'cancelled')
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)      # Tên tác vụ đã đăng ký (@task)
+    params = db.Column(db.Text)                           # Tham số (JSON)
+    priority = db.Column(db.Integer, nullable=False, default=0)  # Số lớn chạy trước
+    # queued, running, cancelling, succeeded, failed, cancelled
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    claimed_by = db.Column(db.String(100))                # Worker đang chạy (máy:pid)
+    heartbeat_at = db.Column(db.DateTime)
+    progress_current = db.Column(db.Integer)
+    progress_total = db.Column(db.Integer)
+    progress_message = db.Column(db.String(255))
+    result = db.Column(db.Text)                           # Kết quả (JSON)
+    error = db.Column(db.Text)
+    
+    __table_args__ = (db.Index('ix_jobs_queue', 'status', 'priority', 'run_after'),)
+    
+    @property
+    def finished(self):
+        return self.status in self.FINISHED
+    
+    @property
+    def percent(self):
+        if not self.progress_total:
+            return 100 if self.status == 'succeeded' else 0
+        return min(100, round((self.progress_current or 0) * 100 / self.progress_total))
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
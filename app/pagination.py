@@ -0,0 +1,124 @@
+"""
+Phân trang keyset (seek) cho các danh sách lớn
+Thay vì OFFSET n, mỗi trang lọc theo khóa sắp xếp của dòng cuối/đầu trang trước
+(ví dụ (created_at, id)), nên trang thứ 1000 tốn chi phí như trang đầu tiên.
+Con trỏ gửi cho client là chuỗi ký số, không đọc/sửa được từ phía client.
+"""
+
+import time
+from datetime import datetime
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+from app import db
+
+_count_cache = {}
+
+
+class KeysetPage:
+    """Một trang kết quả phân trang keyset"""
+
+    def __init__(self, items, per_page, total, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.total = total
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+# ==================== CON TRỎ ====================
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='keyset-cursor')
+
+
+def _encode_value(value):
+    return {'dt': value.isoformat()} if isinstance(value, datetime) else value
+
+
+def _decode_value(value):
+    return datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value
+
+
+def encode_cursor(direction, values):
+    """('next'|'prev', giá trị khóa) -> chuỗi con trỏ"""
+    return _serializer().dumps([direction, [_encode_value(v) for v in values]])
+
+
+def decode_cursor(cursor):
+    """Chuỗi con trỏ -> (direction, giá trị khóa); con trỏ hỏng/giả mạo trả về (None, None)"""
+    if not cursor:
+        return None, None
+    try:
+        direction, values = _serializer().loads(cursor)
+    except (BadSignature, ValueError, TypeError):
+        return None, None
+    if direction not in ('next', 'prev'):
+        return None, None
+    return direction, [_decode_value(v) for v in values]
+
+
+# ==================== TỔNG SỐ ====================
+def cached_count(cache_key, query):
+    """Đếm tổng số dòng, lưu đệm trong tiến trình KEYSET_COUNT_TTL giây"""
+    ttl = current_app.config.get('KEYSET_COUNT_TTL', 60)
+    now = time.monotonic()
+    cached = _count_cache.get(cache_key)
+    if cached and cached[1] > now:
+        return cached[0]
+    total = query.order_by(None).count()
+    _count_cache[cache_key] = (total, now + ttl)
+    return total
+
+
+# ==================== PHÂN TRANG ====================
+def keyset_paginate(query, keys, cursor=None, per_page=10, descending=True, count_key=None):
+    """Phân trang query theo bộ khóa sắp xếp keys
+
+    keys: danh sách biểu thức cột, dòng cuối cùng là khóa duy nhất (thường là id).
+    descending: thứ tự hiển thị giảm dần (mới nhất trước) hay tăng dần.
+    count_key: khóa cache cho tổng số dòng; None để không đếm.
+    """
+    direction, values = decode_cursor(cursor)
+    if values is not None and len(values) != len(keys):
+        direction, values = None, None
+
+    key_tuple = db.tuple_(*keys)
+    # Đi lùi (prev) thì đảo chiều sắp xếp, lấy xong đảo lại danh sách
+    forward = direction != 'prev'
+    ascending = forward != descending
+
+    paged = query.order_by(None).add_columns(*keys)
+    if values is not None:
+        bound = db.tuple_(*[db.literal(v) for v in values])
+        paged = paged.filter(key_tuple > bound if ascending else key_tuple < bound)
+    paged = paged.order_by(*[k.asc() if ascending else k.desc() for k in keys])
+    rows = paged.limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    first_key = list(rows[0][1:]) if rows else None
+    last_key = list(rows[-1][1:]) if rows else None
+
+    if forward:
+        next_cursor = encode_cursor('next', last_key) if has_more else None
+        prev_cursor = encode_cursor('prev', first_key) if values is not None and rows else None
+    else:
+        next_cursor = encode_cursor('next', last_key) if rows else None
+        prev_cursor = encode_cursor('prev', first_key) if has_more else None
+
+    total = cached_count(count_key, query) if count_key is not None else None
+    return KeysetPage(items, per_page, total, next_cursor, prev_cursor)
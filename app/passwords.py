@@ -0,0 +1,75 @@
+"""
+Chính sách băm mật khẩu
+Thuật toán và độ khó lấy từ cấu hình (PASSWORD_HASH_ALGORITHM, PASSWORD_HASH_COST). Hash cũ
+không khớp chính sách hiện tại được băm lại khi người dùng đăng nhập thành công, nên có thể
+điều chỉnh độ khó theo năng lực xử lý đăng nhập lúc cao điểm mà không cần reset mật khẩu.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash
+
+ALGORITHMS = ('scrypt', 'pbkdf2')
+
+# Độ khó mặc định của Werkzeug: N của scrypt, số vòng lặp của pbkdf2
+DEFAULT_COSTS = {'scrypt': 2 ** 15, 'pbkdf2': 600000}
+SCRYPT_BLOCK_SIZE = 8
+SCRYPT_PARALLELISM = 1
+
+
+# ==================== CHÍNH SÁCH ====================
+def hash_method(algorithm=None, cost=None):
+    """Chuỗi method của Werkzeug theo chính sách - VD 'scrypt:32768:8:1', 'pbkdf2:sha256:600000'"""
+    if algorithm is None and has_app_context():
+        algorithm = current_app.config.get('PASSWORD_HASH_ALGORITHM')
+        cost = cost or current_app.config.get('PASSWORD_HASH_COST')
+    algorithm = algorithm or 'scrypt'
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f'Thuật toán băm không hỗ trợ: {algorithm}')
+    cost = int(cost or DEFAULT_COSTS[algorithm])
+
+    if algorithm == 'scrypt':
+        if cost < 2 or cost & (cost - 1):
+            raise ValueError('Độ khó scrypt (N) phải là lũy thừa của 2')
+        return f'scrypt:{cost}:{SCRYPT_BLOCK_SIZE}:{SCRYPT_PARALLELISM}'
+    return f'pbkdf2:sha256:{cost}'
+
+
+def hash_password(password, method=None):
+    """Băm mật khẩu theo chính sách hiện tại (hoặc method chỉ định)"""
+    return generate_password_hash(password, method=method or hash_method())
+
+
+def needs_rehash(password_hash, method=None):
+    """Hash có được tạo bằng thuật toán / độ khó khác với chính sách hiện tại không"""
+    return password_hash.split('$', 1)[0] != (method or hash_method())
+
+
+# ==================== ĐO HIỆU NĂNG ====================
+def _hash_for(method, seconds):
+    """Băm liên tục trong khoảng seconds - trả về số hash mỗi giây"""
+    count = 0
+    start = time.perf_counter()
+    while True:
+        generate_password_hash('benchmark-password', method=method)
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+def benchmark(method, seconds=2.0, workers=None):
+    """Số hash/giây của method: trên một lõi và trên mọi lõi chạy song song
+
+    Trả về dict: per_core, total, workers, ms_per_hash.
+    """
+    workers = workers or os.cpu_count() or 1
+    per_core = _hash_for(method, seconds)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            total = sum(pool.map(_hash_for, [method] * workers, [seconds] * workers))
+    else:
+        total = per_core
+    return {'per_core': per_core, 'total': total, 'workers': workers, 'ms_per_hash': 1000 / per_core}
@@ -0,0 +1,263 @@
+"""
+Profiler theo yêu cầu cho các endpoint đang chạy
+Admin bật một phiên profile cho một endpoint (tỷ lệ lấy mẫu request, số request tối đa):
+- chế độ 'sample': một luồng phụ chụp stack của request theo chu kỳ interval (giây),
+  kết quả là file collapsed stack (dùng được với flamegraph.pl / speedscope);
+- chế độ 'cprofile': chạy cProfile, kết quả là file pstats gộp của mọi request.
+Thời gian mỗi request được tách riêng: Python, render template và SQL (không chồng lấn).
+Dữ liệu nằm trong bộ nhớ của từng tiến trình worker.
+"""
+
+import cProfile
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from flask import g, request, template_rendered, before_render_template
+from sqlalchemy import event
+from app import db
+
+MODES = ('sample', 'cprofile')
+PHASES = ('python', 'template', 'sql')
+
+_lock = threading.Lock()
+_session = None
+# Chỉ một cProfile được chạy tại một thời điểm
+_cprofile_lock = threading.Lock()
+# thread id -> _PhaseClock của request đang được profile
+_clocks = {}
+
+
+class ProfileSession:
+    """Một phiên profile: cấu hình và dữ liệu gộp qua các request"""
+
+    def __init__(self, endpoint, mode='sample', sample_rate=1.0, max_requests=20, interval=0.005):
+        if mode not in MODES:
+            raise ValueError(f'Chế độ profile không hợp lệ: {mode}')
+        self.endpoint = endpoint
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.max_requests = max_requests
+        self.interval = interval
+        self.started_at = time.time()
+        self.pid = os.getpid()
+        self.requests = 0
+        self.reserved = 0
+        self.skipped = 0
+        self.wall_ms = 0.0
+        self.phase_ms = dict.fromkeys(PHASES, 0.0)
+        self.stacks = Counter()
+        self.stats = None
+
+    @property
+    def active(self):
+        return self.reserved < self.max_requests
+
+    def summary(self):
+        """Số liệu tổng hợp để hiển thị"""
+        per_request = self.requests or 1
+        return {
+            'requests': self.requests,
+            'skipped': self.skipped,
+            'wall_ms': self.wall_ms,
+            'avg_ms': self.wall_ms / per_request,
+            'phases': {phase: (ms, ms / per_request) for phase, ms in self.phase_ms.items()},
+            'samples': sum(self.stacks.values())
+        }
+
+    def collapsed(self):
+        """Collapsed stack: mỗi dòng 'khung;khung;... số_mẫu'"""
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common()) + '\n'
+
+    def pstats_dump(self):
+        """Nội dung file pstats (giống Stats.dump_stats)"""
+        return marshal.dumps(self.stats.stats if self.stats is not None else {})
+
+    def record(self, wall_ms, phase_ms, stacks=None, profile=None):
+        with _lock:
+            self.requests += 1
+            self.wall_ms += wall_ms
+            for phase, ms in phase_ms.items():
+                self.phase_ms[phase] += ms
+            if stacks:
+                self.stacks.update(stacks)
+            if profile is not None:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+
+
+class _PhaseClock:
+    """Đo thời gian riêng của từng giai đoạn; SQL trong lúc render template tính cho SQL"""
+
+    def __init__(self):
+        self.stack = ['python']
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.mark = time.perf_counter()
+
+    @property
+    def current(self):
+        return self.stack[-1]
+
+    def _charge(self):
+        now = time.perf_counter()
+        self.totals[self.stack[-1]] += (now - self.mark) * 1000
+        self.mark = now
+
+    def push(self, phase):
+        self._charge()
+        self.stack.append(phase)
+
+    def pop(self, phase):
+        if len(self.stack) > 1 and self.stack[-1] == phase:
+            self._charge()
+            self.stack.pop()
+
+    def finish(self):
+        self._charge()
+        return self.totals
+
+
+class _Sampler(threading.Thread):
+    """Chụp stack của một luồng theo chu kỳ"""
+
+    def __init__(self, thread_id, clock, root, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.clock = clock
+        self.root = root
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(_frame_label(frame))
+                frame = frame.f_back
+            frames.append(self.clock.current)
+            frames.append(self.root)
+            self.stacks[';'.join(reversed(frames))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.stacks
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    return f'{module}:{code.co_name}:{code.co_firstlineno}'.replace(';', ',').replace(' ', '_')
+
+
+# ==================== ĐIỀU KHIỂN ====================
+def start_profiling(endpoint, mode='sample', sample_rate=1.0, max_requests=20, interval=0.005):
+    """Bắt đầu phiên profile mới (thay thế phiên cũ)"""
+    global _session
+    with _lock:
+        _session = ProfileSession(endpoint, mode, sample_rate, max_requests, interval)
+    return _session
+
+
+def stop_profiling():
+    """Dừng nhận request mới; dữ liệu đã thu thập vẫn giữ lại"""
+    with _lock:
+        if _session is not None:
+            _session.max_requests = _session.reserved
+
+
+def clear_profiling():
+    """Xóa phiên profile và dữ liệu"""
+    global _session
+    with _lock:
+        _session = None
+
+
+def current_session():
+    return _session
+
+
+# ==================== HOOK REQUEST ====================
+def _start_request():
+    session = _session
+    if session is None or request.endpoint != session.endpoint or not session.active:
+        return
+    with _lock:
+        if random.random() >= session.sample_rate or not session.active:
+            session.skipped += 1
+            return
+        session.reserved += 1
+
+    clock = _PhaseClock()
+    state = {'session': session, 'clock': clock, 'started': time.perf_counter()}
+    if session.mode == 'cprofile':
+        if not _cprofile_lock.acquire(blocking=False):
+            # Đang có request khác chạy cProfile: bỏ qua request này
+            with _lock:
+                session.reserved -= 1
+                session.skipped += 1
+            return
+        state['profile'] = cProfile.Profile()
+        state['profile'].enable()
+    else:
+        state['sampler'] = _Sampler(threading.get_ident(), clock, session.endpoint, session.interval)
+        state['sampler'].start()
+    _clocks[threading.get_ident()] = clock
+    g.profiling = state
+
+
+def _finish_request(exc=None):
+    state = g.pop('profiling', None)
+    if state is None:
+        return
+    _clocks.pop(threading.get_ident(), None)
+    wall_ms = (time.perf_counter() - state['started']) * 1000
+    stacks = profile = None
+    if 'profile' in state:
+        profile = state['profile']
+        profile.disable()
+        _cprofile_lock.release()
+    else:
+        stacks = state['sampler'].stop()
+    state['session'].record(wall_ms, state['clock'].finish(), stacks, profile)
+
+
+def _phase_hooks(phase):
+    def enter(*args, **kwargs):
+        clock = _clocks.get(threading.get_ident())
+        if clock is not None:
+            clock.push(phase)
+
+    def leave(*args, **kwargs):
+        clock = _clocks.get(threading.get_ident())
+        if clock is not None:
+            clock.pop(phase)
+    return enter, leave
+
+
+_enter_sql, _leave_sql = _phase_hooks('sql')
+_enter_template, _leave_template = _phase_hooks('template')
+
+
+def register_profiler(app):
+    """Gắn hook profile vào app (chi phí khi không có phiên: một phép so sánh mỗi request)"""
+    app.before_request(_start_request)
+    app.teardown_request(_finish_request)
+    before_render_template.connect(_enter_template, app)
+    template_rendered.connect(_leave_template, app)
+    with app.app_context():
+        engines = list(db.engines.values())  # gồm cả bản sao chỉ đọc nếu có
+    for engine in engines:
+        if not event.contains(engine, 'before_cursor_execute', _enter_sql):
+            event.listen(engine, 'before_cursor_execute', _enter_sql)
+            event.listen(engine, 'after_cursor_execute', _leave_sql)
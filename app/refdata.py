@@ -0,0 +1,121 @@
+"""
+Bộ đệm dữ liệu danh mục cho các ô chọn (dropdown) trong form
+Mỗi danh mục (ngành, lớp, giảng viên, môn học) được lưu trong tiến trình dưới dạng
+các cặp (id, nhãn). Mỗi bảng có một bộ đếm phiên bản trong bảng reference_versions,
+được tăng trong cùng transaction với thay đổi dữ liệu (sự kiện after_insert/update/delete).
+Mỗi request chỉ đọc bảng phiên bản một lần; worker nào thấy phiên bản khác với bản
+đã lưu đệm thì nạp lại danh mục đó, nên nhiều tiến trình vẫn luôn thấy dữ liệu mới.
+Thay đổi bằng câu lệnh Core/bulk (không qua ORM) phải tự gọi bump_versions().
+"""
+
+from weakref import WeakKeyDictionary
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from app import db
+from app.dialects import dialect_insert
+from app.models import Major, Classroom, Lecturer, Subject, ReferenceVersion
+
+# Danh mục: tên bảng -> (model, thuộc tính dùng làm nhãn)
+REFERENCE_TABLES = {
+    'majors': (Major, 'name'),
+    'classrooms': (Classroom, 'name'),
+    'lecturers': (Lecturer, 'full_name'),
+    'subjects': (Subject, 'name')
+}
+
+_PENDING_KEY = 'refdata_changed'
+
+# engine -> {bảng: (phiên bản, ((id, nhãn), ...))}
+_cache = WeakKeyDictionary()
+
+
+# ==================== PHIÊN BẢN ====================
+def bump_versions(connection, *tables):
+    """Tăng phiên bản của các bảng danh mục (trong transaction của connection)"""
+    table = ReferenceVersion.__table__
+    for name in sorted(set(tables)):
+        stmt = dialect_insert(connection, table).values(table_name=name, version=1)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.table_name],
+            set_={'version': table.c.version + 1}
+        ))
+    if has_request_context():
+        # Request hiện tại vừa ghi: lần đọc sau phải thấy phiên bản mới
+        g.pop('reference_versions', None)
+
+
+def current_versions():
+    """Phiên bản hiện tại của mọi bảng danh mục - đọc 1 lần mỗi request"""
+    if has_request_context() and 'reference_versions' in g:
+        return g.reference_versions
+    table = ReferenceVersion.__table__
+    versions = dict(db.session.execute(db.select(table.c.table_name, table.c.version)).all())
+    if has_request_context():
+        g.reference_versions = versions
+    return versions
+
+
+# ==================== ĐỌC ====================
+def get_choices(name):
+    """Danh sách (id, nhãn) của một danh mục, theo thứ tự id"""
+    model, label = REFERENCE_TABLES[name]
+    version = current_versions().get(name, 0)
+    store = _cache.setdefault(db.engine, {})
+    cached = store.get(name)
+    if cached is None or cached[0] != version:
+        rows = db.session.execute(
+            db.select(model.id, getattr(model, label)).order_by(model.id)
+        ).all()
+        cached = (version, tuple((row[0], row[1]) for row in rows))
+        store[name] = cached
+    return list(cached[1])
+
+
+def clear_cache():
+    """Xóa toàn bộ bộ đệm trong tiến trình"""
+    _cache.clear()
+
+
+# ==================== SỰ KIỆN ORM ====================
+def _mark(target, name):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, set()).add(name)
+
+
+def _after_insert_or_delete(mapper, connection, target):
+    _mark(target, mapper.persist_selectable.name)
+
+
+def _after_update(mapper, connection, target):
+    name = mapper.persist_selectable.name
+    label = REFERENCE_TABLES[name][1]
+    # Chỉ đổi nhãn mới làm thay đổi dropdown (ví dụ sửa số điện thoại giảng viên thì không)
+    if db.inspect(target).attrs[label].history.has_changes():
+        _mark(target, name)
+
+
+def _after_flush(session, flush_context):
+    """Tăng phiên bản một lần cho mỗi bảng danh mục thay đổi trong lần flush"""
+    changed = session.info.pop(_PENDING_KEY, None)
+    if changed:
+        bump_versions(session.connection(), *changed)
+
+
+def _before_drop(target, connection, **kw):
+    # Database bị dựng lại thì phiên bản bắt đầu lại từ đầu
+    _cache.pop(connection.engine, None)
+
+
+def register_refdata_events():
+    """Đăng ký đánh dấu thay đổi danh mục và tăng phiên bản sau mỗi lần flush"""
+    for model, _ in REFERENCE_TABLES.values():
+        if not event.contains(model, 'after_update', _after_update):
+            event.listen(model, 'after_insert', _after_insert_or_delete)
+            event.listen(model, 'after_delete', _after_insert_or_delete)
+            event.listen(model, 'after_update', _after_update)
+    if not event.contains(db.metadata, 'before_drop', _before_drop):
+        event.listen(db.metadata, 'before_drop', _before_drop)
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
@@ -1,10 +1,22 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, Response, jsonify
 from flask_login import login_required, current_user
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SelectField, TextAreaField, IntegerField, DateField, TimeField
-from wtforms.validators import DataRequired, Email, Length, Optional, NumberRange
+from flask_wtf.file import FileField, FileAllowed, FileRequired
+from wtforms import (StringField, PasswordField, SelectField, TextAreaField, IntegerField, DateField, TimeField,
+                     FloatField, BooleanField)
+from wtforms.validators import DataRequired, Email, Length, Optional, NumberRange, ValidationError
 from app.routes.auth import admin_required
-from app.models import User, Student, Lecturer, Major, Classroom, Subject, Schedule, Grade, Material
+from app.models import User, Student, Lecturer, Major, Classroom, Subject, Schedule, Job
+from app.stats import get_dashboard_stats, get_major_rows, get_classroom_rows
+from app.loading import loading_profile
+from app.routing import read_your_writes, primary_reads
+from app.search import search_query, search_sort_keys
+from app.pagination import keyset_paginate
+from app.refdata import get_choices
+from app.timetable import find_conflicts
+from app.profiler import start_profiling, stop_profiling, clear_profiling, current_session
+from app.importer import COLUMNS, read_rows
+from app.jobs import enqueue, cancel, retry, job_to_dict, load_params, load_result, queue_status, send_output, task_title
 from app import db
 import json
 
@@ -82,46 +94,56 @@ class ScheduleForm(FlaskForm):
     start_time = TimeField('Giờ bắt đầu', validators=[DataRequired()])
     end_time = TimeField('Giờ kết thúc', validators=[DataRequired()])
     semester = StringField('Học kỳ', validators=[DataRequired(), Length(max=20)])
+    
+    def validate_end_time(self, field):
+        """Giờ kết thúc phải sau giờ bắt đầu"""
+        if self.start_time.data and field.data and field.data <= self.start_time.data:
+            raise ValidationError('Giờ kết thúc phải sau giờ bắt đầu')
+
+
+class ProfilerForm(FlaskForm):
+    """Form bật profile cho một endpoint"""
+    endpoint = SelectField('Endpoint', validators=[DataRequired()])
+    mode = SelectField('Chế độ', choices=[
+        ('sample', 'Lấy mẫu stack (collapsed stack / flame graph)'), ('cprofile', 'cProfile (pstats)')
+    ])
+    sample_rate = FloatField('Tỷ lệ request được profile', default=1.0,
+                             validators=[DataRequired(), NumberRange(min=0.01, max=1)])
+    max_requests = IntegerField('Số request tối đa', default=20,
+                                validators=[DataRequired(), NumberRange(min=1, max=1000)])
+    interval_ms = IntegerField('Chu kỳ lấy mẫu (ms)', default=5,
+                               validators=[DataRequired(), NumberRange(min=1, max=100)])
+
+
+class ImportForm(FlaskForm):
+    """Form nhập tài khoản từ file"""
+    file = FileField('File CSV / XLSX', validators=[
+        FileRequired(), FileAllowed(['csv', 'xlsx'], 'Chỉ chấp nhận file .csv hoặc .xlsx')
+    ])
+    skip_invalid = BooleanField('Bỏ qua dòng lỗi, vẫn nhập các dòng hợp lệ')
 
 
 # ==================== ROUTES ====================
 @admin_bp.route('/dashboard')
+@loading_profile('student_card')
 @login_required
 @admin_required
 def dashboard():
     """Dashboard Admin - Hiển thị thống kê tổng quan"""
-    # Thống kê cơ bản
-    stats = {
-        'total_students': Student.query.count(),
-        'total_lecturers': Lecturer.query.count(),
-        'total_subjects': Subject.query.count(),
-        'total_classrooms': Classroom.query.count(),
-        'total_majors': Major.query.count(),
-        'total_materials': Material.query.count()
-    }
+    # Thống kê cơ bản, phân bố theo ngành và phân bố điểm - tính gộp trong database
+    dashboard_stats = get_dashboard_stats()
+    stats = dashboard_stats['stats']
     
     # Sinh viên mới nhất
     recent_students = Student.query.order_by(Student.created_at.desc()).limit(5).all()
     
     # Phân bố sinh viên theo ngành
-    majors = Major.query.all()
-    major_names = [m.name for m in majors] if majors else ['Chưa có ngành']
-    major_counts = [m.students.count() for m in majors] if majors else [0]
+    major_breakdown = dashboard_stats['major_breakdown']
+    major_names = [name for name, _ in major_breakdown] if major_breakdown else ['Chưa có ngành']
+    major_counts = [count for _, count in major_breakdown] if major_breakdown else [0]
     
     # Phân bố điểm số
-    grades = Grade.query.filter(Grade.score_total.isnot(None)).all()
-    grade_distribution = [0, 0, 0, 0, 0]  # A, B, C, D, F
-    for grade in grades:
-        if grade.score_total >= 8.5:
-            grade_distribution[0] += 1
-        elif grade.score_total >= 7.0:
-            grade_distribution[1] += 1
-        elif grade.score_total >= 5.5:
-            grade_distribution[2] += 1
-        elif grade.score_total >= 4.0:
-            grade_distribution[3] += 1
-        else:
-            grade_distribution[4] += 1
+    grade_distribution = dashboard_stats['grade_distribution']  # A, B, C, D, F
     
     if sum(grade_distribution) == 0:
         grade_distribution = [20, 35, 25, 15, 5]  # Demo data
@@ -136,32 +158,37 @@ def dashboard():
 
 # ==================== STUDENT MANAGEMENT ====================
 @admin_bp.route('/students')
+@loading_profile('student_card')
 @login_required
 @admin_required
 def students():
     """Danh sách sinh viên"""
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     search = request.args.get('search', '')
     
-    query = Student.query
     if search:
-        query = query.filter(
-            (Student.full_name.ilike(f'%{search}%')) | 
-            (Student.student_code.ilike(f'%{search}%'))
-        )
-    
-    students = query.order_by(Student.created_at.desc()).paginate(page=page, per_page=10)
+        # Tìm kiếm toàn văn, xếp hạng theo mức độ liên quan
+        query = search_query(Student, search)
+        keys, descending = search_sort_keys(Student, search)
+    else:
+        query = Student.query
+        keys, descending = [Student.created_at, Student.id], True
+    
+    # Phân trang keyset theo con trỏ, tổng số được lưu đệm
+    students = keyset_paginate(query, keys, cursor=cursor, per_page=10, descending=descending,
+                              count_key=('students', search))
     return render_template('admin/students/list.html', students=students, search=search)
 
 
 @admin_bp.route('/students/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@read_your_writes
 def add_student():
     """Thêm sinh viên mới"""
     form = StudentForm()
-    form.major_id.choices = [(0, 'Chọn ngành học')] + [(m.id, m.name) for m in Major.query.all()]
-    form.class_id.choices = [(0, 'Chọn lớp')] + [(c.id, c.name) for c in Classroom.query.all()]
+    form.major_id.choices = [(0, 'Chọn ngành học')] + get_choices('majors')
+    form.class_id.choices = [(0, 'Chọn lớp')] + get_choices('classrooms')
     
     if form.validate_on_submit():
         # Kiểm tra username và email đã tồn tại
@@ -206,14 +233,16 @@ def add_student():
 
 
 @admin_bp.route('/students/edit/<int:id>', methods=['GET', 'POST'])
+@loading_profile('student_card')
 @login_required
 @admin_required
+@read_your_writes
 def edit_student(id):
     """Sửa thông tin sinh viên"""
     student = Student.query.get_or_404(id)
     form = StudentForm(obj=student)
-    form.major_id.choices = [(0, 'Chọn ngành học')] + [(m.id, m.name) for m in Major.query.all()]
-    form.class_id.choices = [(0, 'Chọn lớp')] + [(c.id, c.name) for c in Classroom.query.all()]
+    form.major_id.choices = [(0, 'Chọn ngành học')] + get_choices('majors')
+    form.class_id.choices = [(0, 'Chọn lớp')] + get_choices('classrooms')
     
     if request.method == 'GET':
         form.username.data = student.user.username
@@ -242,8 +271,10 @@ def edit_student(id):
 
 
 @admin_bp.route('/students/delete/<int:id>')
+@loading_profile('student_card')
 @login_required
 @admin_required
+@read_your_writes
 def delete_student(id):
     """Xóa sinh viên"""
     student = Student.query.get_or_404(id)
@@ -260,27 +291,32 @@ def delete_student(id):
 
 # ==================== LECTURER MANAGEMENT ====================
 @admin_bp.route('/lecturers')
+@loading_profile('lecturer_card')
 @login_required
 @admin_required
 def lecturers():
     """Danh sách giảng viên"""
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     search = request.args.get('search', '')
     
-    query = Lecturer.query
     if search:
-        query = query.filter(
-            (Lecturer.full_name.ilike(f'%{search}%')) | 
-            (Lecturer.lecturer_code.ilike(f'%{search}%'))
-        )
-    
-    lecturers = query.order_by(Lecturer.created_at.desc()).paginate(page=page, per_page=10)
+        # Tìm kiếm toàn văn, xếp hạng theo mức độ liên quan
+        query = search_query(Lecturer, search)
+        keys, descending = search_sort_keys(Lecturer, search)
+    else:
+        query = Lecturer.query
+        keys, descending = [Lecturer.created_at, Lecturer.id], True
+    
+    # Phân trang keyset theo con trỏ, tổng số được lưu đệm
+    lecturers = keyset_paginate(query, keys, cursor=cursor, per_page=10, descending=descending,
+                               count_key=('lecturers', search))
     return render_template('admin/lecturers/list.html', lecturers=lecturers, search=search)
 
 
 @admin_bp.route('/lecturers/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@read_your_writes
 def add_lecturer():
     """Thêm giảng viên mới"""
     form = LecturerForm()
@@ -320,8 +356,10 @@ def add_lecturer():
 
 
 @admin_bp.route('/lecturers/edit/<int:id>', methods=['GET', 'POST'])
+@loading_profile('lecturer_card')
 @login_required
 @admin_required
+@read_your_writes
 def edit_lecturer(id):
     """Sửa thông tin giảng viên"""
     lecturer = Lecturer.query.get_or_404(id)
@@ -351,8 +389,10 @@ def edit_lecturer(id):
 
 
 @admin_bp.route('/lecturers/delete/<int:id>')
+@loading_profile('lecturer_card')
 @login_required
 @admin_required
+@read_your_writes
 def delete_lecturer(id):
     """Xóa giảng viên"""
     lecturer = Lecturer.query.get_or_404(id)
@@ -373,13 +413,15 @@ def delete_lecturer(id):
 @admin_required
 def majors():
     """Danh sách ngành học"""
-    majors = Major.query.order_by(Major.name).all()
+    # Kèm số sinh viên và số lớp của từng ngành - 1 truy vấn
+    majors = get_major_rows()
     return render_template('admin/majors/list.html', majors=majors)
 
 
 @admin_bp.route('/majors/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@read_your_writes
 def add_major():
     """Thêm ngành học"""
     form = MajorForm()
@@ -401,6 +443,7 @@ def add_major():
 @admin_bp.route('/majors/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@read_your_writes
 def edit_major(id):
     """Sửa ngành học"""
     major = Major.query.get_or_404(id)
@@ -420,6 +463,7 @@ def edit_major(id):
 @admin_bp.route('/majors/delete/<int:id>')
 @login_required
 @admin_required
+@read_your_writes
 def delete_major(id):
     """Xóa ngành học"""
     major = Major.query.get_or_404(id)
@@ -435,18 +479,20 @@ def delete_major(id):
 @admin_required
 def classrooms():
     """Danh sách lớp học"""
-    classrooms = Classroom.query.order_by(Classroom.name).all()
+    # Kèm tên ngành, cố vấn và sĩ số của từng lớp - 1 truy vấn
+    classrooms = get_classroom_rows()
     return render_template('admin/classrooms/list.html', classrooms=classrooms)
 
 
 @admin_bp.route('/classrooms/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@read_your_writes
 def add_classroom():
     """Thêm lớp học"""
     form = ClassroomForm()
-    form.major_id.choices = [(0, 'Chọn ngành')] + [(m.id, m.name) for m in Major.query.all()]
-    form.advisor_id.choices = [(0, 'Chọn cố vấn')] + [(l.id, l.full_name) for l in Lecturer.query.all()]
+    form.major_id.choices = [(0, 'Chọn ngành')] + get_choices('majors')
+    form.advisor_id.choices = [(0, 'Chọn cố vấn')] + get_choices('lecturers')
     
     if form.validate_on_submit():
         classroom = Classroom(
@@ -466,12 +512,13 @@ def add_classroom():
 @admin_bp.route('/classrooms/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@read_your_writes
 def edit_classroom(id):
     """Sửa lớp học"""
     classroom = Classroom.query.get_or_404(id)
     form = ClassroomForm(obj=classroom)
-    form.major_id.choices = [(0, 'Chọn ngành')] + [(m.id, m.name) for m in Major.query.all()]
-    form.advisor_id.choices = [(0, 'Chọn cố vấn')] + [(l.id, l.full_name) for l in Lecturer.query.all()]
+    form.major_id.choices = [(0, 'Chọn ngành')] + get_choices('majors')
+    form.advisor_id.choices = [(0, 'Chọn cố vấn')] + get_choices('lecturers')
     
     if form.validate_on_submit():
         classroom.name = form.name.data
@@ -488,6 +535,7 @@ def edit_classroom(id):
 @admin_bp.route('/classrooms/delete/<int:id>')
 @login_required
 @admin_required
+@read_your_writes
 def delete_classroom(id):
     """Xóa lớp học"""
     classroom = Classroom.query.get_or_404(id)
@@ -510,6 +558,7 @@ def subjects():
 @admin_bp.route('/subjects/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@read_your_writes
 def add_subject():
     """Thêm môn học"""
     form = SubjectForm()
@@ -534,6 +583,7 @@ def add_subject():
 @admin_bp.route('/subjects/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@read_your_writes
 def edit_subject(id):
     """Sửa môn học"""
     subject = Subject.query.get_or_404(id)
@@ -556,6 +606,7 @@ def edit_subject(id):
 @admin_bp.route('/subjects/delete/<int:id>')
 @login_required
 @admin_required
+@read_your_writes
 def delete_subject(id):
     """Xóa môn học"""
     subject = Subject.query.get_or_404(id)
@@ -567,6 +618,7 @@ def delete_subject(id):
 
 # ==================== SCHEDULE MANAGEMENT ====================
 @admin_bp.route('/schedules')
+@loading_profile('schedule_list')
 @login_required
 @admin_required
 def schedules():
@@ -575,65 +627,77 @@ def schedules():
     return render_template('admin/schedules/list.html', schedules=schedules)
 
 
+def _schedule_fields(form):
+    """Giá trị các cột Schedule từ form"""
+    return {
+        'subject_id': form.subject_id.data,
+        'lecturer_id': form.lecturer_id.data,
+        'class_id': form.class_id.data,
+        'room_name': form.room_name.data.strip(),
+        'day_of_week': form.day_of_week.data,
+        'start_time': form.start_time.data,
+        'end_time': form.end_time.data,
+        'semester': form.semester.data.strip()
+    }
+
+
 @admin_bp.route('/schedules/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@read_your_writes
 def add_schedule():
     """Thêm lịch học"""
     form = ScheduleForm()
-    form.subject_id.choices = [(s.id, s.name) for s in Subject.query.all()]
-    form.lecturer_id.choices = [(l.id, l.full_name) for l in Lecturer.query.all()]
-    form.class_id.choices = [(c.id, c.name) for c in Classroom.query.all()]
+    form.subject_id.choices = get_choices('subjects')
+    form.lecturer_id.choices = get_choices('lecturers')
+    form.class_id.choices = get_choices('classrooms')
     
+    conflicts = []
     if form.validate_on_submit():
-        schedule = Schedule(
-            subject_id=form.subject_id.data,
-            lecturer_id=form.lecturer_id.data,
-            class_id=form.class_id.data,
-            room_name=form.room_name.data,
-            day_of_week=form.day_of_week.data,
-            start_time=form.start_time.data,
-            end_time=form.end_time.data,
-            semester=form.semester.data
-        )
-        db.session.add(schedule)
-        db.session.commit()
-        flash('Đã thêm lịch học thành công!', 'success')
-        return redirect(url_for('admin.schedules'))
+        schedule = Schedule(**_schedule_fields(form))
+        conflicts = find_conflicts(schedule)
+        if not conflicts:
+            db.session.add(schedule)
+            db.session.commit()
+            flash('Đã thêm lịch học thành công!', 'success')
+            return redirect(url_for('admin.schedules'))
     
-    return render_template('admin/schedules/form.html', form=form, title='Thêm Lịch học')
+    return render_template('admin/schedules/form.html', form=form, title='Thêm Lịch học', conflicts=conflicts)
 
 
 @admin_bp.route('/schedules/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@read_your_writes
 def edit_schedule(id):
     """Sửa lịch học"""
     schedule = Schedule.query.get_or_404(id)
     form = ScheduleForm(obj=schedule)
-    form.subject_id.choices = [(s.id, s.name) for s in Subject.query.all()]
-    form.lecturer_id.choices = [(l.id, l.full_name) for l in Lecturer.query.all()]
-    form.class_id.choices = [(c.id, c.name) for c in Classroom.query.all()]
+    form.subject_id.choices = get_choices('subjects')
+    form.lecturer_id.choices = get_choices('lecturers')
+    form.class_id.choices = get_choices('classrooms')
     
+    conflicts = []
     if form.validate_on_submit():
-        schedule.subject_id = form.subject_id.data
-        schedule.lecturer_id = form.lecturer_id.data
-        schedule.class_id = form.class_id.data
-        schedule.room_name = form.room_name.data
-        schedule.day_of_week = form.day_of_week.data
-        schedule.start_time = form.start_time.data
-        schedule.end_time = form.end_time.data
-        schedule.semester = form.semester.data
-        db.session.commit()
-        flash('Cập nhật lịch học thành công!', 'success')
-        return redirect(url_for('admin.schedules'))
+        fields = _schedule_fields(form)
+        # Kiểm tra trên bản nháp: chưa gán vào schedule để không bị autoflush khi truy vấn
+        draft = Schedule(start_date=schedule.start_date, end_date=schedule.end_date, **fields)
+        conflicts = find_conflicts(draft, exclude_id=schedule.id)
+        if not conflicts:
+            for name, value in fields.items():
+                setattr(schedule, name, value)
+            db.session.commit()
+            flash('Cập nhật lịch học thành công!', 'success')
+            return redirect(url_for('admin.schedules'))
     
-    return render_template('admin/schedules/form.html', form=form, title='Sửa Lịch học', schedule=schedule)
+    return render_template('admin/schedules/form.html', form=form, title='Sửa Lịch học', schedule=schedule,
+                           conflicts=conflicts)
 
 
 @admin_bp.route('/schedules/delete/<int:id>')
 @login_required
 @admin_required
+@read_your_writes
 def delete_schedule(id):
     """Xóa lịch học"""
     schedule = Schedule.query.get_or_404(id)
@@ -641,3 +705,211 @@ def delete_schedule(id):
     db.session.commit()
     flash('Đã xóa lịch học thành công!', 'success')
     return redirect(url_for('admin.schedules'))
+
+
+# ==================== IMPORT ====================
+IMPORT_KINDS = {'student': ('Sinh viên', 'admin.students'), 'lecturer': ('Giảng viên', 'admin.lecturers')}
+
+
+@admin_bp.route('/import/<kind>', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_accounts(kind):
+    """Nhập hàng loạt sinh viên / giảng viên từ file"""
+    if kind not in IMPORT_KINDS:
+        flash('Loại tài khoản không hợp lệ!', 'danger')
+        return redirect(url_for('admin.dashboard'))
+    form = ImportForm()
+    
+    if form.validate_on_submit():
+        try:
+            rows = read_rows(form.file.data.stream, form.file.data.filename)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('admin.import_accounts', kind=kind))
+        if not rows:
+            flash('File không có dữ liệu!', 'danger')
+            return redirect(url_for('admin.import_accounts', kind=kind))
+        
+        # Chạy nền qua hàng đợi tác vụ (app/tasks.py): các dòng được lưu cùng việc
+        job = enqueue('accounts.import', priority=10, created_by=current_user.id, kind=kind,
+                      filename=form.file.data.filename, rows=rows, skip_invalid=form.skip_invalid.data)
+        db.session.commit()
+        return redirect(url_for('admin.import_status', job_id=job.id))
+    
+    return render_template('admin/import/form.html', form=form, kind=kind, label=IMPORT_KINDS[kind][0],
+                           columns=COLUMNS[kind])
+
+
+@admin_bp.route('/import/status/<int:job_id>')
+@login_required
+@admin_required
+@primary_reads
+def import_status(job_id):
+    """Tiến độ và kết quả một lần nhập"""
+    job = db.session.get(Job, job_id)
+    if job is None or job.name != 'accounts.import':
+        flash('Không tìm thấy lần nhập này!', 'danger')
+        return redirect(url_for('admin.dashboard'))
+    
+    if request.args.get('format') == 'json':
+        return jsonify(job_to_dict(job))
+    params = load_params(job)
+    label, list_endpoint = IMPORT_KINDS[params['kind']]
+    return render_template('admin/import/status.html', job=job, report=load_result(job), kind=params['kind'],
+                           params=params, label=label, list_endpoint=list_endpoint)
+
+
+# ==================== TÁC VỤ NỀN ====================
+# Tác vụ bảo trì quản trị viên chạy được từ trang Tác vụ nền
+MAINTENANCE_TASKS = ('academic.rebuild', 'search.rebuild', 'derivatives.run', 'storage.gc')
+JOB_STATUSES = {
+    'queued': ('Đang chờ', 'bg-secondary'), 'running': ('Đang chạy', 'badge-info'),
+    'cancelling': ('Đang hủy', 'badge-warning'), 'succeeded': ('Thành công', 'badge-success'),
+    'failed': ('Lỗi', 'badge-danger'), 'cancelled': ('Đã hủy', 'bg-secondary')
+}
+
+
+@admin_bp.route('/jobs')
+@login_required
+@admin_required
+@primary_reads
+def jobs():
+    """Danh sách tác vụ nền"""
+    status = request.args.get('status')
+    query = Job.query.order_by(Job.id.desc())
+    if status in JOB_STATUSES:
+        query = query.filter(Job.status == status)
+    return render_template('admin/jobs/list.html', jobs=query.limit(100).all(), status=status,
+                           counts=queue_status(), statuses=JOB_STATUSES, task_title=task_title,
+                           maintenance=[(name, task_title(name)) for name in MAINTENANCE_TASKS])
+
+
+@admin_bp.route('/jobs/enqueue', methods=['POST'])
+@login_required
+@admin_required
+@read_your_writes
+def enqueue_job():
+    """Đưa một tác vụ bảo trì vào hàng đợi"""
+    name = request.form.get('name')
+    if name not in MAINTENANCE_TASKS:
+        flash('Tác vụ không hợp lệ!', 'danger')
+        return redirect(url_for('admin.jobs'))
+    job = enqueue(name, priority=request.form.get('priority', 0, type=int), created_by=current_user.id)
+    db.session.commit()
+    flash(f'Đã đưa "{task_title(name)}" vào hàng đợi (#{job.id})!', 'success')
+    return redirect(url_for('admin.job_detail', id=job.id))
+
+
+@admin_bp.route('/jobs/<int:id>')
+@login_required
+@admin_required
+@primary_reads
+def job_detail(id):
+    """Chi tiết và tiến độ một tác vụ"""
+    job = Job.query.get_or_404(id)
+    if request.args.get('format') == 'json':
+        return jsonify(job_to_dict(job))
+    return render_template('admin/jobs/detail.html', job=job, params=load_params(job),
+                           result=load_result(job), statuses=JOB_STATUSES, task_title=task_title)
+
+
+@admin_bp.route('/jobs/<int:id>/cancel', methods=['POST'])
+@login_required
+@admin_required
+@read_your_writes
+def cancel_job(id):
+    """Hủy tác vụ đang chờ / đang chạy"""
+    if cancel(id):
+        flash(f'Đã hủy tác vụ #{id}!', 'success')
+    else:
+        flash('Tác vụ đã kết thúc, không hủy được!', 'warning')
+    return redirect(request.referrer or url_for('admin.jobs'))
+
+
+@admin_bp.route('/jobs/<int:id>/retry', methods=['POST'])
+@login_required
+@admin_required
+@read_your_writes
+def retry_job(id):
+    """Chạy lại tác vụ lỗi / đã hủy"""
+    if retry(id):
+        flash(f'Đã đưa tác vụ #{id} vào hàng đợi lại!', 'success')
+    else:
+        flash('Chỉ chạy lại được tác vụ lỗi hoặc đã hủy!', 'warning')
+    return redirect(request.referrer or url_for('admin.jobs'))
+
+
+@admin_bp.route('/jobs/<int:id>/download')
+@login_required
+@admin_required
+@primary_reads
+def download_job_output(id):
+    """Tải file kết quả của tác vụ"""
+    return send_output(Job.query.get_or_404(id))
+
+
+# ==================== PROFILER ====================
+@admin_bp.route('/_profile', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def profiler():
+    """Bật / xem kết quả profile theo endpoint"""
+    form = ProfilerForm()
+    form.endpoint.choices = sorted(
+        (rule.endpoint, rule.endpoint) for rule in current_app.url_map.iter_rules()
+        if rule.endpoint != 'static' and not rule.endpoint.startswith('admin.profiler')
+    )
+    
+    if form.validate_on_submit():
+        start_profiling(
+            form.endpoint.data,
+            mode=form.mode.data,
+            sample_rate=form.sample_rate.data,
+            max_requests=form.max_requests.data,
+            interval=form.interval_ms.data / 1000
+        )
+        flash(f'Đã bật profile cho {form.endpoint.data}!', 'success')
+        return redirect(url_for('admin.profiler'))
+    
+    session = current_session()
+    return render_template('admin/profile.html', form=form, session=session,
+                           summary=session.summary() if session else None)
+
+
+@admin_bp.route('/_profile/stop')
+@login_required
+@admin_required
+def profiler_stop():
+    """Dừng thu thập, giữ kết quả"""
+    stop_profiling()
+    flash('Đã dừng profile!', 'success')
+    return redirect(url_for('admin.profiler'))
+
+
+@admin_bp.route('/_profile/clear')
+@login_required
+@admin_required
+def profiler_clear():
+    """Xóa phiên profile"""
+    clear_profiling()
+    flash('Đã xóa kết quả profile!', 'success')
+    return redirect(url_for('admin.profiler'))
+
+
+@admin_bp.route('/_profile/download/<fmt>')
+@login_required
+@admin_required
+def profiler_download(fmt):
+    """Tải kết quả: collapsed stack (văn bản) hoặc pstats (nhị phân)"""
+    session = current_session()
+    if session is None or fmt not in ('collapsed', 'pstats'):
+        flash('Không có kết quả profile!', 'danger')
+        return redirect(url_for('admin.profiler'))
+    
+    name = f'{session.endpoint}-{session.pid}'
+    if fmt == 'collapsed':
+        return Response(session.collapsed(), mimetype='text/plain',
+                        headers={'Content-Disposition': f'attachment; filename={name}.collapsed.txt'})
+    return Response(session.pstats_dump(), mimetype='application/octet-stream',
+                    headers={'Content-Disposition': f'attachment; filename={name}.pstats'})
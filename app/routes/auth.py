@@ -5,6 +5,8 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, SelectField, DateField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
 from app.models import User, Student, Lecturer
+from app.loading import loading_profile
+from app.routing import read_your_writes
 from app import db
 from datetime import date
 
@@ -165,6 +167,10 @@ def login():
                 flash('Tài khoản của bạn đã bị khóa. Vui lòng liên hệ quản trị viên.', 'danger')
                 return render_template('auth/login.html', form=form)
             
+            # Nâng cấp hash cũ theo chính sách băm hiện tại
+            if user.rehash_password(form.password.data):
+                db.session.commit()
+            
             login_user(user, remember=form.remember_me.data)
             flash(f'Chào mừng {user.get_display_name()} đã đăng nhập!', 'success')
             
@@ -195,20 +201,23 @@ def logout():
 
 
 @auth_bp.route('/profile')
+@loading_profile('profile')
 @login_required
 def profile():
     """Trang hồ sơ cá nhân"""
-    return render_template('auth/profile.html')
+    return render_template('auth/profile.html', user=current_user.user)
 
 
 @auth_bp.route('/change-password', methods=['GET', 'POST'])
 @login_required
+@read_your_writes
 def change_password():
     """Đổi mật khẩu"""
     form = ChangePasswordForm()
     
     if form.validate_on_submit():
-        if not current_user.check_password(form.current_password.data):
+        user = current_user.user
+        if not user.check_password(form.current_password.data):
             flash('Mật khẩu hiện tại không đúng!', 'danger')
             return render_template('auth/change_password.html', form=form)
         
@@ -216,7 +225,7 @@ def change_password():
             flash('Mật khẩu xác nhận không khớp!', 'danger')
             return render_template('auth/change_password.html', form=form)
         
-        current_user.set_password(form.new_password.data)
+        user.set_password(form.new_password.data)
         db.session.commit()
         flash('Đổi mật khẩu thành công!', 'success')
         return redirect(url_for('auth.profile'))
@@ -225,6 +234,7 @@ def change_password():
 
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@read_your_writes
 def register():
     """Xử lý đăng ký tài khoản"""
     if current_user.is_authenticated:
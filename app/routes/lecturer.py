@@ -1,13 +1,19 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort
 from flask_login import login_required, current_user
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, TextAreaField, FloatField, SelectField
 from wtforms.validators import DataRequired, Optional, NumberRange
 from app.routes.auth import lecturer_required
-from app.models import Lecturer, Student, Schedule, Grade, Subject, Material, Classroom
+from app.models import Lecturer, Student, Schedule, Subject, Material, Classroom, Evaluation, Job
+from app.loading import loading_profile
+from app.routing import read_your_writes, primary_reads
+from app.grading import load_grade_sheet, save_class_grades
+from app.storage import store_upload
+from app.derivatives import derivatives_for
+from app.jobs import enqueue, job_to_dict, send_output
+from app.uploads import UploadError, create_session, get_session, describe, write_chunk, finalize, abort_session
 from app import db
-import os
 from werkzeug.utils import secure_filename
 
 lecturer_bp = Blueprint('lecturer', __name__)
@@ -35,6 +41,7 @@ class MaterialForm(FlaskForm):
 
 # ==================== ROUTES ====================
 @lecturer_bp.route('/dashboard')
+@loading_profile('schedule_list', 'evaluation_list')
 @login_required
 @lecturer_required
 def dashboard():
@@ -42,8 +49,8 @@ def dashboard():
     lecturer = current_user.lecturer
     
     # Thống kê
-    total_schedules = lecturer.schedules.count() if lecturer else 0
-    total_materials = lecturer.materials.count() if lecturer else 0
+    total_schedules = Schedule.query.filter_by(lecturer_id=lecturer.id).count() if lecturer else 0
+    total_materials = Material.query.filter_by(uploaded_by=lecturer.id).count() if lecturer else 0
     avg_rating = lecturer.get_average_rating() if lecturer else 0
     
     # Lịch dạy hôm nay
@@ -55,8 +62,8 @@ def dashboard():
     ).order_by(Schedule.start_time).all() if lecturer else []
     
     # Đánh giá gần đây
-    recent_evaluations = lecturer.evaluations.order_by(
-        db.text('created_at DESC')
+    recent_evaluations = Evaluation.query.filter_by(lecturer_id=lecturer.id).order_by(
+        Evaluation.created_at.desc()
     ).limit(5).all() if lecturer else []
     
     return render_template('lecturer/dashboard.html',
@@ -69,14 +76,15 @@ def dashboard():
 
 
 @lecturer_bp.route('/schedule')
+@loading_profile('schedule_list')
 @login_required
 @lecturer_required
 def schedule():
     """Xem lịch giảng dạy"""
-    lecturer = current_user.lecturer
-    schedules = Schedule.query.filter_by(lecturer_id=lecturer.id).order_by(
+    lecturer_id = current_user.lecturer_id
+    schedules = Schedule.query.filter_by(lecturer_id=lecturer_id).order_by(
         Schedule.day_of_week, Schedule.start_time
-    ).all() if lecturer else []
+    ).all() if lecturer_id else []
     
     # Nhóm theo ngày
     schedule_by_day = {}
@@ -92,12 +100,13 @@ def schedule():
 
 
 @lecturer_bp.route('/grades')
+@loading_profile('schedule_list')
 @login_required
 @lecturer_required
 def grades():
     """Danh sách lớp để nhập điểm"""
-    lecturer = current_user.lecturer
-    schedules = Schedule.query.filter_by(lecturer_id=lecturer.id).all() if lecturer else []
+    lecturer_id = current_user.lecturer_id
+    schedules = Schedule.query.filter_by(lecturer_id=lecturer_id).all() if lecturer_id else []
     
     # Lấy danh sách các lớp/môn duy nhất
     class_subjects = []
@@ -112,7 +121,8 @@ def grades():
                 'semester': s.semester
             })
     
-    return render_template('lecturer/grades/list.html', class_subjects=class_subjects)
+    semesters = sorted({s.semester or 'HK2-2024' for s in schedules}, reverse=True)
+    return render_template('lecturer/grades/list.html', class_subjects=class_subjects, semesters=semesters)
 
 
 @lecturer_bp.route('/grades/<int:class_id>/<int:subject_id>')
@@ -124,91 +134,87 @@ def grade_class(class_id, subject_id):
     subject = Subject.query.get_or_404(subject_id)
     semester = request.args.get('semester', 'HK2-2024')
     
-    # Lấy danh sách sinh viên trong lớp
-    students = Student.query.filter_by(class_id=class_id).all()
-    
-    # Lấy điểm hiện có
-    grades_dict = {}
-    for student in students:
-        grade = Grade.query.filter_by(
-            student_id=student.id,
-            subject_id=subject_id,
-            semester=semester
-        ).first()
-        grades_dict[student.id] = grade
+    # Danh sách sinh viên kèm điểm hiện có - 1 truy vấn
+    rows = load_grade_sheet(class_id, subject_id, semester)
     
     return render_template('lecturer/grades/input.html',
                            classroom=classroom,
                            subject=subject,
-                           students=students,
-                           grades_dict=grades_dict,
+                           rows=rows,
                            semester=semester)
 
 
 @lecturer_bp.route('/grades/save', methods=['POST'])
 @login_required
 @lecturer_required
+@read_your_writes
 def save_grades():
     """Lưu điểm"""
     class_id = request.form.get('class_id', type=int)
     subject_id = request.form.get('subject_id', type=int)
     semester = request.form.get('semester', 'HK2-2024')
     
-    students = Student.query.filter_by(class_id=class_id).all()
-    
-    for student in students:
-        attendance = request.form.get(f'attendance_{student.id}', type=float) or 0
-        midterm = request.form.get(f'midterm_{student.id}', type=float) or 0
-        final = request.form.get(f'final_{student.id}', type=float) or 0
-        
-        # Tìm hoặc tạo mới grade
-        grade = Grade.query.filter_by(
-            student_id=student.id,
-            subject_id=subject_id,
-            semester=semester
-        ).first()
-        
-        if not grade:
-            grade = Grade(
-                student_id=student.id,
-                subject_id=subject_id,
-                semester=semester
+    # Đọc điểm từ form: attendance_<id>, midterm_<id>, final_<id>
+    student_ids = {key.rpartition('_')[2] for key in request.form
+                   if key.startswith(('attendance_', 'midterm_', 'final_'))}
+    scores = {}
+    for student_id in student_ids:
+        if student_id.isdigit():
+            scores[int(student_id)] = (
+                request.form.get(f'attendance_{student_id}', type=float) or 0,
+                request.form.get(f'midterm_{student_id}', type=float) or 0,
+                request.form.get(f'final_{student_id}', type=float) or 0
             )
-            db.session.add(grade)
-        
-        grade.score_attendance = attendance
-        grade.score_midterm = midterm
-        grade.score_final = final
-        grade.calculate_total()
     
+    # Ghi cả lớp bằng một lần upsert, chỉ các dòng thay đổi
+    result = save_class_grades(class_id, subject_id, semester, scores)
     db.session.commit()
-    flash('Đã lưu điểm thành công!', 'success')
+    
+    flash(f"Đã lưu điểm thành công! (Thêm mới: {result['inserted']}, "
+          f"cập nhật: {result['updated']}, không đổi: {result['unchanged']})", 'success')
     return redirect(url_for('lecturer.grade_class', class_id=class_id, subject_id=subject_id))
 
 
+@lecturer_bp.route('/grades/export', methods=['POST'])
+@login_required
+@lecturer_required
+@read_your_writes
+def export_grades():
+    """Xuất bảng điểm Excel cả học kỳ - chạy nền, trả về trang theo dõi ngay"""
+    semester = request.form.get('semester') or 'HK2-2024'
+    job = enqueue('reports.grade_export', created_by=current_user.id,
+                  lecturer_id=current_user.lecturer_id, semester=semester)
+    db.session.commit()
+    return redirect(url_for('lecturer.job_status', id=job.id))
+
+
 @lecturer_bp.route('/materials')
+@loading_profile('material_list')
 @login_required
 @lecturer_required
 def materials():
     """Danh sách tài liệu đã upload"""
-    lecturer = current_user.lecturer
-    materials = Material.query.filter_by(uploaded_by=lecturer.id).order_by(
+    lecturer_id = current_user.lecturer_id
+    materials = Material.query.filter_by(uploaded_by=lecturer_id).order_by(
         Material.created_at.desc()
-    ).all() if lecturer else []
+    ).all() if lecturer_id else []
     
-    return render_template('lecturer/materials/list.html', materials=materials)
+    return render_template('lecturer/materials/list.html', materials=materials,
+                           previews=derivatives_for(materials))
 
 
 @lecturer_bp.route('/materials/add', methods=['GET', 'POST'])
+@loading_profile('schedule_list')
 @login_required
 @lecturer_required
+@read_your_writes
 def add_material():
     """Upload tài liệu mới"""
-    lecturer = current_user.lecturer
+    lecturer_id = current_user.lecturer_id
     form = MaterialForm()
     
     # Lấy danh sách môn học giảng viên này dạy
-    schedules = Schedule.query.filter_by(lecturer_id=lecturer.id).all() if lecturer else []
+    schedules = Schedule.query.filter_by(lecturer_id=lecturer_id).all() if lecturer_id else []
     subjects = list(set([s.subject for s in schedules]))
     form.subject_id.choices = [(s.id, s.name) for s in subjects]
     
@@ -216,11 +222,8 @@ def add_material():
         file = form.file.data
         if file:
             filename = secure_filename(file.filename)
-            from flask import current_app
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'materials', filename)
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            file.save(file_path)
-            file_size = os.path.getsize(file_path)
+            # Kho theo nội dung (app/storage.py): file trùng nội dung chỉ lưu một lần
+            file_path, file_size = store_upload(file, filename)
             file_type = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
         else:
             file_path = None
@@ -229,10 +232,10 @@ def add_material():
         
         material = Material(
             subject_id=form.subject_id.data,
-            uploaded_by=lecturer.id,
+            uploaded_by=lecturer_id,
             title=form.title.data,
             description=form.description.data,
-            file_path=f'materials/{filename}' if file else None,
+            file_path=file_path,
             file_type=file_type,
             file_size=file_size
         )
@@ -248,12 +251,13 @@ def add_material():
 @lecturer_bp.route('/materials/delete/<int:id>')
 @login_required
 @lecturer_required
+@read_your_writes
 def delete_material(id):
     """Xóa tài liệu"""
     material = Material.query.get_or_404(id)
-    lecturer = current_user.lecturer
+    lecturer_id = current_user.lecturer_id
     
-    if material.uploaded_by != lecturer.id:
+    if material.uploaded_by != lecturer_id:
         flash('Bạn không có quyền xóa tài liệu này!', 'danger')
         return redirect(url_for('lecturer.materials'))
     
@@ -263,13 +267,90 @@ def delete_material(id):
     return redirect(url_for('lecturer.materials'))
 
 
+# ==================== UPLOAD THEO PHẦN ====================
+@lecturer_bp.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify({'error': str(e)}), e.status
+
+
+def _taught_subject(lecturer_id, subject_id):
+    """Giảng viên có dạy môn này không (cùng điều kiện với danh sách môn trong form upload)"""
+    return lecturer_id is not None and db.session.query(
+        Schedule.query.filter_by(lecturer_id=lecturer_id, subject_id=subject_id).exists()
+    ).scalar()
+
+
+@lecturer_bp.route('/uploads', methods=['POST'])
+@login_required
+@lecturer_required
+def create_upload():
+    """Tạo phiên upload theo phần cho tài liệu lớn"""
+    data = request.get_json(silent=True) or request.form
+    try:
+        subject_id = int(data.get('subject_id'))
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        raise UploadError('Thiếu môn học hoặc kích thước file!')
+    if not _taught_subject(current_user.lecturer_id, subject_id):
+        raise UploadError('Bạn không dạy môn học này!', 403)
+    
+    upload = create_session(current_user.lecturer_id, subject_id, (data.get('title') or '').strip(),
+                            data.get('description') or None, data.get('filename'), size)
+    return jsonify(describe(upload)), 201
+
+
+@lecturer_bp.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+@lecturer_required
+@primary_reads
+def upload_status(upload_id):
+    """Các khoảng byte đã nhận - client dùng để tải tiếp sau khi gián đoạn"""
+    return jsonify(describe(get_session(upload_id, current_user.lecturer_id)))
+
+
+@lecturer_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+@lecturer_required
+def upload_chunk(upload_id):
+    """Nhận một phần: ?offset=<vị trí byte>, thân request là nội dung"""
+    upload = get_session(upload_id, current_user.lecturer_id)
+    if request.content_length is None:
+        raise UploadError('Thiếu Content-Length!', 411)
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        raise UploadError('Thiếu offset!')
+    write_chunk(upload, offset, request.stream, request.content_length)
+    return jsonify(describe(upload))
+
+
+@lecturer_bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+@lecturer_required
+@read_your_writes
+def finalize_upload(upload_id):
+    """Ghép xong: tạo tài liệu từ file đã nhận"""
+    material = finalize(get_session(upload_id, current_user.lecturer_id))
+    flash('Đã upload tài liệu thành công!', 'success')
+    return jsonify({'material_id': material.id, 'redirect': url_for('lecturer.materials')})
+
+
+@lecturer_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+@lecturer_required
+def abort_upload(upload_id):
+    """Hủy phiên upload"""
+    abort_session(get_session(upload_id, current_user.lecturer_id))
+    return '', 204
+
+
 @lecturer_bp.route('/students')
+@loading_profile('schedule_list', 'student_card')
 @login_required
 @lecturer_required
 def students():
     """Xem danh sách sinh viên trong các lớp đang dạy"""
-    lecturer = current_user.lecturer
-    schedules = Schedule.query.filter_by(lecturer_id=lecturer.id).all() if lecturer else []
+    lecturer_id = current_user.lecturer_id
+    schedules = Schedule.query.filter_by(lecturer_id=lecturer_id).all() if lecturer_id else []
     
     # Lấy các lớp duy nhất
     classrooms = list(set([s.classroom for s in schedules]))
@@ -283,3 +364,33 @@ def students():
                            classrooms=classrooms, 
                            students=students,
                            selected_class=selected_class)
+
+
+# ==================== TÁC VỤ NỀN ====================
+def _own_job(id):
+    """Tác vụ do chính người dùng hiện tại tạo - 404 với tác vụ của người khác"""
+    job = db.session.get(Job, id)
+    if job is None or job.created_by != current_user.id:
+        abort(404)
+    return job
+
+
+@lecturer_bp.route('/jobs/<int:id>')
+@login_required
+@lecturer_required
+@primary_reads
+def job_status(id):
+    """Tiến độ tác vụ nền (?format=json cho client thăm dò)"""
+    job = _own_job(id)
+    if request.args.get('format') == 'json':
+        return jsonify(job_to_dict(job))
+    return render_template('lecturer/job.html', job=job, info=job_to_dict(job))
+
+
+@lecturer_bp.route('/jobs/<int:id>/download')
+@login_required
+@lecturer_required
+@primary_reads
+def download_job_output(id):
+    """Tải file kết quả của tác vụ"""
+    return send_output(_own_job(id))
@@ -1,5 +1,7 @@
 from flask import Blueprint, redirect, url_for
 from flask_login import login_required, current_user
+from app.models import Material
+from app.derivatives import send_derivative
 
 main_bp = Blueprint('main', __name__)
 
@@ -16,3 +18,17 @@ def index():
         return redirect(url_for('lecturer.dashboard'))
     else:
         return redirect(url_for('student.dashboard'))
+
+
+@main_bp.route('/materials/<int:id>/thumbnail')
+@login_required
+def material_thumbnail(id):
+    """Ảnh thu nhỏ của tài liệu"""
+    return send_derivative(Material.query.get_or_404(id), 'thumbnail')
+
+
+@main_bp.route('/materials/<int:id>/text')
+@login_required
+def material_text(id):
+    """Văn bản trích từ tài liệu (xem nhanh trước khi tải)"""
+    return send_derivative(Material.query.get_or_404(id), 'text')
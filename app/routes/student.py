@@ -1,13 +1,17 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, send_from_directory
+from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from flask_wtf import FlaskForm
 from wtforms import IntegerField, TextAreaField, SelectField, RadioField
 from wtforms.validators import DataRequired, NumberRange, Optional
 from app.routes.auth import student_required
 from app.models import Student, Schedule, Grade, Subject, Material, Lecturer, Evaluation
+from app.academic import get_summary, get_semester_summaries
+from app.loading import loading_profile
+from app.routing import read_your_writes
+from app.counters import increment
+from app.delivery import send_upload, is_full_download
+from app.derivatives import derivatives_for
 from app import db
-from flask import current_app
-import os
 
 student_bp = Blueprint('student', __name__)
 
@@ -29,6 +33,7 @@ class EvaluationForm(FlaskForm):
 
 # ==================== ROUTES ====================
 @student_bp.route('/dashboard')
+@loading_profile('schedule_list', 'grade_sheet')
 @login_required
 @student_required
 def dashboard():
@@ -39,27 +44,28 @@ def dashboard():
         flash('Không tìm thấy thông tin sinh viên!', 'danger')
         return redirect(url_for('main.index'))
     
-    # Tính GPA
-    gpa = student.calculate_gpa()
+    # GPA và số tín chỉ tích lũy - đọc từ bảng tổng hợp
+    summary = get_summary(student)
+    gpa = summary.gpa
+    total_credits = summary.passed_credits
     
     # Số môn đã học
-    total_subjects = student.grades.count()
-    
-    # Số tín chỉ tích lũy
-    total_credits = sum([g.subject.credits for g in student.grades if g.subject and g.score_total and g.score_total >= 4.0])
+    total_subjects = Grade.query.filter_by(student_id=student.id).count()
     
     # Lịch học hôm nay
     from datetime import datetime
     today = datetime.now().weekday()
     today_schedules = []
-    if student.classroom:
+    if student.class_id:
         today_schedules = Schedule.query.filter_by(
-            class_id=student.classroom.id,
+            class_id=student.class_id,
             day_of_week=today
         ).order_by(Schedule.start_time).all()
     
     # Điểm gần đây
-    recent_grades = student.grades.order_by(Grade.updated_at.desc()).limit(5).all()
+    recent_grades = Grade.query.filter_by(student_id=student.id).order_by(
+        Grade.updated_at.desc()
+    ).limit(5).all()
     
     return render_template('student/dashboard.html',
                            student=student,
@@ -71,17 +77,16 @@ def dashboard():
 
 
 @student_bp.route('/schedule')
+@loading_profile('schedule_list')
 @login_required
 @student_required
 def schedule():
     """Xem thời khóa biểu"""
-    student = current_user.student
-    
-    if not student or not student.classroom:
+    if not current_user.class_id:
         flash('Bạn chưa được phân lớp!', 'warning')
         return render_template('student/schedule.html', schedules=[], schedule_by_day={})
     
-    schedules = Schedule.query.filter_by(class_id=student.classroom.id).order_by(
+    schedules = Schedule.query.filter_by(class_id=current_user.class_id).order_by(
         Schedule.day_of_week, Schedule.start_time
     ).all()
     
@@ -99,6 +104,7 @@ def schedule():
 
 
 @student_bp.route('/grades')
+@loading_profile('grade_sheet')
 @login_required
 @student_required
 def grades():
@@ -110,7 +116,7 @@ def grades():
         return redirect(url_for('main.index'))
     
     # Lấy tất cả điểm, nhóm theo học kỳ
-    grades = student.grades.order_by(Grade.semester.desc()).all()
+    grades = Grade.query.filter_by(student_id=student.id).order_by(Grade.semester.desc()).all()
     
     # Nhóm theo học kỳ
     grades_by_semester = {}
@@ -120,26 +126,30 @@ def grades():
             grades_by_semester[semester] = []
         grades_by_semester[semester].append(g)
     
-    # Tính GPA tổng
-    gpa = student.calculate_gpa()
+    # GPA tổng và GPA từng học kỳ - đọc từ bảng tổng hợp
+    gpa = get_summary(student).gpa
+    semester_summaries = {
+        (semester or 'Không xác định'): summary
+        for semester, summary in get_semester_summaries(student).items()
+    }
     
     return render_template('student/grades.html',
                            student=student,
                            grades_by_semester=grades_by_semester,
+                           semester_summaries=semester_summaries,
                            gpa=gpa)
 
 
 @student_bp.route('/materials')
+@loading_profile('material_list')
 @login_required
 @student_required
 def materials():
     """Xem và tải tài liệu"""
-    student = current_user.student
-    
     # Lấy các môn học sinh viên đang học
     schedules = []
-    if student and student.classroom:
-        schedules = Schedule.query.filter_by(class_id=student.classroom.id).all()
+    if current_user.class_id:
+        schedules = Schedule.query.filter_by(class_id=current_user.class_id).all()
     
     subject_ids = list(set([s.subject_id for s in schedules]))
     
@@ -148,7 +158,8 @@ def materials():
         Material.created_at.desc()
     ).all() if subject_ids else []
     
-    return render_template('student/materials.html', materials=materials)
+    return render_template('student/materials.html', materials=materials,
+                           previews=derivatives_for(materials))
 
 
 @student_bp.route('/materials/download/<int:id>')
@@ -162,29 +173,30 @@ def download_material(id):
         flash('Tài liệu không có file đính kèm!', 'warning')
         return redirect(url_for('student.materials'))
     
-    # Tăng lượt tải
-    material.download_count += 1
-    db.session.commit()
+    response = send_upload(material.file_path)
     
-    directory = os.path.join(current_app.config['UPLOAD_FOLDER'])
-    filename = material.file_path.replace('materials/', '')
-    return send_from_directory(os.path.join(directory, 'materials'), filename, as_attachment=True)
+    # Tăng lượt tải - ghi vào database sau (app/counters.py), không chờ commit.
+    # Không tính 304, HEAD và các phần tải tiếp của một lượt tải dở (Range không bắt đầu từ 0)
+    if is_full_download(response):
+        increment('material_downloads', material.id)
+    return response
 
 
 @student_bp.route('/evaluations')
+@loading_profile('schedule_list', 'evaluation_list')
 @login_required
 @student_required
 def evaluations():
     """Đánh giá giảng viên"""
-    student = current_user.student
-    
     # Lấy các giảng viên đang dạy sinh viên này
     schedules = []
-    if student and student.classroom:
-        schedules = Schedule.query.filter_by(class_id=student.classroom.id).all()
+    if current_user.class_id:
+        schedules = Schedule.query.filter_by(class_id=current_user.class_id).all()
     
     # Lấy các đánh giá đã thực hiện
-    my_evaluations = Evaluation.query.filter_by(student_id=student.id).all() if student else []
+    my_evaluations = Evaluation.query.filter_by(
+        student_id=current_user.student_id
+    ).all() if current_user.student_id else []
     evaluated_keys = set([(e.lecturer_id, e.subject_id) for e in my_evaluations])
     
     # Danh sách giảng viên có thể đánh giá
@@ -205,15 +217,15 @@ def evaluations():
 @student_bp.route('/evaluations/add/<int:lecturer_id>/<int:subject_id>', methods=['GET', 'POST'])
 @login_required
 @student_required
+@read_your_writes
 def add_evaluation(lecturer_id, subject_id):
     """Thêm đánh giá"""
-    student = current_user.student
     lecturer = Lecturer.query.get_or_404(lecturer_id)
     subject = Subject.query.get_or_404(subject_id)
     
     # Kiểm tra đã đánh giá chưa
     existing = Evaluation.query.filter_by(
-        student_id=student.id,
+        student_id=current_user.student_id,
         lecturer_id=lecturer_id,
         subject_id=subject_id
     ).first()
@@ -228,7 +240,7 @@ def add_evaluation(lecturer_id, subject_id):
     
     if form.validate_on_submit():
         evaluation = Evaluation(
-            student_id=student.id,
+            student_id=current_user.student_id,
             lecturer_id=lecturer_id,
             subject_id=subject_id,
             rating=int(form.rating.data),
@@ -0,0 +1,252 @@
+"""
+Định tuyến đọc/ghi giữa database chính và bản sao chỉ đọc (read replica)
+Khi cấu hình DATABASE_READ_URL, các câu SELECT của request GET/HEAD được gửi tới bản sao;
+mọi thao tác ghi, mọi request khác và mọi truy vấn ngoài request (CLI, tác vụ nền) dùng
+database chính. Một request đã ghi thì đọc tiếp từ database chính tới hết request.
+
+Route gắn @read_your_writes: sau khi route đó commit, các request tiếp theo của người dùng
+đọc từ database chính cho tới khi bản sao bắt kịp - với bản sao snapshot SQLite là khi
+snapshot được tạo sau thời điểm ghi, với bản sao khác là sau READ_YOUR_WRITES_SECONDS giây.
+
+Chạy cục bộ với SQLite: bản sao là file snapshot được chụp lại từ database chính mỗi
+REPLICA_SNAPSHOT_INTERVAL giây (sqlite3 backup API, thay file nguyên tử).
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+from weakref import WeakKeyDictionary
+from flask import g, request, session, current_app, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc
+
+logger = logging.getLogger('app.routing')
+
+REPLICA_BIND = 'replica'
+SAFE_METHODS = ('GET', 'HEAD')
+
+_WROTE_KEY = 'routing_wrote'
+_COMMITTED_KEY = 'routing_committed_at'
+_WRITE_AT_KEY = 'db_write_at'
+
+# engine bản sao -> luồng chụp snapshot
+_snapshots = WeakKeyDictionary()
+_snapshots_lock = threading.Lock()
+
+
+# ==================== SESSION ====================
+class RoutingSession(Session):
+    """Session chọn engine theo loại câu lệnh: SELECT của request chỉ đọc -> bản sao"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                self.info[_WROTE_KEY] = True
+            elif getattr(clause, 'is_select', False) and self._reads_from_replica():
+                replica = self._db.engines.get(REPLICA_BIND)
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self):
+        return (has_request_context() and request.method in SAFE_METHODS
+                and not g.get('db_primary') and not self.info.get(_WROTE_KEY))
+
+
+def _after_commit(db_session):
+    if db_session.info.get(_WROTE_KEY):
+        db_session.info[_COMMITTED_KEY] = time.time()
+
+
+def use_primary():
+    """Các truy vấn còn lại của request hiện tại đọc từ database chính"""
+    g.db_primary = True
+
+
+def primary_reads(f):
+    """Decorator: route luôn đọc từ database chính"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        use_primary()
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def read_your_writes(f):
+    """Decorator: sau khi route commit, người dùng đọc từ database chính tới khi bản sao bắt kịp"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        from app import db
+
+        response = f(*args, **kwargs)
+        committed_at = db.session.info.pop(_COMMITTED_KEY, None)
+        if committed_at is not None and REPLICA_BIND in db.engines:
+            session[_WRITE_AT_KEY] = committed_at
+        return response
+    return decorated_function
+
+
+# ==================== SNAPSHOT SQLITE ====================
+def _snapshot_path(replica):
+    return replica.url.database
+
+
+def snapshot_time(replica):
+    """Thời điểm bắt đầu chụp snapshot hiện tại (mtime của file), None nếu chưa có"""
+    try:
+        stat = os.stat(_snapshot_path(replica))
+    except FileNotFoundError:
+        return None
+    # File rỗng do engine bản sao tự tạo khi kết nối (VD db.create_all) chưa phải snapshot
+    return stat.st_mtime if stat.st_size else None
+
+
+def refresh_snapshot(primary, replica):
+    """Chụp database chính vào file tạm rồi thay file snapshot - trả về thời điểm bắt đầu chụp"""
+    path = _snapshot_path(replica)
+    started = time.time()
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    source = primary.raw_connection()
+    try:
+        target = sqlite3.connect(temp_path)
+        try:
+            source.driver_connection.backup(target)
+            # File snapshot không được mang cờ WAL: file -wal cũ cạnh snapshot sẽ bị đọc nhầm
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+    finally:
+        source.close()
+    os.utime(temp_path, (started, started))
+    os.replace(temp_path, path)
+    return started
+
+
+def _snapshot_listeners(replica):
+    """Kết nối mở trước lần thay snapshot gần nhất bị bỏ khi lấy ra khỏi pool"""
+    path = _snapshot_path(replica)
+
+    def inode():
+        try:
+            return os.stat(path).st_ino
+        except FileNotFoundError:
+            return None
+
+    def on_connect(dbapi_connection, connection_record):
+        connection_record.info['snapshot_inode'] = inode()
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        if connection_record.info.get('snapshot_inode') != inode():
+            raise exc.DisconnectionError('Snapshot bản sao đã được thay')
+
+    return on_connect, on_checkout
+
+
+class _SnapshotThread(threading.Thread):
+    """Chụp lại snapshot khi snapshot cũ hơn interval giây"""
+
+    def __init__(self, primary, replica, interval):
+        super().__init__(name='replica-snapshot', daemon=True)
+        self.primary = primary
+        self.replica = replica
+        self.interval = interval
+        self._done = threading.Event()
+
+    def run(self):
+        while True:
+            taken = snapshot_time(self.replica)
+            # Nhiều tiến trình cùng chạy: chỉ chụp khi chưa tiến trình nào chụp gần đây
+            if taken is None or time.time() - taken >= self.interval:
+                try:
+                    refresh_snapshot(self.primary, self.replica)
+                except Exception:
+                    logger.exception('Chụp snapshot bản sao thất bại')
+            if self._done.wait(self.interval / 2):
+                return
+
+    def stop(self):
+        self._done.set()
+
+
+def start_snapshots(primary, replica, interval):
+    """Bật luồng chụp snapshot cho bản sao (một luồng mỗi tiến trình)"""
+    with _snapshots_lock:
+        thread = _snapshots.get(replica)
+        if thread is None or not thread.is_alive():
+            thread = _snapshots[replica] = _SnapshotThread(primary, replica, interval)
+            thread.start()
+    return thread
+
+
+def stop_snapshots(replica):
+    with _snapshots_lock:
+        thread = _snapshots.pop(replica, None)
+    if thread is not None:
+        thread.stop()
+
+
+def is_snapshot_replica(primary, replica):
+    return primary.dialect.name == 'sqlite' and replica.dialect.name == 'sqlite' \
+        and bool(_snapshot_path(replica))
+
+
+# ==================== ĐĂNG KÝ ====================
+def replica_caught_up(written_at):
+    """Bản sao đã chứa dữ liệu ghi lúc written_at chưa"""
+    from app import db
+
+    replica = db.engines[REPLICA_BIND]
+    if is_snapshot_replica(db.engine, replica):
+        taken = snapshot_time(replica)
+        return taken is not None and taken > written_at
+    return time.time() - written_at > current_app.config['READ_YOUR_WRITES_SECONDS']
+
+
+def register_routing(app):
+    """Cấu hình engine bản sao và các hook định tuyến nếu có DATABASE_READ_URL"""
+    from app import db
+    from app.sqlite import configure_engine
+
+    with app.app_context():
+        engines = db.engines
+        primary = db.engine
+    replica = engines.get(REPLICA_BIND)
+    if replica is None:
+        return
+
+    if not event.contains(db.session, 'after_commit', _after_commit):
+        event.listen(db.session, 'after_commit', _after_commit)
+
+    if replica.dialect.name == 'sqlite':
+        # Bản sao chỉ đọc: không đổi journal_mode, chặn mọi câu lệnh ghi
+        pragmas = {name: value for name, value in (app.config.get('SQLITE_PRAGMAS') or {}).items()
+                   if name in ('busy_timeout', 'cache_size', 'mmap_size', 'temp_store')}
+        configure_engine(replica, dict(pragmas, query_only='ON'))
+
+    snapshots = is_snapshot_replica(primary, replica)
+    if snapshots:
+        on_connect, on_checkout = _snapshot_listeners(replica)
+        event.listen(replica, 'connect', on_connect)
+        event.listen(replica, 'checkout', on_checkout)
+    interval = app.config.get('REPLICA_SNAPSHOT_INTERVAL')
+
+    @app.before_request
+    def _route_request():
+        if snapshots:
+            if interval:
+                thread = _snapshots.get(replica)
+                if thread is None or not thread.is_alive():
+                    start_snapshots(primary, replica, interval)
+            if snapshot_time(replica) is None:
+                # Chưa có snapshot đầu tiên
+                use_primary()
+                return
+        written_at = session.get(_WRITE_AT_KEY)
+        if written_at is not None:
+            if replica_caught_up(written_at):
+                session.pop(_WRITE_AT_KEY)
+            else:
+                use_primary()
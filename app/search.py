@@ -0,0 +1,226 @@
+"""
+Tìm kiếm toàn văn sinh viên / giảng viên bằng SQLite FTS5
+Họ tên, mã và email được chuẩn hóa (bỏ dấu tiếng Việt, đ -> d, chữ thường) trước khi
+đưa vào chỉ mục, nên "huong" khớp với "Hương". Mã được lưu kèm mọi hậu tố nên khớp cả phần
+giữa/cuối mã ("001" khớp SV001) như ILIKE trước đây. Chỉ mục được đồng bộ sau mỗi lần flush;
+với database không phải SQLite hoặc chưa có chỉ mục, tìm kiếm quay về ILIKE.
+"""
+
+import re
+import unicodedata
+from sqlalchemy import event, text
+from app import db
+from app.models import User, Student, Lecturer
+
+CHUNK_SIZE = 500
+
+# Bảng FTS5 cho từng loại đối tượng: (model, cột mã)
+SEARCH_TABLES = {
+    'student_search': (Student, Student.student_code),
+    'lecturer_search': (Lecturer, Lecturer.lecturer_code)
+}
+
+# Trọng số bm25 cho các cột (full_name, code, email)
+BM25_WEIGHTS = '10.0, 5.0, 1.0'
+
+_ready_engines = set()
+
+
+# ==================== CHUẨN HÓA ====================
+def fold(value):
+    """Chuẩn hóa chuỗi tiếng Việt: chữ thường, bỏ dấu, đ -> d"""
+    if not value:
+        return ''
+    value = value.lower().replace('đ', 'd')
+    decomposed = unicodedata.normalize('NFD', value)
+    return ''.join(ch for ch in decomposed if unicodedata.category(ch) != 'Mn')
+
+
+def code_terms(code):
+    """Mã -> mọi hậu tố của từng từ trong mã, để tìm theo tiền tố khớp được phần giữa/cuối mã"""
+    return ' '.join(token[i:] for token in re.findall(r'\w+', fold(code)) for i in range(len(token)))
+
+
+def build_match_query(term):
+    """Chuỗi người dùng gõ -> biểu thức MATCH của FTS5 (mỗi từ khớp theo tiền tố)"""
+    tokens = re.findall(r'\w+', fold(term))
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+# ==================== QUẢN LÝ CHỈ MỤC ====================
+def _is_sqlite(connection):
+    return connection.dialect.name == 'sqlite'
+
+
+def create_search_tables(connection, fill=True):
+    """Tạo các bảng FTS5 nếu chưa có
+
+    fill: chỉ mục còn rỗng mà bảng gốc đã có dữ liệu (VD create_all trên database có sẵn) thì
+    dựng luôn, để tìm kiếm không trả về rỗng cho tới khi chạy 'flask search rebuild'.
+    """
+    if not _is_sqlite(connection):
+        return
+    for table, (model, code_column) in SEARCH_TABLES.items():
+        connection.execute(text(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5('
+            f"full_name, code, email, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+        if fill and not connection.execute(text(f'SELECT count(*) FROM {table}')).scalar():
+            _insert_rows(connection, table, _source(model, code_column))
+    _ready_engines.add(connection.engine.url)
+
+
+def search_index_ready(connection=None):
+    """Database hiện tại có chỉ mục FTS5 hay không"""
+    connection = connection if connection is not None else db.session.connection()
+    if not _is_sqlite(connection):
+        return False
+    if connection.engine.url in _ready_engines:
+        return True
+    found = connection.execute(text(
+        "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN :names"
+    ).bindparams(db.bindparam('names', expanding=True)), {'names': list(SEARCH_TABLES)}).scalar()
+    if found == len(SEARCH_TABLES):
+        _ready_engines.add(connection.engine.url)
+        return True
+    return False
+
+
+def reindex(table, ids, connection=None):
+    """Cập nhật chỉ mục cho các bản ghi chỉ định (xóa rồi thêm lại)"""
+    connection = connection if connection is not None else db.session.connection()
+    model, code_column = SEARCH_TABLES[table]
+    ids = sorted(set(ids))
+    for i in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[i:i + CHUNK_SIZE]
+        connection.execute(
+            text(f'DELETE FROM {table} WHERE rowid IN :ids').bindparams(db.bindparam('ids', expanding=True)),
+            {'ids': chunk}
+        )
+        _insert_rows(connection, table, _source(model, code_column).where(model.id.in_(chunk)))
+
+
+def _source(model, code_column):
+    return (db.select(model.id, model.full_name, code_column, User.email)
+            .outerjoin(User, User.id == model.user_id))
+
+
+def _insert_rows(connection, table, stmt):
+    rows = [
+        {'rowid': rowid, 'full_name': fold(name), 'code': code_terms(code), 'email': fold(email)}
+        for rowid, name, code, email in connection.execute(stmt)
+    ]
+    if rows:
+        connection.execute(
+            text(f'INSERT INTO {table} (rowid, full_name, code, email) VALUES (:rowid, :full_name, :code, :email)'),
+            rows
+        )
+
+
+def rebuild_search_index():
+    """Dựng lại toàn bộ chỉ mục - trả về {bảng: số bản ghi}"""
+    connection = db.session.connection()
+    if not _is_sqlite(connection):
+        raise RuntimeError('Chỉ mục FTS5 chỉ hỗ trợ SQLite')
+    create_search_tables(connection, fill=False)
+    counts = {}
+    for table, (model, code_column) in SEARCH_TABLES.items():
+        connection.execute(text(f'DELETE FROM {table}'))
+        _insert_rows(connection, table, _source(model, code_column))
+        counts[table] = connection.execute(text(f'SELECT count(*) FROM {table}')).scalar()
+        connection.execute(text(f"INSERT INTO {table}({table}) VALUES ('optimize')"))
+    db.session.commit()
+    return counts
+
+
+# ==================== TÌM KIẾM ====================
+def _legacy_filter(model, code_column, term):
+    return (model.full_name.ilike(f'%{term}%')) | (code_column.ilike(f'%{term}%'))
+
+
+def search_query(model, term):
+    """Query của model đã lọc theo từ khóa, xếp hạng theo bm25 nếu có chỉ mục FTS5"""
+    table = next(t for t, (m, _) in SEARCH_TABLES.items() if m is model)
+    code_column = SEARCH_TABLES[table][1]
+    match = build_match_query(term)
+    if not match:
+        return model.query
+    if not search_index_ready():
+        return model.query.filter(_legacy_filter(model, code_column, term))
+
+    fts = db.table(table, db.column('rowid'))
+    return (
+        model.query
+        .join(fts, fts.c.rowid == model.id)
+        .filter(text(f'{table} MATCH :match').bindparams(match=match))
+        .order_by(_rank_expression(table))
+    )
+
+
+def _rank_expression(table):
+    return db.literal_column(f'bm25({table}, {BM25_WEIGHTS})')
+
+
+def search_sort_keys(model, term):
+    """Khóa sắp xếp cho phân trang keyset của kết quả tìm kiếm - (keys, descending)
+
+    Có chỉ mục FTS5: theo độ liên quan bm25 (càng nhỏ càng liên quan) rồi id;
+    ngược lại: mới nhất trước theo (created_at, id).
+    """
+    table = next(t for t, (m, _) in SEARCH_TABLES.items() if m is model)
+    if build_match_query(term) and search_index_ready():
+        return [_rank_expression(table), model.id], False
+    return [model.created_at, model.id], True
+
+
+# ==================== SỰ KIỆN ORM ====================
+def _after_flush(session, flush_context):
+    """Đồng bộ chỉ mục cho sinh viên / giảng viên thay đổi trong lần flush"""
+    changed = {Student: set(), Lecturer: set()}
+    deleted = {Student: set(), Lecturer: set()}
+    user_ids = set()
+
+    for obj in session.new | session.dirty:
+        if isinstance(obj, (Student, Lecturer)):
+            changed[type(obj)].add(obj.id)
+        elif isinstance(obj, User) and obj not in session.new:
+            user_ids.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, (Student, Lecturer)):
+            deleted[type(obj)].add(obj.id)
+
+    if not any(changed.values()) and not any(deleted.values()) and not user_ids:
+        return
+    connection = session.connection()
+    if not search_index_ready(connection):
+        return
+
+    for table, (model, _) in SEARCH_TABLES.items():
+        if user_ids:
+            changed[model].update(connection.execute(
+                db.select(model.id).where(model.user_id.in_(user_ids))
+            ).scalars())
+        ids = changed[model] | deleted[model]
+        if ids:
+            # reindex xóa rồi thêm lại; bản ghi đã xóa sẽ không được thêm lại
+            reindex(table, ids, connection)
+
+
+def _after_create(target, connection, **kw):
+    create_search_tables(connection)
+
+
+def _before_drop(target, connection, **kw):
+    if _is_sqlite(connection):
+        for table in SEARCH_TABLES:
+            connection.execute(text(f'DROP TABLE IF EXISTS {table}'))
+    _ready_engines.discard(connection.engine.url)
+
+
+def register_search_events():
+    """Tạo/xóa bảng FTS5 cùng create_all/drop_all và đồng bộ chỉ mục sau mỗi lần flush"""
+    if not event.contains(db.metadata, 'after_create', _after_create):
+        event.listen(db.metadata, 'after_create', _after_create)
+        event.listen(db.metadata, 'before_drop', _before_drop)
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
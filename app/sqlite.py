@@ -0,0 +1,138 @@
+"""
+Cấu hình SQLite cho môi trường chạy đồng thời
+Mỗi kết nối mới trong pool được đặt các PRAGMA trong SQLITE_PRAGMAS (WAL để người đọc
+không bị chặn bởi người ghi, busy_timeout để chờ khóa thay vì báo "database is locked"
+ngay, ...). Bảo trì định kỳ (SQLITE_MAINTENANCE_INTERVAL giây): checkpoint WAL để file -wal
+không phình to và PRAGMA optimize để cập nhật thống kê cho bộ lập kế hoạch truy vấn.
+"""
+
+import logging
+import re
+import threading
+from weakref import WeakKeyDictionary
+from sqlalchemy import event, text
+from app import db
+from app.background import start_per_process
+
+logger = logging.getLogger('app.sqlite')
+
+_PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+_PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+# engine -> {pragma: giá trị} (listener đọc dict này nên có thể cập nhật tại chỗ)
+_pragmas = WeakKeyDictionary()
+# engine -> luồng bảo trì
+_maintenance = WeakKeyDictionary()
+_maintenance_lock = threading.Lock()
+
+
+def is_sqlite(engine):
+    return engine.dialect.name == 'sqlite'
+
+
+# ==================== PRAGMA ====================
+def _validate(pragmas):
+    for name, value in pragmas.items():
+        if not _PRAGMA_NAME.match(name) or not _PRAGMA_VALUE.match(str(value)):
+            raise ValueError(f'PRAGMA không hợp lệ: {name} = {value}')
+    return dict(pragmas)
+
+
+def _connect_listener(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        """Đặt PRAGMA cho kết nối DBAPI vừa mở"""
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def configure_engine(engine, pragmas):
+    """Áp dụng PRAGMA cho mọi kết nối mới của engine
+
+    Gọi lại với engine đã cấu hình: cập nhật PRAGMA và mở lại các kết nối trong pool.
+    """
+    if not is_sqlite(engine):
+        return
+    pragmas = _validate(pragmas)
+    if engine in _pragmas:
+        _pragmas[engine].clear()
+        _pragmas[engine].update(pragmas)
+        engine.dispose()
+    else:
+        _pragmas[engine] = pragmas
+        event.listen(engine, 'connect', _connect_listener(pragmas))
+
+
+def current_pragmas(connection=None):
+    """Giá trị PRAGMA thực tế của một kết nối - {tên: giá trị}"""
+    connection = connection if connection is not None else db.session.connection()
+    names = ['journal_mode', 'busy_timeout', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'foreign_keys']
+    return {name: connection.execute(text(f'PRAGMA {name}')).scalar() for name in names}
+
+
+# ==================== BẢO TRÌ ====================
+def run_maintenance(engine):
+    """Checkpoint WAL (TRUNCATE) và PRAGMA optimize - trả về dict kết quả"""
+    with engine.connect() as connection:
+        busy, log_frames, checkpointed = connection.execute(text('PRAGMA wal_checkpoint(TRUNCATE)')).one()
+        connection.execute(text('PRAGMA optimize'))
+        connection.commit()
+    return {'busy': bool(busy), 'wal_frames': log_frames, 'checkpointed': checkpointed}
+
+
+class _MaintenanceThread(threading.Thread):
+    """Chạy run_maintenance theo chu kỳ trong tiến trình hiện tại"""
+
+    def __init__(self, engine, interval):
+        super().__init__(name='sqlite-maintenance', daemon=True)
+        self.engine = engine
+        self.interval = interval
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            try:
+                result = run_maintenance(self.engine)
+                if result['busy']:
+                    logger.info('Checkpoint WAL chưa hoàn tất do đang có giao dịch đọc: %s', result)
+            except Exception:
+                logger.exception('Bảo trì SQLite thất bại')
+
+    def stop(self):
+        self._done.set()
+
+
+def start_maintenance(engine, interval):
+    """Bật luồng bảo trì cho engine (một luồng mỗi tiến trình)"""
+    if not interval or not is_sqlite(engine):
+        return None
+    with _maintenance_lock:
+        thread = _maintenance.get(engine)
+        if thread is None or not thread.is_alive():
+            thread = _maintenance[engine] = _MaintenanceThread(engine, interval)
+            thread.start()
+    return thread
+
+
+def stop_maintenance(engine):
+    with _maintenance_lock:
+        thread = _maintenance.pop(engine, None)
+    if thread is not None:
+        thread.stop()
+
+
+def register_sqlite(app):
+    """Đặt PRAGMA cho engine của app; luồng bảo trì bật ở request đầu tiên của mỗi tiến trình"""
+    with app.app_context():
+        engine = db.engine
+    if not is_sqlite(engine):
+        return
+    configure_engine(engine, app.config.get('SQLITE_PRAGMAS') or {})
+
+    interval = app.config.get('SQLITE_MAINTENANCE_INTERVAL')
+    if interval:
+        start_per_process(app, lambda: _maintenance.get(engine), lambda: start_maintenance(engine, interval))
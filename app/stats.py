@@ -0,0 +1,96 @@
+"""
+Thống kê tổng hợp cho dashboard
+Mọi con số được tính trực tiếp trong database bằng các truy vấn gộp (GROUP BY),
+số truy vấn cố định và không phụ thuộc vào số bản ghi.
+"""
+
+from app import db
+from app.models import Student, Lecturer, Subject, Classroom, Major, Material, Grade
+
+
+def get_headline_totals():
+    """Sáu chỉ số tổng quan - 1 truy vấn"""
+    counters = {
+        'total_students': Student,
+        'total_lecturers': Lecturer,
+        'total_subjects': Subject,
+        'total_classrooms': Classroom,
+        'total_majors': Major,
+        'total_materials': Material
+    }
+    columns = [
+        db.select(db.func.count()).select_from(model).scalar_subquery().label(key)
+        for key, model in counters.items()
+    ]
+    row = db.session.execute(db.select(*columns)).one()
+    return dict(row._mapping)
+
+
+def get_grade_distribution():
+    """Phân bố điểm chữ [A, B, C, D, F] - 1 truy vấn CASE + GROUP BY"""
+    letter = Grade.letter_grade_expr().label('letter')
+    rows = db.session.execute(
+        db.select(letter, db.func.count())
+        .where(Grade.score_total.isnot(None))
+        .group_by(letter)
+    ).all()
+    counts = dict(rows)
+    return [counts.get(l, 0) for l in Grade.LETTERS]
+
+
+def get_major_breakdown():
+    """Số sinh viên theo ngành (tên ngành, số SV) - 1 truy vấn LEFT JOIN + GROUP BY"""
+    rows = db.session.execute(
+        db.select(Major.name, db.func.count(Student.id))
+        .select_from(Major)
+        .outerjoin(Student, Student.major_id == Major.id)
+        .group_by(Major.id, Major.name)
+        .order_by(Major.id)
+    ).all()
+    return [(name, count) for name, count in rows]
+
+
+def _count_subquery(column, key):
+    """Truy vấn con tương quan đếm số bản ghi có column = key"""
+    return db.select(db.func.count()).where(column == key).correlate_except(column.table).scalar_subquery()
+
+
+def get_major_rows():
+    """Danh sách ngành kèm số sinh viên và số lớp - 1 truy vấn
+
+    Mỗi dòng có: id, code, name, description, student_count, classroom_count
+    """
+    return db.session.execute(
+        db.select(
+            Major.id, Major.code, Major.name, Major.description,
+            _count_subquery(Student.major_id, Major.id).label('student_count'),
+            _count_subquery(Classroom.major_id, Major.id).label('classroom_count')
+        ).order_by(Major.name)
+    ).all()
+
+
+def get_classroom_rows():
+    """Danh sách lớp kèm tên ngành, tên cố vấn và sĩ số - 1 truy vấn
+
+    Mỗi dòng có: id, name, academic_year, major_name, advisor_name, student_count
+    """
+    return db.session.execute(
+        db.select(
+            Classroom.id, Classroom.name, Classroom.academic_year,
+            Major.name.label('major_name'),
+            Lecturer.full_name.label('advisor_name'),
+            _count_subquery(Student.class_id, Classroom.id).label('student_count')
+        )
+        .outerjoin(Major, Major.id == Classroom.major_id)
+        .outerjoin(Lecturer, Lecturer.id == Classroom.advisor_id)
+        .order_by(Classroom.name)
+    ).all()
+
+
+def get_dashboard_stats():
+    """Toàn bộ số liệu cho dashboard Admin"""
+    return {
+        'stats': get_headline_totals(),
+        'major_breakdown': get_major_breakdown(),
+        'grade_distribution': get_grade_distribution()
+    }
@@ -0,0 +1,373 @@
+"""
+Kho file upload đánh địa chỉ theo nội dung (content-addressed)
+File upload được ghi dần ra file tạm trong lúc tính SHA-256, rồi đặt tại
+UPLOAD_FOLDER/blobs/<2 ký tự đầu>/<2 ký tự tiếp>/<sha256>. Material.file_path lưu tham chiếu
+'cas/<sha256>/<tên file>': nội dung trùng nhau chỉ lưu một lần, hai file cùng tên không ghi đè
+nhau. Bảng blobs đếm số tài liệu tham chiếu mỗi blob, cập nhật trong cùng transaction với thay
+đổi Material (sự kiện ORM); blob bị xóa sau commit khi tham chiếu cuối cùng biến mất.
+
+Đường dẫn cũ ('materials/<tên file>') vẫn tải được và được chuyển vào kho bằng lệnh
+flask storage migrate. flask storage gc đếm lại tham chiếu và dọn blob mồ côi, file tạm bỏ dở.
+Thay đổi Material bằng câu lệnh Core/bulk (không qua ORM) cần chạy lại gc để đếm lại.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import object_session
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+from app import db
+from app.dialects import dialect_insert
+from app.models import Material, Blob, Derivative, FileDigest
+
+PREFIX = 'cas/'
+BLOB_DIR = 'blobs'
+DERIVATIVE_DIR = 'derivatives'
+TEMP_DIR = 'tmp'
+CHUNK_SIZE = 1024 * 1024
+# Blob không có dòng trong bảng blobs / file tạm chỉ bị dọn khi cũ hơn (giây):
+# upload đang chạy đặt blob trước khi commit
+GC_GRACE = 3600
+MIGRATE_BATCH_SIZE = 100
+
+_DELTAS_KEY = 'storage_deltas'
+_UPLOADS_KEY = 'storage_uploads'
+_RELEASED_KEY = 'storage_released'
+
+StoredFile = namedtuple('StoredFile', 'path name sha256')
+
+
+# ==================== ĐƯỜNG DẪN ====================
+def parse_reference(file_path):
+    """(sha256, tên file) của tham chiếu 'cas/<sha256>/<tên>', None nếu là đường dẫn cũ"""
+    if not file_path or not file_path.startswith(PREFIX):
+        return None
+    sha256, _, name = file_path[len(PREFIX):].partition('/')
+    return sha256, name
+
+
+def blob_path(sha256):
+    """Đường dẫn tương đối (trong UPLOAD_FOLDER) của blob"""
+    return '/'.join((BLOB_DIR, sha256[:2], sha256[2:4], sha256))
+
+
+def derivative_path(sha256, name=''):
+    """Đường dẫn tương đối của thư mục (hoặc file name trong thư mục) bản dẫn xuất của blob"""
+    return '/'.join(part for part in (DERIVATIVE_DIR, sha256[:2], sha256[2:4], sha256, name) if part)
+
+
+def resolve(file_path):
+    """File thật của Material.file_path - StoredFile(path, name, sha256); sha256 None với đường dẫn cũ"""
+    reference = parse_reference(file_path)
+    if reference is None:
+        return StoredFile(file_path, os.path.basename(file_path), None)
+    sha256, name = reference
+    return StoredFile(blob_path(sha256), name, sha256)
+
+
+def _absolute(relative_path, root=None):
+    return os.path.join(root or current_app.config['UPLOAD_FOLDER'], *relative_path.split('/'))
+
+
+# ==================== GHI ====================
+def _publish(temp_path, target):
+    """Đặt nội dung file tạm vào vị trí blob nếu chưa có (hard link, hoặc chép rồi đổi tên)"""
+    if os.path.exists(target):
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(temp_path, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        # Hệ thống file không hỗ trợ hard link
+        copy_path = f'{temp_path}.copy'
+        shutil.copyfile(temp_path, copy_path)
+        os.replace(copy_path, target)
+
+
+def store_upload(file, filename):
+    """Ghi file upload (FileStorage hoặc file nhị phân) vào kho - trả về (file_path, kích thước)
+
+    Nội dung được đọc theo khối, vừa ghi ra file tạm vừa tính SHA-256. Blob có mặt ngay, nhưng
+    chỉ được tính tham chiếu khi Material chứa file_path được commit.
+    """
+    root = current_app.config['UPLOAD_FOLDER']
+    temp_dir = os.path.join(root, TEMP_DIR)
+    os.makedirs(temp_dir, exist_ok=True)
+    stream = getattr(file, 'stream', file)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir, prefix='upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return _adopt(temp_path, digest.hexdigest(), filename), size
+
+
+def store_file(path, filename):
+    """Đưa file đã có trên đĩa (VD file ghép từ upload theo phần) vào kho - trả về (file_path, kích thước)
+
+    File được chuyển (không chép) vào kho sau commit, hoặc bị xóa nếu nội dung đã có sẵn.
+    """
+    return _adopt(path, file_digest(path), filename), os.path.getsize(path)
+
+
+def file_digest(path):
+    """SHA-256 (hex) của nội dung file, đọc theo khối"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _adopt(temp_path, sha256, filename):
+    target = _absolute(blob_path(sha256))
+    try:
+        _publish(temp_path, target)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    # Giữ file tạm tới sau commit: blob có thể bị xóa bởi lần giải phóng tham chiếu cuối cùng
+    # chạy xen giữa (xem _after_commit)
+    db.session.info.setdefault(_UPLOADS_KEY, []).append((temp_path, target))
+    name = secure_filename(filename or '') or 'file'
+    return f'{PREFIX}{sha256}/{name}'
+
+
+# ==================== ĐẾM THAM CHIẾU ====================
+def _track(target, file_path, delta):
+    reference = parse_reference(file_path)
+    session = object_session(target)
+    if reference is None or session is None:
+        return
+    deltas = session.info.setdefault(_DELTAS_KEY, {})
+    count, size = deltas.get(reference[0], (0, 0))
+    deltas[reference[0]] = (count + delta, max(size, target.file_size or 0))
+
+
+def _file_path_history(target):
+    return db.inspect(target).attrs.file_path.history
+
+
+def _after_insert(mapper, connection, target):
+    _track(target, target.file_path, 1)
+
+
+def _after_delete(mapper, connection, target):
+    history = _file_path_history(target)
+    for file_path in (history.deleted or history.unchanged or ()):
+        _track(target, file_path, -1)
+
+
+def _after_update(mapper, connection, target):
+    history = _file_path_history(target)
+    if history.has_changes():
+        for file_path in history.deleted:
+            _track(target, file_path, -1)
+        for file_path in history.added:
+            _track(target, file_path, 1)
+
+
+def _after_flush(session, flush_context):
+    """Cập nhật ref_count một lần cho mỗi blob thay đổi trong lần flush"""
+    deltas = session.info.pop(_DELTAS_KEY, None)
+    if not deltas:
+        return
+    connection = session.connection()
+    table = Blob.__table__
+    released = session.info.setdefault(_RELEASED_KEY, {})
+    for sha256, (delta, size) in sorted(deltas.items()):
+        if delta > 0:
+            stmt = dialect_insert(connection, table).values(sha256=sha256, size=size, ref_count=delta,
+                                                            created_at=datetime.utcnow())
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=[table.c.sha256],
+                set_={'ref_count': table.c.ref_count + delta}
+            ))
+        elif delta < 0:
+            connection.execute(update(table).where(table.c.sha256 == sha256)
+                               .values(ref_count=table.c.ref_count + delta))
+            released[sha256] = current_app.config['UPLOAD_FOLDER']
+
+
+def release_blob(engine, sha256, root):
+    """Xóa blob (cùng các bản dẫn xuất của nó) nếu không còn tham chiếu - trả về True nếu đã xóa
+
+    File bị xóa trước khi transaction xóa dòng commit (khi vẫn giữ khóa ghi), nên upload cùng
+    nội dung commit sau đó luôn thấy blob đã mất và đặt lại từ file tạm của nó.
+    """
+    table = Blob.__table__
+    with engine.begin() as connection:
+        deleted = connection.execute(
+            table.delete().where(table.c.sha256 == sha256, table.c.ref_count <= 0)
+        ).rowcount
+        if deleted:
+            connection.execute(Derivative.__table__.delete().where(Derivative.sha256 == sha256))
+            try:
+                os.remove(_absolute(blob_path(sha256), root))
+            except FileNotFoundError:
+                pass
+            shutil.rmtree(_absolute(derivative_path(sha256), root), ignore_errors=True)
+    return bool(deleted)
+
+
+def _after_commit(session):
+    for temp_path, target in session.info.pop(_UPLOADS_KEY, ()):
+        if os.path.exists(target):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(temp_path, target)
+    released = session.info.pop(_RELEASED_KEY, None)
+    if released:
+        engine = session.get_bind()
+        for sha256, root in sorted(released.items()):
+            release_blob(engine, sha256, root)
+
+
+def _after_rollback(session):
+    session.info.pop(_DELTAS_KEY, None)
+    session.info.pop(_RELEASED_KEY, None)
+    # Blob đã đặt nhưng không có tham chiếu: gc dọn sau GC_GRACE giây
+    for temp_path, _ in session.info.pop(_UPLOADS_KEY, ()):
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+
+
+def register_storage_events():
+    """Đăng ký đếm tham chiếu blob theo thay đổi Material"""
+    if not event.contains(Material, 'after_update', _after_update):
+        event.listen(Material, 'after_insert', _after_insert)
+        event.listen(Material, 'after_delete', _after_delete)
+        event.listen(Material, 'after_update', _after_update)
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
+
+
+# ==================== CHUYỂN ĐỔI & DỌN DẸP ====================
+def migrate_legacy_files():
+    """Chuyển file theo đường dẫn cũ (UPLOAD_FOLDER/materials/...) vào kho, cập nhật file_path
+
+    Trả về dict: moved (số tài liệu), missing (tài liệu có đường dẫn nhưng không có file),
+    removed (số file cũ đã xóa).
+    """
+    root = current_app.config['UPLOAD_FOLDER']
+    result = {'moved': 0, 'missing': 0, 'removed': 0}
+    legacy = set()
+    materials = Material.query.filter(Material.file_path.isnot(None),
+                                      ~Material.file_path.startswith(PREFIX)).order_by(Material.id).all()
+    for index, material in enumerate(materials, 1):
+        path = safe_join(root, material.file_path)
+        if path is None or not os.path.isfile(path):
+            result['missing'] += 1
+            continue
+        with open(path, 'rb') as f:
+            material.file_path, material.file_size = store_upload(f, os.path.basename(path))
+        legacy.add(path)
+        result['moved'] += 1
+        if index % MIGRATE_BATCH_SIZE == 0:
+            db.session.commit()
+    db.session.commit()
+
+    # Chỉ xóa file cũ sau khi mọi tài liệu trỏ tới nó đã chuyển xong
+    for path in sorted(legacy):
+        try:
+            os.remove(path)
+            result['removed'] += 1
+        except FileNotFoundError:
+            pass
+    relative = [os.path.relpath(path, root).replace(os.sep, '/') for path in legacy]
+    if relative:
+        db.session.execute(FileDigest.__table__.delete().where(FileDigest.path.in_(relative)))
+        db.session.commit()
+    return result
+
+
+def _referenced_blobs():
+    """{sha256: (số tài liệu, kích thước)} tính trực tiếp từ bảng materials"""
+    rows = db.session.execute(
+        select(Material.file_path, Material.file_size).where(Material.file_path.startswith(PREFIX))
+    ).all()
+    referenced = {}
+    for file_path, size in rows:
+        sha256 = parse_reference(file_path)[0]
+        count, known = referenced.get(sha256, (0, 0))
+        referenced[sha256] = (count + 1, max(known, size or 0))
+    return referenced
+
+
+def collect_garbage(grace=GC_GRACE):
+    """Đếm lại tham chiếu, xóa blob không còn tham chiếu và file mồ côi cũ hơn grace giây
+
+    Trả về dict: recounted, released, orphans (blob và thư mục bản dẫn xuất), temp_files.
+    """
+    root = current_app.config['UPLOAD_FOLDER']
+    table = Blob.__table__
+    result = {'recounted': 0, 'released': 0, 'orphans': 0, 'temp_files': 0}
+
+    # Đếm lại bằng một câu UPDATE (nguyên tử với các thay đổi Material đang diễn ra)
+    live = (select(func.count()).select_from(Material.__table__)
+            .where(Material.file_path.startswith(PREFIX + table.c.sha256 + '/'))
+            .scalar_subquery())
+    result['recounted'] = db.session.execute(
+        update(table).where(table.c.ref_count != live).values(ref_count=live)
+    ).rowcount
+    known = set(db.session.execute(select(table.c.sha256)).scalars())
+    for sha256, (count, size) in _referenced_blobs().items():
+        if sha256 not in known and os.path.exists(_absolute(blob_path(sha256), root)):
+            stmt = dialect_insert(db.session.connection(), table).values(
+                sha256=sha256, size=size, ref_count=count, created_at=datetime.utcnow())
+            db.session.execute(stmt.on_conflict_do_nothing(index_elements=[table.c.sha256]))
+            known.add(sha256)
+            result['recounted'] += 1
+    db.session.commit()
+
+    unreferenced = db.session.execute(select(table.c.sha256).where(table.c.ref_count <= 0)).scalars().all()
+    for sha256 in unreferenced:
+        if release_blob(db.engine, sha256, root):
+            known.discard(sha256)
+            result['released'] += 1
+
+    cutoff = time.time() - grace
+    for directory, _, files in os.walk(os.path.join(root, BLOB_DIR)):
+        for name in files:
+            path = os.path.join(directory, name)
+            if name not in known and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                result['orphans'] += 1
+    db.session.execute(Derivative.__table__.delete().where(Derivative.sha256.notin_(select(table.c.sha256))))
+    db.session.commit()
+    for directory, subdirectories, _ in os.walk(os.path.join(root, DERIVATIVE_DIR)):
+        # derivatives/ab/cd/<sha256>
+        if len(os.path.relpath(directory, root).split(os.sep)) < 4:
+            continue
+        subdirectories[:] = []
+        if os.path.basename(directory) not in known and os.path.getmtime(directory) < cutoff:
+            shutil.rmtree(directory, ignore_errors=True)
+            result['orphans'] += 1
+    temp_dir = os.path.join(root, TEMP_DIR)
+    for name in os.listdir(temp_dir) if os.path.isdir(temp_dir) else ():
+        path = os.path.join(temp_dir, name)
+        if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            result['temp_files'] += 1
+    return result
@@ -0,0 +1,121 @@
+"""
+Các tác vụ nền chạy qua hàng đợi app/jobs.py
+Mỗi tác vụ nhận JobContext (báo tiến độ, kiểm tra hủy) và tham số đã lưu khi enqueue.
+"""
+
+import os
+from werkzeug.utils import secure_filename
+from app import db
+from app.jobs import task, output_path
+from app.models import Schedule, Classroom, Subject
+
+STAGES = {'validate': 'Kiểm tra dữ liệu', 'hash': 'Băm mật khẩu', 'insert': 'Ghi database'}
+
+
+# ==================== TÀI KHOẢN ====================
+@task('accounts.import', title='Nhập tài khoản từ file', max_attempts=1)
+def import_accounts(job, kind, filename, rows, skip_invalid=False):
+    """Nhập hàng loạt tài khoản (app/importer.py) - không thử lại: các lô đã ghi không hoàn tác"""
+    from app.importer import import_accounts as run_import
+
+    def progress(stage, done, total):
+        job.progress(done, total, STAGES.get(stage, stage))
+
+    report = run_import(kind, rows, skip_invalid, progress=progress)
+    return {
+        'kind': kind, 'filename': filename, 'total': report.total, 'created': report.created,
+        'skipped': report.skipped,
+        'errors': [{'row': error.row, 'field': error.field, 'message': error.message} for error in report.errors]
+    }
+
+
+# ==================== BẢO TRÌ ====================
+@task('academic.rebuild', title='Tính lại GPA và tín chỉ tích lũy')
+def rebuild_academic_summaries(job):
+    from app.academic import rebuild_summaries
+
+    job.progress(0, 1, 'Đang tính lại')
+    count = rebuild_summaries()
+    job.progress(1, 1, 'Xong')
+    return {'students': count}
+
+
+@task('search.rebuild', title='Dựng lại chỉ mục tìm kiếm')
+def rebuild_search_index(job):
+    from app.search import rebuild_search_index as rebuild
+
+    job.progress(0, 1, 'Đang dựng lại')
+    counts = rebuild()
+    job.progress(1, 1, 'Xong')
+    return counts
+
+
+@task('storage.gc', title='Dọn kho file tài liệu')
+def collect_storage_garbage(job):
+    from app.storage import GC_GRACE, collect_garbage
+
+    return collect_garbage(GC_GRACE)
+
+
+@task('derivatives.run', title='Tạo việc cho bản dẫn xuất còn thiếu')
+def enqueue_missing_derivatives(job):
+    """Tài liệu chưa có bản dẫn xuất (upload trước đây, việc bị hủy): mỗi blob một việc derivatives.generate"""
+    from app.derivatives import enqueue_missing
+
+    return {'enqueued': enqueue_missing()}
+
+
+@task('derivatives.generate', title='Tạo bản dẫn xuất tài liệu')
+def generate_derivative(job, sha256, file_type):
+    """Bản dẫn xuất của một blob - tạo bởi sự kiện upload (app/derivatives.py)"""
+    from app.derivatives import generate
+
+    return {'sha256': sha256, 'status': generate(job, sha256, file_type)}
+
+
+# ==================== BÁO CÁO ====================
+def _sheet_title(title, used):
+    """Tên sheet Excel: tối đa 31 ký tự, không có ký tự cấm, không trùng"""
+    title = ''.join('-' if ch in '[]:*?/\\' else ch for ch in title)[:31] or 'Sheet'
+    candidate, n = title, 1
+    while candidate in used:
+        n += 1
+        suffix = f' ({n})'
+        candidate = title[:31 - len(suffix)] + suffix
+    used.add(candidate)
+    return candidate
+
+
+@task('reports.grade_export', title='Xuất bảng điểm Excel')
+def export_grade_sheets(job, lecturer_id, semester):
+    """Bảng điểm mọi lớp/môn giảng viên dạy trong học kỳ - mỗi lớp/môn một sheet"""
+    from openpyxl import Workbook
+    from app.grading import load_grade_sheet
+
+    pairs = db.session.execute(
+        db.select(Classroom.id, Classroom.name, Subject.id, Subject.name)
+        .join(Schedule, Schedule.class_id == Classroom.id)
+        .join(Subject, Subject.id == Schedule.subject_id)
+        .where(Schedule.lecturer_id == lecturer_id)
+        .distinct().order_by(Classroom.name, Subject.name)
+    ).all()
+    filename = secure_filename(f'bang-diem-{semester}.xlsx')
+    path = output_path(job.id, filename)
+    workbook = Workbook(write_only=True)
+    used = set()
+    rows = 0
+    for index, (class_id, class_name, subject_id, subject_name) in enumerate(pairs):
+        job.progress(index, len(pairs), f'{class_name} - {subject_name}')
+        sheet = workbook.create_sheet(_sheet_title(f'{class_name} {subject_name}', used))
+        sheet.append(['MSSV', 'Họ tên', 'Chuyên cần', 'Giữa kỳ', 'Cuối kỳ', 'Tổng kết', 'Điểm chữ'])
+        for row in load_grade_sheet(class_id, subject_id, semester):
+            sheet.append([row.student_code, row.full_name, row.score_attendance, row.score_midterm,
+                          row.score_final, row.score_total, row.letter])
+            rows += 1
+    if not pairs:
+        workbook.create_sheet('Bảng điểm').append(['Không có lớp/môn nào trong học kỳ này'])
+    temp_path = f'{path}.tmp'
+    workbook.save(temp_path)
+    os.replace(temp_path, path)
+    job.progress(len(pairs), len(pairs), 'Xong')
+    return {'file': os.path.basename(path), 'download_name': filename, 'sheets': len(pairs), 'rows': rows}
@@ -0,0 +1,250 @@
+"""
+Phát hiện trùng lịch: phòng học, giảng viên và lớp không được có hai buổi chồng giờ
+Mỗi học kỳ có một chỉ mục trong tiến trình, gồm một cây khoảng tĩnh trên [giờ bắt đầu,
+giờ kết thúc) cho từng (tài nguyên, thứ). Tìm các buổi chồng lấn với một buổi mới tốn
+O(log n + k) thay vì quét cả thời khóa biểu của học kỳ.
+Chỉ mục được dựng lại khi phiên bản 'schedules:<học kỳ>' trong bảng reference_versions
+(app/refdata.py) thay đổi. Phiên bản này tăng trong cùng transaction với mọi thay đổi
+Schedule qua ORM. Thay đổi bằng câu lệnh Core/bulk phải tự gọi
+bump_versions(connection, version_key(học kỳ)).
+Hai buổi liền nhau (kết thúc 9:30, bắt đầu 9:30) không tính là trùng. Buổi có khoảng ngày
+học (start_date/end_date) rời nhau cũng không trùng. Buổi chưa đủ học kỳ/thứ/giờ thì không
+được kiểm tra.
+"""
+
+from collections import namedtuple
+from weakref import WeakKeyDictionary
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+from app import db
+from app.models import Schedule, Subject, Classroom, Lecturer
+from app.refdata import bump_versions, current_versions
+
+# Tài nguyên không dùng chung được cùng lúc: tên -> (nhãn, khóa của một buổi học)
+RESOURCES = {
+    'room': ('Phòng', lambda s: ' '.join(s.room_name.split()).casefold() if s.room_name else None),
+    'lecturer': ('Giảng viên', lambda s: s.lecturer_id),
+    'class': ('Lớp', lambda s: s.class_id)
+}
+
+# Cột ảnh hưởng tới chỉ mục (đổi môn học thì không cần dựng lại)
+INDEXED_COLUMNS = ('semester', 'room_name', 'lecturer_id', 'class_id', 'day_of_week',
+                   'start_time', 'end_time', 'start_date', 'end_date')
+
+_PENDING_KEY = 'timetable_changed'
+
+Slot = namedtuple('Slot', 'id start end start_date end_date')
+
+# Một xung đột: buổi đã có trong lịch và các tài nguyên bị trùng với nó
+Conflict = namedtuple('Conflict', 'schedule_id resources subject classroom lecturer room_name '
+                                  'day_of_week start_time end_time')
+
+# Một cặp buổi trùng nhau khi quét cả học kỳ
+Clash = namedtuple('Clash', 'resources day_of_week first second')
+
+# engine -> {học kỳ: (phiên bản, chỉ mục)}
+_indexes = WeakKeyDictionary()
+
+
+def version_key(semester):
+    """Tên phiên bản của lịch một học kỳ trong bảng reference_versions"""
+    return f'schedules:{semester}'
+
+
+# ==================== CÂY KHOẢNG ====================
+class IntervalIndex:
+    """Cây khoảng tĩnh: các buổi sắp theo giờ bắt đầu, cây nhị phân ngầm định trên mảng
+    (nút là phần tử giữa của đoạn) lưu giờ kết thúc muộn nhất của cây con"""
+
+    __slots__ = ('slots', 'max_end')
+
+    def __init__(self, slots):
+        self.slots = sorted(slots, key=lambda slot: (slot.start, slot.end))
+        self.max_end = [None] * len(self.slots)
+        if self.slots:
+            self._build(0, len(self.slots))
+
+    def _build(self, lo, hi):
+        mid = (lo + hi) // 2
+        latest = self.slots[mid].end
+        if lo < mid:
+            latest = max(latest, self._build(lo, mid))
+        if mid + 1 < hi:
+            latest = max(latest, self._build(mid + 1, hi))
+        self.max_end[mid] = latest
+        return latest
+
+    def overlapping(self, start, end):
+        """Các buổi có khoảng giờ giao với [start, end)"""
+        found = []
+        stack = [(0, len(self.slots))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            # Cả cây con kết thúc trước start: bỏ qua
+            if self.max_end[mid] <= start:
+                continue
+            stack.append((lo, mid))
+            slot = self.slots[mid]
+            # Nửa phải bắt đầu từ slot.start trở đi: chỉ xét khi slot.start < end
+            if slot.start < end:
+                if slot.end > start:
+                    found.append(slot)
+                stack.append((mid + 1, hi))
+        return found
+
+    def __len__(self):
+        return len(self.slots)
+
+
+def _dates_overlap(a, b):
+    """Khoảng ngày học giao nhau (thiếu ngày coi như không giới hạn)"""
+    return ((a.start_date is None or b.end_date is None or a.start_date <= b.end_date) and
+            (b.start_date is None or a.end_date is None or b.start_date <= a.end_date))
+
+
+def _indexable(schedule):
+    return (schedule.day_of_week is not None and schedule.start_time is not None and
+            schedule.end_time is not None)
+
+
+def build_index(rows):
+    """{(tài nguyên, khóa, thứ): IntervalIndex} từ các buổi của một học kỳ"""
+    groups = {}
+    for row in rows:
+        if not _indexable(row):
+            continue
+        slot = Slot(row.id, row.start_time, row.end_time, row.start_date, row.end_date)
+        for resource, (_, key_of) in RESOURCES.items():
+            key = key_of(row)
+            if key is not None:
+                groups.setdefault((resource, key, row.day_of_week), []).append(slot)
+    return {group: IntervalIndex(slots) for group, slots in groups.items()}
+
+
+def _load_rows(semester):
+    return db.session.execute(
+        select(Schedule.id, Schedule.room_name, Schedule.lecturer_id, Schedule.class_id,
+               Schedule.day_of_week, Schedule.start_time, Schedule.end_time,
+               Schedule.start_date, Schedule.end_date)
+        .where(Schedule.semester == semester)
+    ).all()
+
+
+def get_index(semester):
+    """Chỉ mục của một học kỳ - dựng lại khi phiên bản thay đổi"""
+    version = current_versions().get(version_key(semester), 0)
+    store = _indexes.setdefault(db.engine, {})
+    cached = store.get(semester)
+    if cached is None or cached[0] != version:
+        cached = (version, build_index(_load_rows(semester)))
+        store[semester] = cached
+    return cached[1]
+
+
+def clear_cache():
+    """Xóa toàn bộ chỉ mục trong tiến trình"""
+    _indexes.clear()
+
+
+# ==================== KIỂM TRA ====================
+def find_conflicts(schedule, exclude_id=None):
+    """Các buổi đã có trùng phòng / giảng viên / lớp với schedule (chưa cần lưu)
+    exclude_id: bỏ qua chính buổi đang sửa"""
+    if not schedule.semester or not _indexable(schedule):
+        return []
+    index = get_index(schedule.semester)
+    hits = {}
+    for resource, (_, key_of) in RESOURCES.items():
+        key = key_of(schedule)
+        tree = index.get((resource, key, schedule.day_of_week)) if key is not None else None
+        if tree is None:
+            continue
+        for slot in tree.overlapping(schedule.start_time, schedule.end_time):
+            if slot.id != exclude_id and _dates_overlap(slot, schedule):
+                hits.setdefault(slot.id, []).append(resource)
+    if not hits:
+        return []
+
+    details = schedule_details(Schedule.id.in_(hits))
+    return [Conflict(schedule_id, [RESOURCES[r][0] for r in hits[schedule_id]], *row)
+            for schedule_id, row in details.items()]
+
+
+def schedule_details(*criteria):
+    """{id: (môn, lớp, giảng viên, phòng, thứ, giờ bắt đầu, giờ kết thúc)} của các buổi thỏa
+    điều kiện, theo giờ bắt đầu - 1 truy vấn"""
+    rows = db.session.execute(
+        select(Schedule.id, Subject.name, Classroom.name, Lecturer.full_name, Schedule.room_name,
+               Schedule.day_of_week, Schedule.start_time, Schedule.end_time)
+        .outerjoin(Subject, Subject.id == Schedule.subject_id)
+        .outerjoin(Classroom, Classroom.id == Schedule.class_id)
+        .outerjoin(Lecturer, Lecturer.id == Schedule.lecturer_id)
+        .where(*criteria)
+        .order_by(Schedule.start_time, Schedule.id)
+    ).all()
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def check_semester(semester):
+    """Mọi cặp buổi trùng nhau trong một học kỳ, kèm các tài nguyên bị trùng"""
+    pairs = {}
+    for (resource, _, day), tree in get_index(semester).items():
+        for slot in tree.slots:
+            for other in tree.overlapping(slot.start, slot.end):
+                # Mỗi cặp báo một lần
+                if other.id > slot.id and _dates_overlap(slot, other):
+                    clash = pairs.setdefault((slot.id, other.id), Clash([], day, slot, other))
+                    clash.resources.append(resource)
+    return sorted(pairs.values(), key=lambda clash: (clash.day_of_week, clash.first.start, clash.first.id,
+                                                     clash.second.id))
+
+
+def semesters():
+    """Các học kỳ có lịch học"""
+    return db.session.execute(
+        select(Schedule.semester).where(Schedule.semester.isnot(None)).distinct().order_by(Schedule.semester)
+    ).scalars().all()
+
+
+# ==================== SỰ KIỆN ORM ====================
+def _mark(target, *changed):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, set()).update(semester for semester in changed if semester)
+
+
+def _after_insert_or_delete(mapper, connection, target):
+    _mark(target, target.semester)
+
+
+def _after_update(mapper, connection, target):
+    attrs = db.inspect(target).attrs
+    if any(attrs[name].history.has_changes() for name in INDEXED_COLUMNS):
+        # Đổi học kỳ: cả học kỳ cũ lẫn mới đều thay đổi
+        _mark(target, target.semester, *attrs.semester.history.deleted)
+
+
+def _after_flush(session, flush_context):
+    """Tăng phiên bản một lần cho mỗi học kỳ có lịch thay đổi trong lần flush"""
+    changed = session.info.pop(_PENDING_KEY, None)
+    if changed:
+        bump_versions(session.connection(), *(version_key(semester) for semester in changed))
+
+
+def _before_drop(target, connection, **kw):
+    _indexes.pop(connection.engine, None)
+
+
+def register_timetable_events():
+    """Đăng ký tăng phiên bản lịch học kỳ sau mỗi lần flush có thay đổi Schedule"""
+    if not event.contains(Schedule, 'after_update', _after_update):
+        event.listen(Schedule, 'after_insert', _after_insert_or_delete)
+        event.listen(Schedule, 'after_delete', _after_insert_or_delete)
+        event.listen(Schedule, 'after_update', _after_update)
+    if not event.contains(db.metadata, 'before_drop', _before_drop):
+        event.listen(db.metadata, 'before_drop', _before_drop)
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
@@ -0,0 +1,244 @@
+"""
+Upload tài liệu lớn theo từng phần, tiếp tục được sau khi bị gián đoạn
+Giao thức JSON dưới /lecturer/uploads (app/routes/lecturer.py):
+  POST   /uploads                  tạo phiên (filename, size, subject_id, title, description)
+                                   -> id, chunk_size, chunk_count, expires_at
+  PUT    /uploads/<id>?offset=N    gửi một phần: thân request là nội dung, offset là bội số của
+                                   chunk_size, độ dài đúng chunk_size (phần cuối: phần còn lại)
+  GET    /uploads/<id>             các khoảng byte đã nhận
+  POST   /uploads/<id>/finalize    đủ các phần -> đưa file vào kho (app/storage.py), tạo Material
+  DELETE /uploads/<id>             hủy phiên
+
+Mỗi phần được ghi thẳng vào vị trí của nó trong file UPLOAD_FOLDER/tmp/chunked-<id>.part (tạo
+sẵn đủ kích thước). Phần đã nhận được ghi vào bảng upload_chunks nên gửi lại một phần là vô hại
+và các phần của một phiên có thể do nhiều worker nhận. MATERIAL_UPLOAD_MAX_SIZE giới hạn cả
+phiên; mỗi request chỉ mang một phần (UPLOAD_CHUNK_SIZE nhỏ hơn MAX_CONTENT_LENGTH). Phiên không
+nhận thêm phần nào trong UPLOAD_SESSION_TTL giây thì hết hạn và bị xóa.
+"""
+
+import os
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, select, update
+from werkzeug.utils import secure_filename
+from app import db
+from app.dialects import dialect_insert
+from app.models import Material, UploadSession, UploadChunk
+from app.storage import TEMP_DIR, store_file
+
+COPY_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Lỗi giao thức upload - status là mã HTTP trả về cho client"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def part_path(upload_id):
+    """File đang ghép của phiên"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], TEMP_DIR, f'chunked-{upload_id}.part')
+
+
+def _allocate_part(upload_id, size):
+    path = part_path(upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        # File thưa: chưa chiếm dung lượng cho tới khi phần tương ứng được ghi
+        f.truncate(size)
+
+
+def _remove_part(upload_id):
+    try:
+        os.remove(part_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+
+def _expires_at():
+    return datetime.utcnow() + timedelta(seconds=current_app.config['UPLOAD_SESSION_TTL'])
+
+
+# ==================== PHIÊN ====================
+def create_session(lecturer_id, subject_id, title, description, filename, size):
+    """Tạo phiên upload và file đích đủ kích thước - trả về UploadSession"""
+    filename = secure_filename(filename or '')
+    extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    if extension not in current_app.config['ALLOWED_EXTENSIONS']:
+        raise UploadError('Định dạng file không được phép!')
+    if not title:
+        raise UploadError('Thiếu tiêu đề tài liệu!')
+    max_size = current_app.config['MATERIAL_UPLOAD_MAX_SIZE']
+    if size <= 0:
+        raise UploadError('File rỗng!')
+    if size > max_size:
+        raise UploadError(f'File vượt quá giới hạn {max_size // (1024 * 1024)} MB!', 413)
+
+    expire_sessions()
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        lecturer_id=lecturer_id,
+        subject_id=subject_id,
+        title=title,
+        description=description,
+        filename=filename,
+        size=size,
+        chunk_size=current_app.config['UPLOAD_CHUNK_SIZE'],
+        expires_at=_expires_at()
+    )
+    _allocate_part(upload.id, size)
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+
+def get_session(upload_id, lecturer_id):
+    """Phiên upload của giảng viên - 404 nếu không có hoặc đã hết hạn"""
+    upload = db.session.get(UploadSession, upload_id)
+    if upload is None or upload.lecturer_id != lecturer_id or upload.expires_at < datetime.utcnow():
+        raise UploadError('Phiên upload không tồn tại hoặc đã hết hạn!', 404)
+    return upload
+
+
+def received_indexes(upload):
+    return db.session.execute(
+        select(UploadChunk.chunk_index).where(UploadChunk.session_id == upload.id).order_by(UploadChunk.chunk_index)
+    ).scalars().all()
+
+
+def received_ranges(upload, indexes=None):
+    """Các khoảng byte đã nhận [[đầu, cuối), ...], các phần liền nhau được gộp"""
+    ranges = []
+    for index in received_indexes(upload) if indexes is None else indexes:
+        start = index * upload.chunk_size
+        end = min(start + upload.chunk_size, upload.size)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+def describe(upload):
+    """Trạng thái phiên cho client"""
+    indexes = received_indexes(upload)
+    ranges = received_ranges(upload, indexes)
+    return {
+        'id': upload.id,
+        'filename': upload.filename,
+        'size': upload.size,
+        'chunk_size': upload.chunk_size,
+        'chunk_count': upload.chunk_count,
+        'received': ranges,
+        'received_bytes': sum(end - start for start, end in ranges),
+        'complete': len(indexes) == upload.chunk_count,
+        'expires_at': upload.expires_at.isoformat() + 'Z'
+    }
+
+
+# ==================== NHẬN PHẦN ====================
+def write_chunk(upload, offset, stream, length):
+    """Ghi một phần vào đúng vị trí trong file đích rồi đánh dấu đã nhận"""
+    if upload.status != 'open':
+        raise UploadError('Phiên upload đang được hoàn tất!', 409)
+    if offset < 0 or offset >= upload.size or offset % upload.chunk_size:
+        raise UploadError(f'offset phải là bội số của {upload.chunk_size} và nhỏ hơn kích thước file!')
+    expected = min(upload.chunk_size, upload.size - offset)
+    if length != expected:
+        raise UploadError(f'Phần tại offset {offset} phải dài {expected} bytes!')
+
+    received = 0
+    try:
+        with open(part_path(upload.id), 'r+b') as f:
+            f.seek(offset)
+            while received < expected:
+                data = stream.read(min(COPY_SIZE, expected - received))
+                if not data:
+                    break
+                f.write(data)
+                received += len(data)
+    except FileNotFoundError:
+        raise UploadError('Phiên upload không tồn tại hoặc đã hết hạn!', 404)
+    if received != expected:
+        # Kết nối đứt giữa chừng: phần này chưa được đánh dấu, client gửi lại
+        raise UploadError(f'Chỉ nhận được {received}/{expected} bytes!')
+
+    connection = db.session.connection()
+    connection.execute(dialect_insert(connection, UploadChunk.__table__)
+                       .values(session_id=upload.id, chunk_index=offset // upload.chunk_size)
+                       .on_conflict_do_nothing())
+    upload.expires_at = _expires_at()
+    db.session.commit()
+
+
+# ==================== HOÀN TẤT ====================
+def finalize(upload):
+    """Kiểm tra đủ phần, đưa file vào kho và tạo Material - trả về Material"""
+    # Chỉ một request được hoàn tất phiên
+    claimed = db.session.execute(
+        update(UploadSession).where(UploadSession.id == upload.id, UploadSession.status == 'open')
+        .values(status='finalizing')
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        raise UploadError('Phiên upload đang được hoàn tất!', 409)
+    db.session.refresh(upload)
+    received = len(received_indexes(upload))
+    if received != upload.chunk_count:
+        db.session.rollback()
+        raise UploadError(f'Mới nhận {received}/{upload.chunk_count} phần!', 409)
+    db.session.commit()
+
+    try:
+        file_path, file_size = store_file(part_path(upload.id), upload.filename)
+        material = Material(
+            subject_id=upload.subject_id,
+            uploaded_by=upload.lecturer_id,
+            title=upload.title,
+            description=upload.description,
+            file_path=file_path,
+            file_type=upload.filename.rsplit('.', 1)[1].lower(),
+            file_size=file_size
+        )
+        db.session.add(material)
+        _delete_sessions([upload.id])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # Mở lại phiên để client thử hoàn tất lần nữa. File ghép đã được giao cho kho thì bị
+        # xóa khi rollback: bỏ đánh dấu mọi phần để client gửi lại từ đầu
+        if not os.path.exists(part_path(upload.id)):
+            db.session.execute(delete(UploadChunk).where(UploadChunk.session_id == upload.id))
+            _allocate_part(upload.id, upload.size)
+        db.session.execute(update(UploadSession).where(UploadSession.id == upload.id).values(status='open'))
+        db.session.commit()
+        raise
+    return material
+
+
+def abort_session(upload):
+    """Hủy phiên và xóa phần đã nhận"""
+    _delete_sessions([upload.id])
+    db.session.commit()
+    _remove_part(upload.id)
+
+
+def _delete_sessions(upload_ids):
+    db.session.execute(delete(UploadChunk).where(UploadChunk.session_id.in_(upload_ids)))
+    db.session.execute(delete(UploadSession).where(UploadSession.id.in_(upload_ids)))
+
+
+def expire_sessions():
+    """Xóa phiên hết hạn (cả phiên hoàn tất bỏ dở) và file đang ghép của chúng - trả về số phiên"""
+    expired = db.session.execute(
+        select(UploadSession.id).where(UploadSession.expires_at < datetime.utcnow())
+    ).scalars().all()
+    if expired:
+        _delete_sessions(expired)
+        db.session.commit()
+        for upload_id in expired:
+            _remove_part(upload_id)
+    return len(expired)
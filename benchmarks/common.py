@@ -0,0 +1,95 @@
+"""
+Tiện ích dùng chung cho các benchmark
+Mỗi benchmark chạy trên một database SQLite tạm, không đụng tới ums.db
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from statistics import median
+
+BENCH_DIR = tempfile.mkdtemp(prefix='ums-bench-')
+os.environ.setdefault('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(BENCH_DIR, 'bench.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import User  # noqa: E402
+
+
+def create_bench_app():
+    """Tạo app cấu hình testing và database rỗng"""
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+def create_user(username, password, role='admin'):
+    """Tạo tài khoản dùng để đăng nhập khi benchmark"""
+    user = User(username=username, email=f'{username}@bench.local', role=role)
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def login(client, username, password):
+    """Đăng nhập bằng test client"""
+    response = client.post('/login', data={'username': username, 'password': password})
+    assert response.status_code == 302, f'Đăng nhập thất bại: {username}'
+
+
+def measure(fn, repeat=5):
+    """Chạy fn nhiều lần, trả về (độ trễ trung vị ms, bộ nhớ đỉnh KB)"""
+    fn()  # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return median(timings), peak / 1024
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Đếm số câu SQL được gửi tới database trong khối with - kết quả ở counter[0]
+
+    Truyền engine khi gọi request bằng test client: nếu bọc request trong app context,
+    các request dùng chung một session và đối tượng được lấy từ identity map thay vì SQL.
+    """
+    counter = [0]
+    
+    def before_cursor_execute(*args):
+        counter[0] += 1
+    
+    engine = engine if engine is not None else db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def percentile(values, pct):
+    """Phân vị pct (0-100) theo phương pháp nearest-rank"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def print_table(headers, rows):
+    """In bảng kết quả dạng văn bản"""
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print('  '.join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print('  '.join(str(c).rjust(w) for c, w in zip(row, widths)))
@@ -0,0 +1,136 @@
+"""
+Thông lượng đọc trong khi lưu điểm: SQLite mặc định so với cấu hình SQLITE_PRAGMAS
+Chạy: python -m benchmarks.concurrency [--scale 1k] [--readers 8] [--duration 10]
+
+Một luồng giảng viên liên tục lưu điểm cả lớp (lecturer.save_grades, điểm ngẫu nhiên để
+mọi dòng đều được ghi) trong khi các luồng sinh viên liên tục xem bảng điểm (student.grades).
+Cùng một database được chạy hai lần: journal rollback mặc định của SQLite (DELETE,
+synchronous=FULL) và cấu hình của app (WAL, busy_timeout, ...). Kết quả: số request đọc/ghi
+mỗi giây, độ trễ p50/p99 và số lỗi "database is locked".
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+from benchmarks.common import create_bench_app, login, percentile, print_table, db
+from benchmarks.dataset import SCALES, PASSWORD, generate
+from benchmarks.routes import sample_ids
+from app.models import Student
+from app.sqlite import configure_engine, current_pragmas
+
+# PRAGMA mặc định của SQLite: journal rollback, fsync mỗi commit
+DEFAULT_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+class Worker(threading.Thread):
+    """Gọi một request lặp lại tới khi hết giờ, ghi nhận độ trễ và lỗi khóa"""
+
+    def __init__(self, client, call, deadline):
+        super().__init__(daemon=True)
+        self.client = client
+        self.call = call
+        self.deadline = deadline
+        self.timings = []
+        self.locked = 0
+        self.failed = 0
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            start = time.perf_counter()
+            try:
+                status = self.call(self.client).status_code
+            except OperationalError as e:
+                if 'database is locked' not in str(e):
+                    raise
+                self.locked += 1
+                continue
+            if status >= 400:
+                self.failed += 1
+            else:
+                self.timings.append((time.perf_counter() - start) * 1000)
+
+
+def summarize(mode, role, workers, duration):
+    timings = [t for w in workers for t in w.timings]
+    return {
+        'mode': mode, 'role': role, 'ok': len(timings),
+        'per_s': round(len(timings) / duration, 1),
+        'p50_ms': round(percentile(timings, 50), 1) if timings else '-',
+        'p99_ms': round(percentile(timings, 99), 1) if timings else '-',
+        'locked': sum(w.locked for w in workers),
+        'failed': sum(w.failed for w in workers)
+    }
+
+
+def run_mode(app, engine, mode, pragmas, ids, readers, duration):
+    """Đặt PRAGMA cho engine rồi chạy đồng thời 1 luồng ghi và readers luồng đọc"""
+    configure_engine(engine, pragmas)
+    with app.app_context():
+        actual = current_pragmas()
+        db.session.rollback()
+    print(f'{mode}: journal_mode={actual["journal_mode"]} synchronous={actual["synchronous"]} '
+          f'busy_timeout={actual["busy_timeout"]}', file=sys.stderr)
+
+    writer_client = app.test_client()
+    login(writer_client, 'gv00001', PASSWORD)
+    reader_clients = []
+    for i in range(readers):
+        client = app.test_client()
+        login(client, f'sv{i + 1:06d}', PASSWORD)
+        reader_clients.append(client)
+
+    rng = random.Random(0)
+
+    def save_grades(client):
+        data = {'class_id': ids['class_id'], 'subject_id': ids['subject_id'], 'semester': ids['semester']}
+        for student_id in ids['class_students']:
+            data[f'attendance_{student_id}'] = rng.randint(5, 10)
+            data[f'midterm_{student_id}'] = rng.randint(0, 10)
+            data[f'final_{student_id}'] = rng.randint(0, 10)
+        return client.post('/lecturer/grades/save', data=data)
+
+    def view_grades(client):
+        return client.get('/student/grades')
+
+    deadline = time.monotonic() + duration
+    writer = Worker(writer_client, save_grades, deadline)
+    reader_threads = [Worker(client, view_grades, deadline) for client in reader_clients]
+    for worker in [writer, *reader_threads]:
+        worker.start()
+    for worker in [writer, *reader_threads]:
+        worker.join()
+    return [summarize(mode, 'read', reader_threads, duration), summarize(mode, 'write', [writer], duration)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', choices=list(SCALES), default='1k')
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    with app.app_context():
+        generate(args.scale, echo=lambda message: print(message, file=sys.stderr))
+        ids = sample_ids()
+        ids['class_students'] = db.session.execute(
+            db.select(Student.id).where(Student.class_id == ids['class_id'])
+        ).scalars().all()
+        engine = db.engine
+
+    results = []
+    for mode, pragmas in (('sqlite-default', DEFAULT_PRAGMAS), ('tuned', app.config['SQLITE_PRAGMAS'])):
+        results.extend(run_mode(app, engine, mode, pragmas, ids, args.readers, args.duration))
+
+    print(f'\n{args.readers} luồng đọc student.grades, 1 luồng lưu điểm lớp {len(ids["class_students"])} '
+          f'sinh viên, {args.duration:.0f} giây mỗi chế độ')
+    print_table(['mode', 'role', 'ok', 'per_s', 'p50_ms', 'p99_ms', 'locked', 'failed'],
+                [tuple(r.values()) for r in results])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark dashboard Admin theo kích thước bảng điểm
+Chạy: python -m benchmarks.dashboard [--sizes 1000 10000 100000 300000]
+
+Bộ nhớ đỉnh của admin.dashboard không đổi khi bảng grades tăng vì phân bố điểm và
+phân bố theo ngành được tính gộp trong database; độ trễ chỉ còn chi phí quét chỉ mục
+score_total trong SQLite thay vì nạp toàn bộ bảng điểm vào Python.
+"""
+
+import argparse
+import random
+
+from benchmarks.common import create_bench_app, create_user, login, measure, print_table, db
+from app.models import Major, Classroom, Student, Subject, Grade, User
+
+STUDENTS = 2000
+SUBJECTS = 20
+
+
+def build_base_data():
+    """Ngành, lớp, môn học và sinh viên - cố định cho mọi kích thước"""
+    majors = [{'code': f'M{i}', 'name': f'Ngành {i}'} for i in range(10)]
+    db.session.execute(db.insert(Major), majors)
+    db.session.execute(db.insert(Classroom), [
+        {'name': f'L{i}', 'major_id': i % 10 + 1} for i in range(40)
+    ])
+    db.session.execute(db.insert(Subject), [
+        {'code': f'S{i}', 'name': f'Môn {i}', 'credits': 3} for i in range(SUBJECTS)
+    ])
+    db.session.execute(db.insert(User), [
+        {'username': f'sv{i}', 'email': f'sv{i}@bench.local', 'password_hash': '-', 'role': 'student'}
+        for i in range(STUDENTS)
+    ])
+    first_user_id = db.session.execute(db.select(db.func.min(User.id)).where(User.role == 'student')).scalar()
+    db.session.execute(db.insert(Student), [
+        {'user_id': first_user_id + i, 'student_code': f'SV{i:06d}', 'full_name': f'Sinh viên {i}',
+         'class_id': i % 40 + 1, 'major_id': i % 10 + 1}
+        for i in range(STUDENTS)
+    ])
+    db.session.commit()
+
+
+def grow_grades(current, target):
+    """Thêm điểm cho tới khi bảng grades có target dòng"""
+    rows = []
+    for n in range(current, target):
+        semester, rest = divmod(n, STUDENTS * SUBJECTS)
+        student, subject = divmod(rest, SUBJECTS)
+        rows.append({
+            'student_id': student + 1,
+            'subject_id': subject + 1,
+            'semester': f'HK{semester}',
+            'score_total': round(random.uniform(0, 10), 2)
+        })
+        if len(rows) >= 50000:
+            db.session.execute(db.insert(Grade), rows)
+            rows = []
+    if rows:
+        db.session.execute(db.insert(Grade), rows)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 300000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    app = create_bench_app()
+    client = app.test_client()
+    with app.app_context():
+        build_base_data()
+        create_user('bench_admin', 'bench123')
+    login(client, 'bench_admin', 'bench123')
+    
+    def request_dashboard():
+        response = client.get('/admin/dashboard')
+        assert response.status_code == 200
+    
+    results = []
+    current = 0
+    for size in sorted(args.sizes):
+        with app.app_context():
+            grow_grades(current, size)
+        current = size
+        latency, peak = measure(request_dashboard, args.repeat)
+        results.append((size, f'{latency:.1f}', f'{peak:.0f}'))
+    
+    print_table(['grades', 'latency_ms', 'peak_kb'], results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""
+Sinh dữ liệu giả lập ở quy mô trường đại học thật
+Chạy: [TEST_DATABASE_URL=sqlite:///big.db] python -m benchmarks.dataset --scale 1k [--seed 42]
+
+Mọi bảng được ghi bằng INSERT nhiều dòng (executemany) với id gán trước, không flush
+từng bản ghi như seed_data.py. Dữ liệu sinh ra phụ thuộc duy nhất vào (scale, seed) nên
+kết quả benchmark giữa các commit so sánh được với nhau.
+
+Tài khoản: admin / admin123, giảng viên gv00001..., sinh viên sv000001... (mật khẩu 123456)
+"""
+
+import argparse
+import random
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+from benchmarks.common import db
+from app import create_app
+from app.models import (User, Major, Classroom, Lecturer, Student, Subject,
+                        Schedule, Grade, Material, Evaluation)
+from app.academic import rebuild_summaries
+from app.search import rebuild_search_index
+from app.refdata import REFERENCE_TABLES, bump_versions
+from app.timetable import version_key
+from app.passwords import hash_password
+
+# Quy mô: số sinh viên và số học kỳ đã có điểm
+SCALES = {
+    'tiny': {'students': 200, 'semesters': 2},
+    '1k': {'students': 1000, 'semesters': 8},
+    '50k': {'students': 50000, 'semesters': 4},
+    '500k': {'students': 500000, 'semesters': 2}
+}
+
+MAJOR_COUNT = 12
+CLASS_SIZE = 50                 # Sĩ số một lớp hành chính
+STUDENTS_PER_LECTURER = 25
+SUBJECTS_PER_SEMESTER = 6       # Số môn mỗi lớp học trong một học kỳ
+SUBJECTS_PER_MAJOR = 48
+MATERIALS_PER_SUBJECT = 3
+EVALUATION_RATE = 0.3           # Tỷ lệ sinh viên có đánh giá giảng viên
+CHUNK_SIZE = 20000
+
+PASSWORD = '123456'
+ADMIN_PASSWORD = 'admin123'
+
+LAST_NAMES = ['Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Huỳnh', 'Phan', 'Vũ', 'Võ', 'Đặng',
+              'Bùi', 'Đỗ', 'Hồ', 'Ngô', 'Dương', 'Lý']
+MIDDLE_NAMES = ['Văn', 'Thị', 'Hữu', 'Minh', 'Thanh', 'Ngọc', 'Đức', 'Quang', 'Thu', 'Anh']
+FIRST_NAMES = ['An', 'Bình', 'Cường', 'Dung', 'Hương', 'Hải', 'Hùng', 'Lan', 'Linh', 'Long',
+               'Mai', 'Nam', 'Phong', 'Quân', 'Sơn', 'Tâm', 'Thảo', 'Trang', 'Tuấn', 'Vy']
+MAJOR_NAMES = ['Công nghệ Thông tin', 'Quản trị Kinh doanh', 'Kế toán', 'Điện tử Viễn thông',
+               'An toàn Thông tin', 'Khoa học Dữ liệu', 'Tài chính Ngân hàng', 'Marketing',
+               'Ngôn ngữ Anh', 'Luật Kinh tế', 'Kỹ thuật Phần mềm', 'Logistics']
+DEGREES = ['ThS', 'ThS', 'TS', 'TS', 'PGS', 'GS']
+SLOTS = [(dtime(7, 0), dtime(9, 30)), (dtime(9, 45), dtime(12, 15)),
+         (dtime(13, 0), dtime(15, 30)), (dtime(15, 45), dtime(18, 15))]
+FILE_TYPES = ['pdf', 'pdf', 'pptx', 'docx', 'zip']
+
+
+def semester_names(count, last_year=2024):
+    """count học kỳ gần nhất, kết thúc ở HK2-last_year"""
+    names = []
+    year, term = last_year, 2
+    for _ in range(count):
+        names.append(f'HK{term}-{year}')
+        year, term = (year, 1) if term == 2 else (year - 1, 2)
+    return list(reversed(names))
+
+
+def _full_name(rng):
+    return f'{rng.choice(LAST_NAMES)} {rng.choice(MIDDLE_NAMES)} {rng.choice(FIRST_NAMES)}'
+
+
+def _score(rng, mean, spread):
+    return round(min(10, max(0, rng.gauss(mean, spread))), 1)
+
+
+class DatasetBuilder:
+    """Sinh và ghi dữ liệu theo từng bảng"""
+
+    def __init__(self, scale, seed=42, echo=print):
+        if scale not in SCALES:
+            raise KeyError(f'Quy mô không tồn tại: {scale} (có: {", ".join(SCALES)})')
+        self.scale = scale
+        self.rng = random.Random(seed)
+        self.echo = echo
+        self.students = SCALES[scale]['students']
+        self.semesters = semester_names(SCALES[scale]['semesters'])
+        self.classrooms = max(1, -(-self.students // CLASS_SIZE))
+        self.lecturers = max(5, self.students // STUDENTS_PER_LECTURER)
+        self.subjects = MAJOR_COUNT * SUBJECTS_PER_MAJOR
+        self.counts = {}
+        self.started = datetime(2024, 1, 1)
+
+    # ==================== GHI ====================
+    def _insert(self, model, rows):
+        """Ghi rows (iterable dict) theo lô CHUNK_SIZE dòng"""
+        table = model.__table__
+        count = 0
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= CHUNK_SIZE:
+                db.session.execute(db.insert(table), chunk)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            db.session.execute(db.insert(table), chunk)
+            count += len(chunk)
+        self.counts[table.name] = self.counts.get(table.name, 0) + count
+        self.echo(f'  {table.name}: {self.counts[table.name]}')
+
+    # ==================== QUAN HỆ GIỮA CÁC BẢNG ====================
+    def lecturer_user_id(self, lecturer_id):
+        return lecturer_id + 1  # user 1 là admin
+
+    def student_user_id(self, student_id):
+        return self.lecturers + student_id + 1
+
+    def major_of_class(self, class_id):
+        return (class_id - 1) % MAJOR_COUNT + 1
+
+    def class_of_student(self, student_id):
+        return (student_id - 1) // CLASS_SIZE + 1
+
+    def subject_for(self, class_id, semester_index, slot):
+        """Môn thứ slot của lớp trong học kỳ - theo chương trình của ngành"""
+        major = self.major_of_class(class_id)
+        offset = (semester_index * SUBJECTS_PER_SEMESTER + slot) % SUBJECTS_PER_MAJOR
+        return (major - 1) * SUBJECTS_PER_MAJOR + offset + 1
+
+    def lecturer_for(self, subject_id, class_id):
+        """Mỗi môn có một nhóm giảng viên, chia lớp xoay vòng"""
+        return (subject_id * 7 + class_id) % self.lecturers + 1
+
+    # ==================== BẢNG ====================
+    def build(self):
+        rng = self.rng
+        password_hash = hash_password(PASSWORD)
+
+        self._insert(User, self._users(password_hash))
+        self._insert(Major, (
+            {'id': i, 'code': f'M{i:02d}', 'name': MAJOR_NAMES[(i - 1) % len(MAJOR_NAMES)],
+             'description': f'Chương trình đào tạo ngành {MAJOR_NAMES[(i - 1) % len(MAJOR_NAMES)]}'}
+            for i in range(1, MAJOR_COUNT + 1)
+        ))
+        self._insert(Lecturer, (
+            {'id': i, 'user_id': self.lecturer_user_id(i), 'lecturer_code': f'GV{i:05d}', 'full_name': _full_name(rng),
+             'department': f'Khoa {MAJOR_NAMES[(i - 1) % MAJOR_COUNT]}', 'degree': rng.choice(DEGREES),
+             'created_at': self.started + timedelta(minutes=i)}
+            for i in range(1, self.lecturers + 1)
+        ))
+        self._insert(Classroom, (
+            {'id': c, 'name': f'{self.major_of_class(c):02d}-K{c:05d}', 'major_id': self.major_of_class(c),
+             'advisor_id': (c - 1) % self.lecturers + 1, 'academic_year': f'{2021 + c % 4}-{2025 + c % 4}'}
+            for c in range(1, self.classrooms + 1)
+        ))
+        self._insert(Subject, (
+            {'id': s, 'code': f'MH{s:04d}', 'name': f'Học phần {s}', 'credits': 2 + s % 3,
+             'theory_hours': 30, 'practice_hours': 15}
+            for s in range(1, self.subjects + 1)
+        ))
+        self._insert(Student, (
+            {'id': i, 'user_id': self.student_user_id(i), 'student_code': f'SV{i:06d}', 'full_name': _full_name(rng),
+             'gender': rng.choice(['Nam', 'Nữ']), 'dob': date(2003, 1, 1) + timedelta(days=rng.randrange(1500)),
+             'class_id': self.class_of_student(i), 'major_id': self.major_of_class(self.class_of_student(i)),
+             'enrollment_year': 2021 + self.class_of_student(i) % 4,
+             'created_at': self.started + timedelta(seconds=i)}
+            for i in range(1, self.students + 1)
+        ))
+        self._insert(Schedule, self._schedules())
+        self._insert(Grade, self._grades())
+        self._insert(Material, (
+            {'subject_id': s, 'uploaded_by': self.lecturer_for(s, 1), 'title': f'Bài giảng {k} - Học phần {s}',
+             'file_path': f'materials/generated/{s}-{k}.{ext}', 'file_type': ext,
+             'file_size': rng.randrange(50_000, 5_000_000), 'download_count': rng.randrange(200)}
+            for s in range(1, self.subjects + 1)
+            for k, ext in enumerate(rng.sample(FILE_TYPES, MATERIALS_PER_SUBJECT), 1)
+        ))
+        self._insert(Evaluation, self._evaluations())
+
+    def _users(self, password_hash):
+        yield {'id': 1, 'username': 'admin', 'email': 'admin@ums.edu.vn', 'role': 'admin',
+               'password_hash': hash_password(ADMIN_PASSWORD)}
+        for i in range(1, self.lecturers + 1):
+            yield {'id': self.lecturer_user_id(i), 'username': f'gv{i:05d}', 'email': f'gv{i:05d}@ums.edu.vn',
+                   'role': 'lecturer', 'password_hash': password_hash}
+        for i in range(1, self.students + 1):
+            yield {'id': self.student_user_id(i), 'username': f'sv{i:06d}', 'email': f'sv{i:06d}@ums.edu.vn',
+                   'role': 'student', 'password_hash': password_hash}
+
+    def _schedules(self):
+        for c in range(1, self.classrooms + 1):
+            for index, semester in enumerate(self.semesters):
+                for slot in range(SUBJECTS_PER_SEMESTER):
+                    subject = self.subject_for(c, index, slot)
+                    start, end = SLOTS[slot % len(SLOTS)]
+                    yield {'subject_id': subject, 'lecturer_id': self.lecturer_for(subject, c), 'class_id': c,
+                           'room_name': f'{"ABCDE"[c % 5]}{100 + c % 400}', 'day_of_week': slot % 6,
+                           'start_time': start, 'end_time': end, 'semester': semester}
+
+    def _grades(self):
+        rng = self.rng
+        for student in range(1, self.students + 1):
+            c = self.class_of_student(student)
+            ability = rng.gauss(6.5, 1.2)
+            for index, semester in enumerate(self.semesters):
+                for slot in range(SUBJECTS_PER_SEMESTER):
+                    attendance = _score(rng, 9, 1)
+                    midterm = _score(rng, ability, 1.5)
+                    final = _score(rng, ability, 2)
+                    yield {'student_id': student, 'subject_id': self.subject_for(c, index, slot),
+                           'semester': semester, 'score_attendance': attendance, 'score_midterm': midterm,
+                           'score_final': final, 'score_total': Grade.compute_total(attendance, midterm, final)}
+
+    def _evaluations(self):
+        rng = self.rng
+        index = len(self.semesters) - 1
+        for student in range(1, self.students + 1):
+            if rng.random() >= EVALUATION_RATE:
+                continue
+            c = self.class_of_student(student)
+            subject = self.subject_for(c, index, rng.randrange(SUBJECTS_PER_SEMESTER))
+            yield {'student_id': student, 'lecturer_id': self.lecturer_for(subject, c), 'subject_id': subject,
+                   'rating': rng.choices([1, 2, 3, 4, 5], [1, 2, 5, 10, 8])[0],
+                   'comment': 'Giảng dạy nhiệt tình' if rng.random() < 0.5 else None,
+                   'semester': self.semesters[index]}
+
+
+def generate(scale, seed=42, echo=print):
+    """Tạo dữ liệu vào database rỗng của app hiện tại - trả về {bảng: số dòng}
+
+    Sau khi ghi: dựng lại bảng tổng hợp GPA, chỉ mục tìm kiếm, phiên bản danh mục và lịch học kỳ,
+    vì các lệnh INSERT hàng loạt không đi qua sự kiện ORM.
+    """
+    db.create_all()
+    if db.session.query(User.id).first() is not None:
+        raise RuntimeError('Database đã có dữ liệu - cần database rỗng')
+
+    builder = DatasetBuilder(scale, seed, echo)
+    echo(f'Sinh dữ liệu quy mô {scale}: {builder.students} sinh viên, {builder.classrooms} lớp, '
+         f'{builder.lecturers} giảng viên, {len(builder.semesters)} học kỳ')
+    start = time.perf_counter()
+    builder.build()
+    db.session.commit()
+
+    rebuild_summaries()
+    if db.engine.dialect.name == 'sqlite':
+        rebuild_search_index()
+    bump_versions(db.session.connection(), *REFERENCE_TABLES,
+                  *(version_key(semester) for semester in builder.semesters))
+    db.session.commit()
+    echo(f'Hoàn tất sau {time.perf_counter() - start:.1f} s')
+    return builder.counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', choices=list(SCALES), default='1k')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    # Không xóa database có sẵn: generate() từ chối database đã có dữ liệu
+    app = create_app('testing')
+    with app.app_context():
+        generate(args.scale, args.seed)
+        print(f'Database: {db.engine.url}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Thời gian chiếm worker khi nhiều người cùng tải một file tài liệu lớn
+Chạy: python -m benchmarks.delivery [--clients 100] [--size-mb 20] [--rate-mbps 40]
+
+Mỗi client (một luồng) tải trọn file với băng thông giới hạn --rate-mbps, mô phỏng mạng của
+sinh viên. Một WSGI middleware đo thời gian từ lúc worker nhận request tới lúc response được
+đóng - đó là khoảng worker bị giữ trong máy chủ đồng bộ (gunicorn sync, mod_wsgi...). Chạy lần
+lượt từng chế độ MATERIAL_DELIVERY; ở chế độ x-sendfile / x-accel phần gửi file do proxy đảm
+nhận nên benchmark chỉ đo phần việc của worker.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+from werkzeug.wsgi import ClosingIterator
+from benchmarks.common import BENCH_DIR, create_bench_app, login, percentile, print_table, db
+from benchmarks.dataset import PASSWORD, generate
+from app.counters import flush_counters
+from app.delivery import DELIVERY_MODES
+from app.models import Material, Schedule, Student
+
+
+class OccupancyMeter:
+    """WSGI middleware: thời gian giữ worker của từng request và số worker bận cùng lúc"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.busy = 0
+        self.peak = 0
+        self.timings = []
+
+    def _enter(self):
+        with self.lock:
+            self.busy += 1
+            self.peak = max(self.peak, self.busy)
+        return time.perf_counter()
+
+    def _exit(self, start):
+        elapsed = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.busy -= 1
+            self.timings.append(elapsed)
+
+    def __call__(self, environ, start_response):
+        start = self._enter()
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self._exit(start)
+            raise
+        return ClosingIterator(body, lambda: self._exit(start))
+
+
+def download(client, url, rate, results):
+    """Tải trọn url, đọc theo khối và ngủ để giữ băng thông rate (byte/s)"""
+    start = time.perf_counter()
+    response = client.get(url, buffered=False)
+    received = 0
+    try:
+        for chunk in response.response:
+            received += len(chunk)
+            # Tốc độ mạng của client: khối tiếp theo đến sau len/rate giây
+            delay = start + received / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    finally:
+        response.close()
+    results.append((response.status_code, received, (time.perf_counter() - start) * 1000))
+
+
+def prepare(app, size_mb):
+    """Tạo file lớn cho một tài liệu mà sinh viên 1 thấy - trả về id tài liệu"""
+    with app.app_context():
+        class_id = db.session.get(Student, 1).class_id
+        subject_ids = db.select(Schedule.subject_id).where(Schedule.class_id == class_id)
+        material = Material.query.filter(Material.subject_id.in_(subject_ids)).order_by(Material.id).first()
+        path = os.path.join(app.config['UPLOAD_FOLDER'], material.file_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        block = os.urandom(1024 * 1024)
+        with open(path, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(block)
+        return material.id
+
+
+def run_mode(app, meter, mode, clients, url, rate):
+    app.config['MATERIAL_DELIVERY'] = mode
+    meter.reset()
+    results = []
+    threads = [threading.Thread(target=download, args=(client, url, rate, results)) for client in clients]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    timings = meter.timings
+    return {
+        'mode': mode, 'ok': sum(1 for status, _, _ in results if status == 200),
+        'wall_s': round(wall, 1),
+        'worker_s': round(sum(timings) / 1000, 1),
+        'busy_p50_ms': round(percentile(timings, 50), 1),
+        'busy_max_ms': round(max(timings), 1),
+        'peak_busy': meter.peak,
+        'body_mb': round(sum(received for _, received, _ in results) / 1024 / 1024, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--size-mb', type=int, default=20)
+    parser.add_argument('--rate-mbps', type=float, default=40, help='Băng thông mỗi client (Mbit/s)')
+    parser.add_argument('--modes', nargs='+', choices=DELIVERY_MODES, default=list(DELIVERY_MODES))
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    app.config['UPLOAD_FOLDER'] = os.path.join(BENCH_DIR, 'uploads')
+    with app.app_context():
+        generate('tiny', echo=lambda message: print(message, file=sys.stderr))
+    material_id = prepare(app, args.size_mb)
+    url = f'/student/materials/download/{material_id}'
+
+    meter = OccupancyMeter(app.wsgi_app)
+    app.wsgi_app = meter
+    clients = []
+    for _ in range(args.clients):
+        client = app.test_client()
+        login(client, 'sv000001', PASSWORD)
+        clients.append(client)
+    # Tính sẵn hash cho ETag, không tính vào lần đo đầu tiên
+    clients[0].head(url)
+
+    rate = args.rate_mbps * 1000 * 1000 / 8
+    with app.app_context():
+        before = db.session.get(Material, material_id).download_count
+    results = []
+    for mode in args.modes:
+        print(f'{mode}: {args.clients} lượt tải...', file=sys.stderr)
+        results.append(run_mode(app, meter, mode, clients, url, rate))
+    with app.app_context():
+        flush_counters()
+        counted = db.session.get(Material, material_id).download_count - before
+
+    print(f'\n{args.clients} client tải đồng thời file {args.size_mb} MB, {args.rate_mbps:g} Mbit/s mỗi client '
+          f'({counted} lượt tải được tính)')
+    print_table(['mode', 'ok', 'wall_s', 'worker_s', 'busy_p50_ms', 'busy_max_ms', 'peak_busy', 'body_mb'],
+                [tuple(r.values()) for r in results])
+
+
+if __name__ == '__main__':
+    main()
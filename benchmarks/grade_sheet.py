@@ -0,0 +1,83 @@
+"""
+Kiểm tra số truy vấn của màn hình nhập điểm lecturer.grade_class
+Chạy: python -m benchmarks.grade_sheet [--sizes 10 100 300 1000]
+
+Số câu SQL mỗi request phải không đổi theo sĩ số lớp; script kết thúc với mã lỗi
+nếu số truy vấn thay đổi giữa các kích thước lớp.
+"""
+
+import argparse
+import sys
+
+from benchmarks.common import create_bench_app, create_user, login, measure, count_queries, print_table, db
+from app.models import Classroom, Subject, Student, Grade, User, Lecturer
+
+
+def build_class(size, index):
+    """Tạo một lớp có size sinh viên, một nửa đã có điểm môn 1"""
+    classroom = Classroom(name=f'Lop-{index}')
+    db.session.add(classroom)
+    db.session.flush()
+    users = [{'username': f'c{index}-sv{i}', 'email': f'c{index}-sv{i}@bench.local',
+              'password_hash': '-', 'role': 'student'} for i in range(size)]
+    db.session.execute(db.insert(User), users)
+    user_ids = db.session.execute(
+        db.select(User.id).where(User.username.like(f'c{index}-sv%')).order_by(User.id)
+    ).scalars().all()
+    db.session.execute(db.insert(Student), [
+        {'user_id': uid, 'student_code': f'C{index}-{i:05d}', 'full_name': f'Sinh viên {i}',
+         'class_id': classroom.id} for i, uid in enumerate(user_ids)
+    ])
+    student_ids = db.session.execute(
+        db.select(Student.id).where(Student.class_id == classroom.id)
+    ).scalars().all()
+    db.session.execute(db.insert(Grade), [
+        {'student_id': sid, 'subject_id': 1, 'semester': 'HK1', 'score_attendance': 8,
+         'score_midterm': 7, 'score_final': 6, 'score_total': Grade.compute_total(8, 7, 6)}
+        for sid in student_ids[::2]
+    ])
+    db.session.commit()
+    return classroom.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 300, 1000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    app = create_bench_app()
+    client = app.test_client()
+    with app.app_context():
+        db.session.add(Subject(code='S1', name='Môn 1', credits=3))
+        user = create_user('bench_lecturer', 'bench123', role='lecturer')
+        db.session.add(Lecturer(user_id=user.id, lecturer_code='GV-BENCH', full_name='Giảng viên'))
+        db.session.commit()
+        class_ids = [build_class(size, i) for i, size in enumerate(args.sizes)]
+        engine = db.engine
+    login(client, 'bench_lecturer', 'bench123')
+    
+    results = []
+    query_counts = set()
+    for size, class_id in zip(args.sizes, class_ids):
+        url = f'/lecturer/grades/{class_id}/1?semester=HK1'
+        
+        def request_sheet():
+            response = client.get(url)
+            assert response.status_code == 200
+        
+        # Đếm sau khi đo: request đầu tiên sau đăng nhập còn nạp danh tính người dùng vào bộ đệm
+        latency, peak = measure(request_sheet, args.repeat)
+        with count_queries(engine) as counter:
+            request_sheet()
+        query_counts.add(counter[0])
+        results.append((size, counter[0], f'{latency:.1f}', f'{peak:.0f}'))
+    
+    print_table(['students', 'queries', 'latency_ms', 'peak_kb'], results)
+    if len(query_counts) > 1:
+        print('LỖI: số truy vấn thay đổi theo sĩ số lớp (N+1)')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
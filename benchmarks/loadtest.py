@@ -0,0 +1,386 @@
+"""
+Kiểm thử tải đồng thời theo kịch bản lưu lượng của từng vai trò
+Chạy: python -m benchmarks.loadtest grade-publication [--scale 1k] [--workers 4]
+                                    [--duration 30] [--users student=500 lecturer=20]
+                                    [--scenarios benchmarks/scenarios.json] [--output load.json]
+
+Mặc định script sinh database bằng benchmarks.dataset rồi khởi động --workers tiến trình
+máy chủ (mỗi tiến trình một cổng, cấu hình production, CSRF bật); người dùng ảo được chia
+xoay vòng giữa các tiến trình như sau một bộ cân bằng tải. Với --url, tải được bắn vào máy
+chủ có sẵn (gunicorn...), khi đó TEST_DATABASE_URL phải trỏ tới cùng database đã sinh.
+
+Mỗi người dùng ảo đăng nhập bằng tài khoản sinh sẵn, chọn hành động theo trọng số của
+kịch bản và nghỉ think_time giây giữa hai hành động. Báo cáo: thông lượng, p50/p95/p99
+theo endpoint, tỷ lệ lỗi và số lỗi SQLite "database is locked".
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, quote
+from urllib.request import build_opener, HTTPCookieProcessor, HTTPRedirectHandler
+
+from benchmarks.common import BENCH_DIR, create_bench_app, percentile, print_table, db
+from benchmarks.dataset import PASSWORD, ADMIN_PASSWORD, LAST_NAMES, FIRST_NAMES, generate
+from app.models import Student, Schedule
+from app.search import fold
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCENARIOS = os.path.join(ROOT, 'benchmarks', 'scenarios.json')
+LOCKED_HEADER = 'X-Database-Locked'
+CSRF_PATTERN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+# ==================== MÁY CHỦ ====================
+def create_server_app():
+    """App cho tiến trình worker: cấu hình production, lỗi khóa database trả về 503 có đánh dấu"""
+    from sqlalchemy.exc import OperationalError
+    from app import create_app
+
+    app = create_app('production')
+
+    @app.errorhandler(OperationalError)
+    def database_error(error):
+        db.session.rollback()
+        if 'database is locked' in str(error):
+            return 'database is locked', 503, {LOCKED_HEADER: '1'}
+        return 'database error', 500
+
+    return app
+
+
+def serve(port):
+    """Chạy một worker (gọi bởi tiến trình cha qua --serve)"""
+    from werkzeug.serving import run_simple
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    run_simple('127.0.0.1', port, create_server_app(), threaded=True)
+
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Worker cổng {port} không khởi động được')
+
+
+@contextmanager
+def start_servers(workers, base_port, database_url):
+    """Khởi động workers tiến trình máy chủ - trả về danh sách URL"""
+    env = dict(os.environ, DATABASE_URL=database_url, SECRET_KEY=secrets.token_hex(16))
+    log_path = os.path.join(BENCH_DIR, 'loadtest-server.log')
+    log = open(log_path, 'w')
+    ports = [base_port + i for i in range(workers)]
+    processes = [
+        subprocess.Popen([sys.executable, '-m', 'benchmarks.loadtest', '--serve', str(port)],
+                         cwd=ROOT, env=env, stdout=log, stderr=log)
+        for port in ports
+    ]
+    try:
+        for port in ports:
+            _wait_for_port(port)
+        yield [f'http://127.0.0.1:{port}' for port in ports]
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        log.close()
+        print(f'Log máy chủ: {log_path}', file=sys.stderr)
+
+
+# ==================== SỐ LIỆU ====================
+class LoadStats:
+    """Gom số liệu từ mọi người dùng ảo (an toàn luồng)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.locked = defaultdict(int)
+        self.started = self.finished = None
+
+    def record(self, name, elapsed_ms, ok, locked=False):
+        with self.lock:
+            self.latencies[name].append(elapsed_ms)
+            if not ok:
+                self.errors[name] += 1
+            if locked:
+                self.locked[name] += 1
+
+    def report(self):
+        """Danh sách dict theo endpoint + dòng tổng"""
+        elapsed = max(self.finished - self.started, 1e-9)
+        rows = []
+        for name in sorted(self.latencies):
+            values = self.latencies[name]
+            rows.append({
+                'endpoint': name, 'requests': len(values), 'rps': round(len(values) / elapsed, 2),
+                'p50_ms': round(percentile(values, 50), 1), 'p95_ms': round(percentile(values, 95), 1),
+                'p99_ms': round(percentile(values, 99), 1), 'errors': self.errors[name],
+                'error_rate': round(self.errors[name] / len(values), 4), 'locked': self.locked[name]
+            })
+        every = [v for values in self.latencies.values() for v in values]
+        if every:
+            errors = sum(self.errors.values())
+            rows.append({
+                'endpoint': 'TOTAL', 'requests': len(every), 'rps': round(len(every) / elapsed, 2),
+                'p50_ms': round(percentile(every, 50), 1), 'p95_ms': round(percentile(every, 95), 1),
+                'p99_ms': round(percentile(every, 99), 1), 'errors': errors,
+                'error_rate': round(errors / len(every), 4), 'locked': sum(self.locked.values())
+            })
+        return rows
+
+
+# ==================== NGƯỜI DÙNG ẢO ====================
+class _NoRedirect(HTTPRedirectHandler):
+    """Không tự đi theo redirect: mỗi phép đo là đúng một request"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class VirtualUser:
+    """Một phiên trình duyệt: cookie riêng, gắn với một worker"""
+
+    def __init__(self, role, username, password, base_url, context, stats, rng):
+        self.role = role
+        self.username = username
+        self.password = password
+        self.base_url = base_url
+        self.context = context
+        self.stats = stats
+        self.rng = rng
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), _NoRedirect)
+
+    def request(self, name, path, data=None):
+        """Gửi request, ghi số liệu - trả về (status, body)"""
+        body = urlencode(data).encode() if data is not None else None
+        start = time.perf_counter()
+        locked = False
+        try:
+            with self.opener.open(self.base_url + path, body, timeout=60) as response:
+                status, text = response.status, response.read().decode('utf-8', 'replace')
+        except HTTPError as error:
+            status, text = error.code, error.read().decode('utf-8', 'replace')
+            locked = error.headers.get(LOCKED_HEADER) == '1'
+        except (URLError, OSError):
+            status, text = 0, ''
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats.record(name, elapsed_ms, 0 < status < 400, locked)
+        return status, text
+
+    def login(self):
+        status, body = self.request('auth.login', '/login')
+        token = _csrf(body)
+        status, _ = self.request('auth.login[POST]', '/login', {
+            'csrf_token': token, 'username': self.username, 'password': self.password
+        })
+        return status == 302
+
+
+def _csrf(body):
+    match = CSRF_PATTERN.search(body)
+    return match.group(1) if match else ''
+
+
+# ==================== HÀNH ĐỘNG ====================
+def action_get(user, step):
+    user.request(step['name'], step['path'])
+
+
+def action_search_students(user, step):
+    term = fold(user.rng.choice(LAST_NAMES + FIRST_NAMES))
+    user.request('admin.students?search', f'/admin/students?search={quote(term)}')
+
+
+def action_save_grades(user, step):
+    """Mở bảng điểm một lớp rồi lưu điểm cho cả lớp"""
+    if not user.context.get('teaching'):
+        return
+    class_id, subject_id, semester = user.rng.choice(user.context['teaching'])
+    path = f'/lecturer/grades/{class_id}/{subject_id}?semester={quote(semester)}'
+    status, body = user.request('lecturer.grade_class', path)
+    if status != 200:
+        return
+    data = {'csrf_token': _csrf(body), 'class_id': class_id, 'subject_id': subject_id, 'semester': semester}
+    for student_id in re.findall(r'name="attendance_(\d+)"', body):
+        data[f'attendance_{student_id}'] = user.rng.randint(5, 10)
+        data[f'midterm_{student_id}'] = round(user.rng.uniform(3, 10), 1)
+        data[f'final_{student_id}'] = round(user.rng.uniform(2, 10), 1)
+    user.request('lecturer.save_grades', '/lecturer/grades/save', data)
+
+
+def action_submit_evaluation(user, step):
+    """Mở form đánh giá một giảng viên của lớp và gửi (bỏ qua nếu đã đánh giá)"""
+    if not user.context.get('courses'):
+        return
+    lecturer_id, subject_id = user.rng.choice(user.context['courses'])
+    path = f'/student/evaluations/add/{lecturer_id}/{subject_id}'
+    status, body = user.request('student.add_evaluation', path)
+    if status != 200:
+        return
+    user.request('student.add_evaluation[POST]', path, {
+        'csrf_token': _csrf(body), 'lecturer_id': lecturer_id, 'subject_id': subject_id,
+        'rating': user.rng.choice('12345'), 'comment': 'Kiểm thử tải'
+    })
+
+
+ACTIONS = {
+    'get': action_get,
+    'search_students': action_search_students,
+    'save_grades': action_save_grades,
+    'submit_evaluation': action_submit_evaluation
+}
+
+
+def run_user(user, mix, think_time, deadline, start_at):
+    time.sleep(max(0, start_at - time.monotonic()))
+    if not user.login():
+        return
+    weights = [step.get('weight', 1) for step in mix]
+    while time.monotonic() < deadline:
+        step = user.rng.choices(mix, weights)[0]
+        ACTIONS[step['action']](user, step)
+        time.sleep(user.rng.uniform(*think_time))
+
+
+# ==================== KỊCH BẢN ====================
+def load_scenario(path, name):
+    with open(path, encoding='utf-8') as f:
+        scenarios = json.load(f)
+    if name not in scenarios:
+        raise SystemExit(f'Kịch bản không tồn tại: {name} (có: {", ".join(scenarios)})')
+    scenario = scenarios[name]
+    for role, mix in scenario['mix'].items():
+        for step in mix:
+            if step['action'] not in ACTIONS:
+                raise SystemExit(f'Hành động không hợp lệ trong {name}.{role}: {step["action"]}')
+    return scenario
+
+
+def user_contexts(role, count):
+    """Tài khoản và dữ liệu riêng của count người dùng đầu tiên của role"""
+    if role == 'admin':
+        return [('admin', ADMIN_PASSWORD, {})] * count
+    if role == 'lecturer':
+        teaching = defaultdict(set)
+        for schedule in Schedule.query.filter(Schedule.lecturer_id <= count):
+            teaching[schedule.lecturer_id].add((schedule.class_id, schedule.subject_id, schedule.semester))
+        return [(f'gv{i:05d}', PASSWORD, {'teaching': sorted(teaching[i])}) for i in range(1, count + 1)
+                if i in teaching]
+    last_semester = db.session.execute(db.select(db.func.max(Schedule.semester))).scalar()
+    courses = defaultdict(set)
+    for schedule in Schedule.query.filter_by(semester=last_semester):
+        courses[schedule.class_id].add((schedule.lecturer_id, schedule.subject_id))
+    students = db.session.execute(
+        db.select(Student.id, Student.class_id).order_by(Student.id).limit(count)
+    ).all()
+    return [(f'sv{sid:06d}', PASSWORD, {'courses': sorted(courses[class_id])}) for sid, class_id in students]
+
+
+def run_scenario(scenario, base_urls, contexts, seed=42):
+    """Chạy kịch bản tới khi hết duration - trả về LoadStats"""
+    stats = LoadStats()
+    users = []
+    rng = random.Random(seed)
+    for role, accounts in contexts.items():
+        for username, password, context in accounts:
+            base_url = base_urls[len(users) % len(base_urls)]
+            users.append(VirtualUser(role, username, password, base_url, context, stats,
+                                     random.Random(rng.random())))
+    rng.shuffle(users)
+
+    threading.stack_size(512 * 1024)
+    stats.started = time.monotonic()
+    deadline = stats.started + scenario['duration']
+    ramp_up = scenario.get('ramp_up', 0)
+    threads = []
+    for index, user in enumerate(users):
+        start_at = stats.started + ramp_up * index / max(len(users), 1)
+        thread = threading.Thread(target=run_user, daemon=True, args=(
+            user, scenario['mix'][user.role], scenario.get('think_time', [1, 3]), deadline, start_at
+        ))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    stats.finished = time.monotonic()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('scenario', nargs='?')
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS)
+    parser.add_argument('--scale', default='1k')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--url', help='Máy chủ có sẵn; mặc định tự khởi động --workers tiến trình')
+    parser.add_argument('--duration', type=int, help='Ghi đè thời lượng của kịch bản (giây)')
+    parser.add_argument('--users', nargs='+', metavar='ROLE=N', help='Ghi đè số người dùng theo vai trò')
+    parser.add_argument('--output', help='Ghi kết quả ra file JSON')
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+    if not args.scenario:
+        parser.error('cần tên kịch bản')
+
+    scenario = load_scenario(args.scenarios, args.scenario)
+    if args.duration:
+        scenario['duration'] = args.duration
+    for override in args.users or []:
+        role, _, count = override.partition('=')
+        scenario['users'][role] = int(count)
+
+    if args.url:
+        from app import create_app
+        app = create_app('testing')
+    else:
+        app = create_bench_app()
+        with app.app_context():
+            generate(args.scale, echo=lambda message: print(message, file=sys.stderr))
+    with app.app_context():
+        contexts = {role: user_contexts(role, count) for role, count in scenario['users'].items()
+                    if role in scenario['mix']}
+        database_url = db.engine.url.render_as_string(hide_password=False)
+
+    print(f'Kịch bản {args.scenario}: {scenario.get("description", "")}', file=sys.stderr)
+    print('Người dùng: ' + ', '.join(f'{role}={len(c)}' for role, c in contexts.items()), file=sys.stderr)
+    if args.url:
+        stats = run_scenario(scenario, [args.url.rstrip('/')], contexts)
+    else:
+        with start_servers(args.workers, args.port, database_url) as urls:
+            stats = run_scenario(scenario, urls, contexts)
+
+    rows = stats.report()
+    print_table(['endpoint', 'requests', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'errors', 'error_rate', 'locked'],
+                [tuple(row.values()) for row in rows])
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'scenario': args.scenario, 'config': scenario, 'workers': args.workers,
+                       'results': rows}, f, ensure_ascii=False, indent=2)
+        print(f'Đã ghi {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark phân trang danh sách sinh viên: keyset so với OFFSET
+Chạy: python -m benchmarks.pagination [--students 100000] [--pages 1 100 1000 5000]
+
+Với keyset, trang thứ 1000 phải tốn thời gian như trang đầu tiên.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+
+from benchmarks.common import create_bench_app, create_user, login, measure, print_table, db
+from app.models import Student, User
+from app.pagination import encode_cursor, keyset_paginate
+
+PER_PAGE = 10
+
+
+def build_students(count):
+    """Tạo count sinh viên với created_at tăng dần (có trùng lặp để kiểm tra khóa phụ id)"""
+    base = datetime(2020, 1, 1)
+    batch = 20000
+    for start in range(0, count, batch):
+        size = min(batch, count - start)
+        db.session.execute(db.insert(User), [
+            {'username': f'sv{i}', 'email': f'sv{i}@student.edu.vn', 'password_hash': '-', 'role': 'student'}
+            for i in range(start, start + size)
+        ])
+        first_user_id = db.session.execute(db.select(User.id).where(User.username == f'sv{start}')).scalar()
+        db.session.execute(db.insert(Student), [
+            {'user_id': first_user_id + j, 'student_code': f'SV{start + j:06d}', 'full_name': f'Sinh viên {start + j}',
+             'created_at': base + timedelta(seconds=(start + j) // 2)}
+            for j in range(size)
+        ])
+    db.session.commit()
+
+
+def cursor_for_page(page):
+    """Con trỏ 'next' trỏ tới đầu trang page (tính sẵn để không phải duyệt từng trang)"""
+    if page == 1:
+        return None
+    row = db.session.execute(
+        db.select(Student.created_at, Student.id)
+        .order_by(Student.created_at.desc(), Student.id.desc())
+        .offset((page - 1) * PER_PAGE - 1).limit(1)
+    ).one()
+    return encode_cursor('next', list(row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 100, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    app = create_bench_app()
+    client = app.test_client()
+    with app.app_context():
+        build_students(args.students)
+        create_user('bench_admin', 'bench123')
+    login(client, 'bench_admin', 'bench123')
+    
+    results = []
+    for page in args.pages:
+        with app.test_request_context():
+            cursor = cursor_for_page(page)
+        
+        def keyset_request():
+            response = client.get('/admin/students', query_string={'cursor': cursor} if cursor else {})
+            assert response.status_code == 200
+        
+        def keyset_query():
+            with app.test_request_context():
+                keyset_paginate(Student.query, [Student.created_at, Student.id], cursor=cursor, per_page=PER_PAGE)
+        
+        def offset_query():
+            with app.app_context():
+                Student.query.order_by(Student.created_at.desc()).paginate(page=page, per_page=PER_PAGE, count=False)
+        
+        route_ms, _ = measure(keyset_request, args.repeat)
+        keyset_ms, _ = measure(keyset_query, args.repeat)
+        offset_ms, _ = measure(offset_query, args.repeat)
+        results.append((page, f'{keyset_ms:.2f}', f'{offset_ms:.2f}', f'{route_ms:.1f}'))
+    
+    print_table(['page', 'keyset_query_ms', 'offset_query_ms', 'keyset_route_ms'], results)
+
+
+if __name__ == '__main__':
+    main()
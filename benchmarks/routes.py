@@ -0,0 +1,312 @@
+"""
+Benchmark mọi route của các blueprint auth / admin / lecturer / student theo quy mô dữ liệu
+Chạy: python -m benchmarks.routes [--scales tiny 1k 50k] [--repeat 20]
+                                  [--output routes.json] [--compare baseline.json]
+
+Với mỗi quy mô, database được sinh bằng benchmarks.dataset (kèm một tài liệu có bản dẫn xuất,
+các tác vụ nền đã chạy xong và một phiên upload theo phần) rồi từng route được gọi qua test
+client bằng tài khoản phù hợp. Mọi endpoint của app phải có trường hợp đo hoặc nằm trong
+SKIPPED kèm lý do - thiếu thì script dừng, để route mới không bị bỏ sót. Kết quả: độ trễ
+p50/p90/p99, số câu SQL và bộ nhớ đỉnh của một request. File JSON đầu ra chứa commit hiện tại để so sánh giữa các commit
+(--compare in chênh lệch so với một file kết quả cũ).
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime
+
+from benchmarks.common import BENCH_DIR, create_bench_app, login, count_queries, percentile, print_table, db
+from benchmarks.dataset import SCALES, PASSWORD, ADMIN_PASSWORD, generate
+from app.jobs import Worker, enqueue
+from app.models import Student, Lecturer, Schedule, Evaluation, Material
+from app.storage import parse_reference, store_upload
+from app.uploads import create_session
+
+ACCOUNTS = {
+    'admin': ('admin', ADMIN_PASSWORD),
+    'lecturer': ('gv00001', PASSWORD),
+    'student': ('sv000001', PASSWORD)
+}
+
+# Endpoint không đo: tên -> lý do
+SKIPPED = {
+    'static': 'file tĩnh, máy chủ web phục vụ',
+    'auth.logout': 'đăng xuất client dùng chung',
+    'admin.delete_student': 'xóa dữ liệu mẫu',
+    'admin.delete_lecturer': 'xóa dữ liệu mẫu',
+    'admin.delete_major': 'xóa dữ liệu mẫu',
+    'admin.delete_classroom': 'xóa dữ liệu mẫu',
+    'admin.delete_subject': 'xóa dữ liệu mẫu',
+    'admin.delete_schedule': 'xóa dữ liệu mẫu',
+    'lecturer.delete_material': 'xóa dữ liệu mẫu',
+    'admin.cancel_job': 'chuyển trạng thái một lần',
+    'admin.retry_job': 'chuyển trạng thái một lần',
+    'lecturer.finalize_upload': 'dùng hết phiên upload',
+    'lecturer.abort_upload': 'dùng hết phiên upload',
+    'admin.profiler_stop': 'đổi trạng thái profiler',
+    'admin.profiler_clear': 'đổi trạng thái profiler',
+    'admin.profiler_download': 'cần một lần profile đã ghi'
+}
+
+# Tài liệu mẫu: docx có ảnh thu nhỏ để route xem trước có bản dẫn xuất
+SAMPLE_THUMBNAIL = b'\x89PNG\r\n\x1a\n' + b'bench' * 20
+SAMPLE_CHUNK = 256 * 1024
+
+
+def route_cases(ids):
+    """Danh sách (tên, vai trò, phương thức, url, dữ liệu form) - ids: các id mẫu trong dataset"""
+    grade_sheet = (f'/lecturer/grades/{ids["class_id"]}/{ids["subject_id"]}?semester={ids["semester"]}')
+    save_grades = {'class_id': ids['class_id'], 'subject_id': ids['subject_id'], 'semester': ids['semester'],
+                   f'attendance_{ids["student_id"]}': 9, f'midterm_{ids["student_id"]}': 7,
+                   f'final_{ids["student_id"]}': 8}
+    return [
+        ('main.index', None, 'GET', '/', None),
+        ('auth.login', None, 'GET', '/login', None),
+        ('auth.register', None, 'GET', '/register', None),
+        ('auth.profile', 'student', 'GET', '/profile', None),
+        ('auth.change_password', 'student', 'GET', '/change-password', None),
+
+        ('admin.dashboard', 'admin', 'GET', '/admin/dashboard', None),
+        ('admin.students', 'admin', 'GET', '/admin/students', None),
+        ('admin.students?search', 'admin', 'GET', '/admin/students?search=nguyen', None),
+        ('admin.add_student', 'admin', 'GET', '/admin/students/add', None),
+        ('admin.edit_student', 'admin', 'GET', '/admin/students/edit/1', None),
+        ('admin.lecturers', 'admin', 'GET', '/admin/lecturers', None),
+        ('admin.lecturers?search', 'admin', 'GET', '/admin/lecturers?search=tran', None),
+        ('admin.add_lecturer', 'admin', 'GET', '/admin/lecturers/add', None),
+        ('admin.edit_lecturer', 'admin', 'GET', '/admin/lecturers/edit/1', None),
+        ('admin.majors', 'admin', 'GET', '/admin/majors', None),
+        ('admin.add_major', 'admin', 'GET', '/admin/majors/add', None),
+        ('admin.edit_major', 'admin', 'GET', '/admin/majors/edit/1', None),
+        ('admin.classrooms', 'admin', 'GET', '/admin/classrooms', None),
+        ('admin.add_classroom', 'admin', 'GET', '/admin/classrooms/add', None),
+        ('admin.edit_classroom', 'admin', 'GET', '/admin/classrooms/edit/1', None),
+        ('admin.subjects', 'admin', 'GET', '/admin/subjects', None),
+        ('admin.add_subject', 'admin', 'GET', '/admin/subjects/add', None),
+        ('admin.edit_subject', 'admin', 'GET', '/admin/subjects/edit/1', None),
+        ('admin.schedules', 'admin', 'GET', '/admin/schedules', None),
+        ('admin.add_schedule', 'admin', 'GET', '/admin/schedules/add', None),
+        ('admin.edit_schedule', 'admin', 'GET', '/admin/schedules/edit/1', None),
+        ('admin.profiler', 'admin', 'GET', '/admin/_profile', None),
+        ('admin.import_accounts', 'admin', 'GET', '/admin/import/student', None),
+        ('admin.import_status', 'admin', 'GET', f'/admin/import/status/{ids["import_job_id"]}', None),
+        ('admin.jobs', 'admin', 'GET', '/admin/jobs', None),
+        ('admin.job_detail', 'admin', 'GET', f'/admin/jobs/{ids["export_job_id"]}', None),
+        ('admin.download_job_output', 'admin', 'GET', f'/admin/jobs/{ids["export_job_id"]}/download', None),
+        ('admin.enqueue_job', 'admin', 'POST', '/admin/jobs/enqueue', {'name': 'storage.gc'}),
+
+        ('lecturer.dashboard', 'lecturer', 'GET', '/lecturer/dashboard', None),
+        ('lecturer.schedule', 'lecturer', 'GET', '/lecturer/schedule', None),
+        ('lecturer.grades', 'lecturer', 'GET', '/lecturer/grades', None),
+        ('lecturer.grade_class', 'lecturer', 'GET', grade_sheet, None),
+        ('lecturer.save_grades', 'lecturer', 'POST', '/lecturer/grades/save', save_grades),
+        ('lecturer.materials', 'lecturer', 'GET', '/lecturer/materials', None),
+        ('lecturer.add_material', 'lecturer', 'GET', '/lecturer/materials/add', None),
+        ('lecturer.students', 'lecturer', 'GET', f'/lecturer/students?class_id={ids["class_id"]}', None),
+        ('lecturer.export_grades', 'lecturer', 'POST', '/lecturer/grades/export', {'semester': ids['semester']}),
+        ('lecturer.job_status', 'lecturer', 'GET', f'/lecturer/jobs/{ids["export_job_id"]}', None),
+        ('lecturer.download_job_output', 'lecturer', 'GET', f'/lecturer/jobs/{ids["export_job_id"]}/download',
+         None),
+        ('lecturer.create_upload', 'lecturer', 'POST', '/lecturer/uploads',
+         {'subject_id': ids['subject_id'], 'size': SAMPLE_CHUNK, 'filename': 'bench.zip', 'title': 'Bench'}),
+        ('lecturer.upload_status', 'lecturer', 'GET', f'/lecturer/uploads/{ids["upload_id"]}', None),
+        ('lecturer.upload_chunk', 'lecturer', 'PUT', f'/lecturer/uploads/{ids["upload_id"]}?offset=0',
+         bytes(SAMPLE_CHUNK)),
+
+        ('student.dashboard', 'student', 'GET', '/student/dashboard', None),
+        ('student.schedule', 'student', 'GET', '/student/schedule', None),
+        ('student.grades', 'student', 'GET', '/student/grades', None),
+        ('student.materials', 'student', 'GET', '/student/materials', None),
+        ('student.download_material', 'student', 'GET', f'/student/materials/download/{ids["material_id"]}', None),
+        ('main.material_thumbnail', 'student', 'GET',
+         f'/materials/{ids["material_id"]}/thumbnail?v={ids["material_sha256"]}', None),
+        ('main.material_text', 'student', 'GET', f'/materials/{ids["material_id"]}/text', None),
+        ('student.evaluations', 'student', 'GET', '/student/evaluations', None),
+        ('student.add_evaluation', 'student', 'GET',
+         f'/student/evaluations/add/{ids["eval_lecturer_id"]}/{ids["eval_subject_id"]}', None),
+    ]
+
+
+def sample_ids():
+    """Các id mẫu: lớp/môn/học kỳ giảng viên 1 dạy, môn sinh viên 1 chưa đánh giá"""
+    schedule = Schedule.query.filter_by(lecturer_id=1).order_by(Schedule.semester.desc(), Schedule.id).first()
+    evaluated = {(e.lecturer_id, e.subject_id) for e in Evaluation.query.filter_by(student_id=1)}
+    target = next(
+        (s for s in Schedule.query.filter_by(class_id=1).order_by(Schedule.id)
+         if (s.lecturer_id, s.subject_id) not in evaluated),
+        schedule
+    )
+    student_id = db.session.execute(
+        db.select(db.func.min(Student.id)).where(Student.class_id == schedule.class_id)
+    ).scalar()
+    return {
+        'class_id': schedule.class_id, 'subject_id': schedule.subject_id, 'semester': schedule.semester,
+        'student_id': student_id, 'eval_lecturer_id': target.lecturer_id, 'eval_subject_id': target.subject_id
+    }
+
+
+def sample_docx():
+    """Nội dung file docx nhỏ có văn bản và ảnh thu nhỏ"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('word/document.xml',
+                         '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                         '<w:body><w:p><w:r><w:t>Bài giảng mẫu</w:t></w:r></w:p></w:body></w:document>')
+        archive.writestr('docProps/thumbnail.png', SAMPLE_THUMBNAIL)
+    return buffer.getvalue()
+
+
+def prepare_samples(app, ids):
+    """Dữ liệu cho các route tài liệu / tác vụ nền / upload: thêm id vào ids
+
+    Tài liệu mẫu của giảng viên 1, bảng điểm xuất Excel và một lần nhập (chạy xong bằng worker
+    như trên máy chủ), một phiên upload theo phần còn mở.
+    """
+    lecturer_user_id = db.session.get(Lecturer, 1).user_id
+    file_path, file_size = store_upload(io.BytesIO(sample_docx()), 'bench.docx')
+    material = Material(subject_id=ids['subject_id'], uploaded_by=1, title='Bài giảng mẫu', file_path=file_path,
+                        file_type='docx', file_size=file_size)
+    db.session.add(material)
+    export = enqueue('reports.grade_export', created_by=lecturer_user_id, lecturer_id=1, semester=ids['semester'])
+    imported = enqueue('accounts.import', created_by=1, kind='student', filename='bench.csv', rows=[])
+    db.session.commit()
+    Worker(app, db.engine).run(until_idle=True)
+
+    upload = create_session(1, ids['subject_id'], 'Bench', None, 'bench.zip', SAMPLE_CHUNK)
+    ids.update(material_id=material.id, material_sha256=parse_reference(file_path)[0], export_job_id=export.id,
+               import_job_id=imported.id, upload_id=upload.id)
+
+
+def check_coverage(app, cases):
+    """Dừng nếu có endpoint không có trường hợp đo lẫn lý do bỏ qua (hoặc SKIPPED ghi endpoint không còn)"""
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules()}
+    measured = {name.split('?')[0] for name, *_ in cases}
+    missing = sorted(endpoints - measured - set(SKIPPED))
+    stale = sorted((measured | set(SKIPPED)) - endpoints)
+    if missing or stale:
+        sys.exit(f'Route chưa có trường hợp đo: {", ".join(missing) or "-"}; '
+                 f'không còn trong app: {", ".join(stale) or "-"}')
+
+
+def run_case(client, engine, method, url, data, repeat):
+    """Đo một route - trả về dict số liệu"""
+    def call():
+        return client.open(url, method=method, data=data)
+
+    status = call().status_code  # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    with count_queries(engine) as queries:
+        call()
+    tracemalloc.start()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'status': status,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p90_ms': round(percentile(timings, 90), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'queries': queries[0],
+        'peak_kb': round(peak / 1024, 1)
+    }
+
+
+def run_scale(scale, repeat):
+    """Sinh dữ liệu quy mô scale và đo mọi route"""
+    app = create_bench_app()
+    app.config.update(UPLOAD_FOLDER=os.path.join(BENCH_DIR, 'uploads'),
+                      JOB_OUTPUT_FOLDER=os.path.join(BENCH_DIR, 'job-output'))
+    with app.app_context():
+        generate(scale, echo=lambda message: print(message, file=sys.stderr))
+        ids = sample_ids()
+        prepare_samples(app, ids)
+        engine = db.engine
+    cases = route_cases(ids)
+    check_coverage(app, cases)
+
+    clients = {None: app.test_client()}
+    for role, (username, password) in ACCOUNTS.items():
+        clients[role] = app.test_client()
+        login(clients[role], username, password)
+
+    results = []
+    for name, role, method, url, data in cases:
+        metrics = run_case(clients[role], engine, method, url, data, repeat)
+        results.append(dict(scale=scale, route=name, method=method, url=url, **metrics))
+    return results
+
+
+def metadata(repeat):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'repeat': repeat
+    }
+
+
+def compare(results, baseline_path):
+    """In chênh lệch p50 và số truy vấn so với file kết quả cũ"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    old = {(r['scale'], r['route']): r for r in baseline['results']}
+    rows = []
+    for r in results:
+        before = old.get((r['scale'], r['route']))
+        if before is None:
+            continue
+        change = (r['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+        rows.append((r['scale'], r['route'], before['p50_ms'], r['p50_ms'], f'{change:+.0f}%',
+                     before['queries'], r['queries']))
+    print(f'\nSo với {baseline_path} (commit {(baseline["meta"].get("commit") or "?")[:10]}):')
+    print_table(['scale', 'route', 'p50_old', 'p50_new', 'change', 'sql_old', 'sql_new'], rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['tiny', '1k'])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', default='bench-routes.json')
+    parser.add_argument('--compare', help='File kết quả cũ để so sánh')
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        results.extend(run_scale(scale, args.repeat))
+
+    print_table(
+        ['scale', 'route', 'status', 'p50_ms', 'p90_ms', 'p99_ms', 'queries', 'peak_kb'],
+        [(r['scale'], r['route'], r['status'], r['p50_ms'], r['p90_ms'], r['p99_ms'], r['queries'], r['peak_kb'])
+         for r in results]
+    )
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'meta': metadata(args.repeat), 'results': results}, f, ensure_ascii=False, indent=2)
+    print(f'\nĐã ghi {args.output}')
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
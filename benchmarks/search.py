@@ -0,0 +1,74 @@
+"""
+Benchmark tìm kiếm sinh viên: FTS5 (bm25) so với ILIKE '%term%'
+Chạy: python -m benchmarks.search [--students 100000]
+"""
+
+import argparse
+import random
+
+from benchmarks.common import create_bench_app, measure, print_table, db
+from app.models import Student, User
+from app.search import search_query, rebuild_search_index
+
+FAMILY_NAMES = ['Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Huỳnh', 'Phan', 'Vũ', 'Võ', 'Đặng',
+                'Bùi', 'Đỗ', 'Hồ', 'Ngô', 'Dương', 'Lý']
+MIDDLE_NAMES = ['Văn', 'Thị', 'Hữu', 'Đức', 'Minh', 'Ngọc', 'Thanh', 'Quốc', 'Gia', 'Bảo']
+GIVEN_NAMES = ['Hương', 'Minh', 'Lan', 'Đức', 'Mai', 'Nam', 'Oanh', 'Phong', 'Quỳnh', 'Sơn',
+               'Anh', 'Bình', 'Cường', 'Dung', 'Em', 'Giang', 'Hà', 'Hải', 'Hằng', 'Hiếu',
+               'Hùng', 'Khánh', 'Linh', 'Long', 'Nga', 'Nhung', 'Phúc', 'Thảo', 'Trang', 'Tuấn']
+
+QUERIES = ['huong', 'Hương', 'nguyen thi huong', 'SV00123', 'duc', 'xyz']
+
+
+def build_students(count):
+    """Tạo count sinh viên với họ tên tiếng Việt ngẫu nhiên"""
+    rng = random.Random(42)
+    batch = 20000
+    for start in range(0, count, batch):
+        size = min(batch, count - start)
+        db.session.execute(db.insert(User), [
+            {'username': f'sv{i}', 'email': f'sv{i}@student.edu.vn', 'password_hash': '-', 'role': 'student'}
+            for i in range(start, start + size)
+        ])
+        first_user_id = db.session.execute(
+            db.select(User.id).where(User.username == f'sv{start}')
+        ).scalar()
+        db.session.execute(db.insert(Student), [
+            {'user_id': first_user_id + j, 'student_code': f'SV{start + j:06d}',
+             'full_name': f'{rng.choice(FAMILY_NAMES)} {rng.choice(MIDDLE_NAMES)} {rng.choice(GIVEN_NAMES)}'}
+            for j in range(size)
+        ])
+    db.session.commit()
+
+
+def legacy_search(term):
+    """Cách tìm kiếm cũ: ILIKE trên họ tên và mã sinh viên"""
+    return Student.query.filter(
+        (Student.full_name.ilike(f'%{term}%')) | (Student.student_code.ilike(f'%{term}%'))
+    ).order_by(Student.created_at.desc())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    app = create_bench_app()
+    with app.app_context():
+        build_students(args.students)
+        rebuild_search_index()
+        
+        results = []
+        for term in QUERIES:
+            legacy_ms, _ = measure(lambda: legacy_search(term).paginate(page=1, per_page=10), args.repeat)
+            fts_ms, _ = measure(lambda: search_query(Student, term).paginate(page=1, per_page=10), args.repeat)
+            legacy_hits = legacy_search(term).count()
+            fts_hits = search_query(Student, term).count()
+            results.append((term, legacy_hits, f'{legacy_ms:.1f}', fts_hits, f'{fts_ms:.1f}'))
+    
+    print_table(['query', 'ilike_hits', 'ilike_ms', 'fts_hits', 'fts_ms'], results)
+
+
+if __name__ == '__main__':
+    main()
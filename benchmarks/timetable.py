@@ -0,0 +1,139 @@
+"""
+Benchmark phát hiện trùng lịch: chỉ mục cây khoảng (app/timetable.py) so với truy vấn SQL trực tiếp
+Chạy: python -m benchmarks.timetable [--sessions 1000 10000 50000] [--checks 500]
+
+Mỗi kích thước sinh thời khóa biểu ngẫu nhiên của một học kỳ (có cả buổi trùng) rồi đo:
+- check: kiểm tra một buổi mới như khi lưu form (chỉ mục đã dựng / truy vấn chồng giờ)
+- scan: tìm mọi cặp trùng của cả học kỳ (dựng chỉ mục rồi quét / tự nối bảng trong SQL)
+Kết quả hai cách phải giống nhau; script kết thúc với mã lỗi nếu khác.
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import time as dtime
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import aliased
+from benchmarks.common import create_bench_app, print_table, db
+from app.models import User, Lecturer, Classroom, Subject, Schedule
+from app.timetable import check_semester, clear_cache, find_conflicts, get_index
+
+SEMESTER = 'HK1-2025'
+
+
+def random_slot(rng):
+    """(thứ, giờ bắt đầu, giờ kết thúc): bắt đầu 7:00-17:00 theo bước 15 phút, dài 1.5-3 giờ"""
+    start = 7 * 60 + rng.randrange(41) * 15
+    end = start + rng.choice([90, 120, 150, 180])
+    return rng.randrange(6), dtime(start // 60, start % 60), dtime(end // 60, end % 60)
+
+
+def build_timetable(sessions, rng):
+    """Tạo sessions buổi học ngẫu nhiên: ~25 buổi mỗi phòng, 10 mỗi giảng viên, 20 mỗi lớp"""
+    rooms = max(1, sessions // 25)
+    lecturers = max(1, sessions // 10)
+    classes = max(1, sessions // 20)
+    db.session.execute(db.insert(User), [
+        {'id': i, 'username': f'gv{i}', 'email': f'gv{i}@bench.local', 'password_hash': '-', 'role': 'lecturer'}
+        for i in range(1, lecturers + 1)
+    ])
+    db.session.execute(db.insert(Lecturer), [
+        {'id': i, 'user_id': i, 'lecturer_code': f'GV{i:05d}', 'full_name': f'Giảng viên {i}'}
+        for i in range(1, lecturers + 1)
+    ])
+    db.session.execute(db.insert(Classroom), [{'id': i, 'name': f'Lop-{i}'} for i in range(1, classes + 1)])
+    db.session.execute(db.insert(Subject), [{'id': 1, 'code': 'S1', 'name': 'Môn 1', 'credits': 3}])
+    rows = []
+    for _ in range(sessions):
+        day, start, end = random_slot(rng)
+        rows.append({'subject_id': 1, 'lecturer_id': rng.randint(1, lecturers), 'class_id': rng.randint(1, classes),
+                     'room_name': f'P{rng.randint(1, rooms)}', 'day_of_week': day, 'start_time': start,
+                     'end_time': end, 'semester': SEMESTER})
+    db.session.execute(db.insert(Schedule), rows)
+    db.session.commit()
+    return rooms, lecturers, classes
+
+
+def sql_conflicts(proposal):
+    """Truy vấn chồng giờ trực tiếp, kèm tên môn/lớp/giảng viên như find_conflicts"""
+    return set(db.session.execute(
+        select(Schedule.id, Subject.name, Classroom.name, Lecturer.full_name)
+        .outerjoin(Subject, Subject.id == Schedule.subject_id)
+        .outerjoin(Classroom, Classroom.id == Schedule.class_id)
+        .outerjoin(Lecturer, Lecturer.id == Schedule.lecturer_id)
+        .where(Schedule.semester == proposal.semester, Schedule.day_of_week == proposal.day_of_week,
+               Schedule.start_time < proposal.end_time, Schedule.end_time > proposal.start_time,
+               or_(Schedule.room_name == proposal.room_name, Schedule.lecturer_id == proposal.lecturer_id,
+                   Schedule.class_id == proposal.class_id))
+    ).scalars())
+
+
+def sql_clashes():
+    """Mọi cặp trùng bằng cách tự nối bảng lịch"""
+    a, b = aliased(Schedule), aliased(Schedule)
+    return set(tuple(row) for row in db.session.execute(
+        select(a.id, b.id).join(b, and_(
+            b.semester == a.semester, b.day_of_week == a.day_of_week, b.id > a.id,
+            b.start_time < a.end_time, a.start_time < b.end_time,
+            or_(b.room_name == a.room_name, b.lecturer_id == a.lecturer_id, b.class_id == a.class_id)
+        )).where(a.semester == SEMESTER)
+    ))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--checks', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    results = []
+    mismatches = 0
+    with app.app_context():
+        for sessions in args.sessions:
+            db.drop_all()
+            db.create_all()
+            clear_cache()
+            rng = random.Random(args.seed)
+            rooms, lecturers, classes = build_timetable(sessions, rng)
+
+            # Quét cả học kỳ (chỉ mục dựng từ đầu)
+            index_pairs, scan_index = timed(
+                lambda: {(c.first.id, c.second.id) for c in check_semester(SEMESTER)})
+            sql_pairs, scan_sql = timed(sql_clashes)
+            mismatches += index_pairs != sql_pairs
+
+            # Kiểm tra từng buổi mới với chỉ mục đã dựng
+            get_index(SEMESTER)
+            proposals = []
+            for _ in range(args.checks):
+                day, start, end = random_slot(rng)
+                proposals.append(Schedule(subject_id=1, lecturer_id=rng.randint(1, lecturers),
+                                          class_id=rng.randint(1, classes), room_name=f'P{rng.randint(1, rooms)}',
+                                          day_of_week=day, start_time=start, end_time=end, semester=SEMESTER))
+            index_hits, check_index = timed(
+                lambda: [{c.schedule_id for c in find_conflicts(p)} for p in proposals])
+            sql_hits, check_sql = timed(lambda: [sql_conflicts(p) for p in proposals])
+            mismatches += index_hits != sql_hits
+
+            results.append((sessions, len(sql_pairs), f'{check_index / args.checks:.2f}',
+                            f'{check_sql / args.checks:.2f}', f'{scan_index:.0f}', f'{scan_sql:.0f}'))
+
+    print_table(['sessions', 'clashes', 'check_index_ms', 'check_sql_ms', 'scan_index_ms', 'scan_sql_ms'],
+                results)
+    if mismatches:
+        print('LỖI: chỉ mục và truy vấn SQL cho kết quả khác nhau')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
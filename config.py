@@ -6,6 +6,14 @@ load_dotenv()
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
+def engine_options(uri, **pool):
+    """SQLALCHEMY_ENGINE_OPTIONS cho uri: tham số pool bị bỏ qua với SQLite trong bộ nhớ (StaticPool)"""
+    options = {'pool_pre_ping': True}
+    if uri not in ('sqlite://', 'sqlite:///:memory:'):
+        options.update(pool)
+    return options
+
+
 class Config:
     """Cấu hình chung cho ứng dụng"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-ums-2024'
@@ -16,21 +24,116 @@ class Config:
     # Upload config
     UPLOAD_FOLDER = os.path.join(basedir, 'app', 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    # Upload theo phần (app/uploads.py): mỗi request một phần UPLOAD_CHUNK_SIZE (< MAX_CONTENT_LENGTH),
+    # cả file tối đa MATERIAL_UPLOAD_MAX_SIZE; phiên không nhận thêm phần nào sau UPLOAD_SESSION_TTL giây thì hết hạn
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+    MATERIAL_UPLOAD_MAX_SIZE = int(os.environ.get('MATERIAL_UPLOAD_MAX_SIZE') or 2 * 1024 * 1024 * 1024)
+    UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL') or 24 * 3600)
     ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx', 'zip', 'rar'}
+    
+    # Cách gửi file tài liệu (app/delivery.py): 'python' (worker tự gửi), 'x-sendfile' (Apache/lighttpd)
+    # hoặc 'x-accel' (nginx: location internal MATERIAL_ACCEL_PREFIX trỏ vào UPLOAD_FOLDER)
+    MATERIAL_DELIVERY = os.environ.get('MATERIAL_DELIVERY') or 'python'
+    MATERIAL_ACCEL_PREFIX = os.environ.get('MATERIAL_ACCEL_PREFIX') or '/protected-uploads/'
+    
+    # Phân trang keyset: thời gian lưu đệm tổng số dòng (giây)
+    KEYSET_COUNT_TTL = 60
+    
+    # Báo lỗi khi request lazy load quan hệ chưa khai báo trong hồ sơ nạp (app/loading.py)
+    STRICT_LOADING = os.environ.get('STRICT_LOADING') == '1'
+    
+    # Đo đạc SQL theo request (app/instrumentation.py): header Server-Timing, log truy vấn chậm
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION') == '1'
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS') or 100)
+    SQL_TRACE_SLOWEST = 3
+    
+    # Chính sách băm mật khẩu (app/passwords.py): scrypt (độ khó = N, lũy thừa của 2) hoặc
+    # pbkdf2 (độ khó = số vòng lặp). Đo bằng: flask accounts hash-benchmark
+    PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM') or 'scrypt'
+    PASSWORD_HASH_COST = int(os.environ.get('PASSWORD_HASH_COST') or 0) or None  # None: mặc định của Werkzeug
+    
+    # Bộ đệm danh tính người đăng nhập (app/identity.py): thời gian sống trong mỗi tiến trình (giây), 0 = tắt
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL') or 60)
+    
+    # PRAGMA đặt cho mỗi kết nối SQLite mới (app/sqlite.py) - theo thứ tự khai báo;
+    # busy_timeout đứng đầu để lệnh đổi journal_mode cũng chờ khóa
+    SQLITE_PRAGMAS = {
+        'busy_timeout': 5000,          # ms chờ khóa ghi trước khi báo "database is locked"
+        'journal_mode': 'WAL',         # người đọc không bị chặn bởi người ghi
+        'synchronous': 'NORMAL',       # an toàn với WAL, chỉ fsync khi checkpoint
+        'cache_size': -64000,          # số âm = KiB: 64MB page cache mỗi kết nối
+        'mmap_size': 268435456,        # 256MB đọc qua memory-map
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON'
+    }
+    # Chu kỳ checkpoint WAL + PRAGMA optimize trong mỗi tiến trình web (giây), 0 = tắt
+    SQLITE_MAINTENANCE_INTERVAL = int(os.environ.get('SQLITE_MAINTENANCE_INTERVAL') or 300)
+    
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, pool_size=5, max_overflow=10)
+    
+    # Bản sao chỉ đọc (app/routing.py): SELECT của request GET/HEAD đọc từ DATABASE_READ_URL.
+    # Cả hai là SQLite: bản sao là file snapshot chụp lại mỗi REPLICA_SNAPSHOT_INTERVAL giây (0 = chỉ
+    # chụp bằng lệnh flask replica refresh). Bản sao khác: sau khi ghi, người dùng đọc từ database
+    # chính trong READ_YOUR_WRITES_SECONDS giây.
+    DATABASE_READ_URL = os.environ.get('DATABASE_READ_URL')
+    SQLALCHEMY_BINDS = {'replica': DATABASE_READ_URL} if DATABASE_READ_URL else {}
+    REPLICA_SNAPSHOT_INTERVAL = int(os.environ.get('REPLICA_SNAPSHOT_INTERVAL') or 30)
+    READ_YOUR_WRITES_SECONDS = int(os.environ.get('READ_YOUR_WRITES_SECONDS') or 10)
+    
+    # Bộ đếm ghi trễ (app/counters.py): lượt tải tài liệu ghi vào nhật ký trong COUNTER_JOURNAL_DIR
+    # (dùng chung giữa các worker), gom vào database mỗi COUNTER_FLUSH_INTERVAL giây (0 = chỉ gom bằng
+    # lệnh flask counters flush) hoặc khi đủ COUNTER_FLUSH_THRESHOLD lượt
+    COUNTER_JOURNAL_DIR = os.environ.get('COUNTER_JOURNAL_DIR') or os.path.join(basedir, 'instance', 'counters')
+    COUNTER_FLUSH_INTERVAL = int(os.environ.get('COUNTER_FLUSH_INTERVAL') or 10)
+    COUNTER_FLUSH_THRESHOLD = int(os.environ.get('COUNTER_FLUSH_THRESHOLD') or 200)
+    
+    # Bản dẫn xuất tài liệu (app/derivatives.py): số trang, văn bản, ảnh thu nhỏ tạo sau khi upload bằng
+    # tác vụ nền derivatives.generate; phần trích xuất chạy trong DERIVATIVE_WORKERS tiến trình con của
+    # tiến trình chạy việc (0 = chạy thẳng trong luồng worker).
+    # PDF cần pypdf hoặc poppler-utils (pdfinfo, pdftotext; pdftoppm cho ảnh thu nhỏ)
+    DERIVATIVE_WORKERS = int(os.environ.get('DERIVATIVE_WORKERS', 1))
+    DERIVATIVE_MAX_ATTEMPTS = 3
+    DERIVATIVE_TEXT_LIMIT = 1024 * 1024    # số ký tự văn bản trích tối đa mỗi file
+    
+    # Tác vụ nền (app/jobs.py): hàng đợi trong bảng jobs. Mỗi tiến trình web chạy JOB_EMBEDDED_WORKERS
+    # luồng worker (0 = chỉ chạy bằng lệnh flask jobs worker); worker không báo nhịp quá JOB_LEASE giây
+    # bị coi là đã chết và việc của nó được chạy lại. File kết quả (VD bảng điểm xuất Excel) ở JOB_OUTPUT_FOLDER
+    JOB_EMBEDDED_WORKERS = int(os.environ.get('JOB_EMBEDDED_WORKERS', 1))
+    JOB_POLL_INTERVAL = 2
+    JOB_LEASE = int(os.environ.get('JOB_LEASE') or 300)
+    JOB_OUTPUT_FOLDER = os.environ.get('JOB_OUTPUT_FOLDER') or os.path.join(basedir, 'instance', 'job-output')
+    JOB_RETENTION_DAYS = 30
 
 
 class DevelopmentConfig(Config):
     """Cấu hình cho môi trường phát triển"""
     DEBUG = True
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '1') == '1'
 
 
 class ProductionConfig(Config):
     """Cấu hình cho môi trường sản xuất"""
     DEBUG = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(Config.SQLALCHEMY_DATABASE_URI, pool_size=10, max_overflow=20,
+                                               pool_timeout=10, pool_recycle=1800)
+
+
+class TestingConfig(Config):
+    """Cấu hình cho kiểm thử và benchmark"""
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    STRICT_LOADING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite://'
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, pool_size=5, max_overflow=20)
+    SQLITE_MAINTENANCE_INTERVAL = 0
+    COUNTER_JOURNAL_DIR = None  # Database trong bộ nhớ: lượt tăng giữ trong tiến trình
+    DERIVATIVE_WORKERS = 0
+    JOB_EMBEDDED_WORKERS = 0
 
 
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }